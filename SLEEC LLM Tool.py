@@ -1,30 +1,199 @@
 import os
+import sys
+import queue
 import glob
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import math
+import random
+import re
+import shutil
+import sqlite3
+import string
+import tempfile
 import threading
 import time
+import weakref
 import subprocess
+import select
+import struct
+import ctypes
+import ctypes.util
+from array import array
+import inspect
+import cProfile
+import pstats
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, CancelledError as FutureCancelledError
+from dataclasses import asdict, dataclass, field
+from types import SimpleNamespace
+try:
+    import resource # Only available on Unix, where it provides the peak memory of the process
+except ImportError:
+    resource = None
+try:
+    import fdr # FDR's Python API, installed with FDR. Only needed when verification_backend is "fdr"
+except ImportError:
+    fdr = None
 import ttkbootstrap as tb
 from ttkbootstrap import ttk
-from tkinter import BooleanVar, StringVar
+from tkinter import BooleanVar, StringVar, Text
+from tkinter import font as tkfont
 from tkinter.scrolledtext import ScrolledText
 import PyPDF2
-from openai import OpenAI
+import openai
+from openai import AsyncOpenAI
+from refines_parser import RefinesAssertion, assertion_kind, format_assertion, format_trace, parse_refines_output
 
 # Set the filepath for refines.exe on Windows. On Linux this is not required as Refines can be called from anywhere.
 refines_exe_path = r"C:\Program Files\FDR\bin\refines.exe"
 
-def load_files():
-    # Pre-loads the files that are expected to be used.
-    sleec_files = glob.glob(os.path.join(os.getcwd(), "*.sleec"))
-    assertions_files = glob.glob(os.path.join(os.getcwd(), "src-gen", "*-assertions.csp"))
-    system_files = glob.glob(os.path.join(os.getcwd(), "*.rct"))
-    verification_file = os.path.join(os.getcwd(), "csp-gen", "timed", "verification_assertions.csp")
+# OpenAI settings. Paste your API key here, or set the OPENAI_API_KEY environment variable. openai_base_url can point the tool at any OpenAI-compatible endpoint, such as a local stand-in server for testing.
+openai_api_key = os.environ.get("OPENAI_API_KEY", "----------------------------REPLACE THIS TEXT WITH YOUR OPENAI API KEY-------------------------------")
+openai_base_url = os.environ.get("OPENAI_BASE_URL")
+
+# Per-assertion analysis: the most requests sent to the LLM at once, and how many times a rate limited or failed request is retried.
+llm_max_concurrency = 8
+llm_max_retries = 5
+
+# LLM backends, each an OpenAI-compatible endpoint. "api" is "chat" (Chat Completions) or "responses" (the Responses API), and "base_url" and "api_key" default to
+# openai_base_url and openai_api_key. "model" replaces the selected model, e.g. for a local server such as Ollama or vLLM, and "token_budget" replaces that model's
+# entry in model_token_budgets, e.g. when the server runs it with a smaller context window. Each backend keeps one client, and so one pool of connections, for as
+# long as the tool runs. Requests time out after llm_timeout seconds (or the backend's "timeout").
+llm_backends = {
+    "openai": {"api": "chat"},
+    "openai-responses": {"api": "responses"},
+    "local": {"api": "chat", "base_url": "http://localhost:11434/v1", "api_key": "local", "model": "llama3.1"},
+}
+llm_backend = "openai"
+llm_timeout = 600
+
+# Hedged requests. When a request has not answered (or, when streaming, not started answering) after llm_hedge_after seconds, the same prompt is also sent to
+# llm_hedge_backend and the first valid answer is used. A request that fails before then goes to llm_hedge_backend straight away. None turns hedging off.
+llm_hedge_backend = None
+llm_hedge_after = 30
+
+# Batch mode (--batch in headless mode). Every prompt is built first and written to batch_requests.jsonl, which is submitted through the backend's Batch API and polled
+# every batch_poll_interval seconds until it completes, within batch_completion_window. Progress is saved to batch_checkpoint.json next to it, so an interrupted run
+# picks up the same batch rather than submitting it again.
+batch_poll_interval = 60
+batch_completion_window = "24h"
+
+# Folder used to cache extracted PDF text between runs, and the maximum size it is allowed to grow to before the least recently used entries are removed.
+cache_dir = os.path.join(os.path.expanduser("~"), ".sleec-llm-cache")
+pdf_cache_max_bytes = 256 * 1024 * 1024
+
+# Included in the PDF cache key. Change this if the way read_pdf extracts text changes so old cached text is not reused.
+pdf_extractor_version = "1-PyPDF2-" + PyPDF2.__version__
+
+# Parallel verification settings. The assertions file is split into shards of refines_shard_size assertions which are checked by up to refines_workers refines processes at once.
+# Every refines process compiles the whole script again, so by default (None) there is one shard per worker, and with a single worker the file is not split at all.
+# A shard that fails or takes longer than refines_shard_timeout seconds is reported as an error for its assertions without affecting the other shards.
+refines_parallel = True
+refines_workers = os.cpu_count() or 1
+refines_shard_size = None
+refines_shard_timeout = 600
+
+# Verification backend. "refines" starts a refines process for every shard, which loads and compiles the script again each time. "fdr" keeps FDR sessions loaded
+# through FDR's Python API and "fdr-worker" keeps them in long-lived worker processes started with fdr_worker_python, for when the fdr module is only installed for
+# another Python. Up to refines_workers sessions stay loaded, each reused for later checks of the same unchanged assertions file. "stand-in" simulates sessions
+# without FDR (see StandInSession) and is only meant for testing.
+verification_backend = "refines"
+fdr_worker_python = sys.executable
+
+# Every refines process takes one of these slots, so concurrent analyses (e.g. several projects in headless mode) share refines_workers processes between them.
+refines_slots = threading.BoundedSemaphore(refines_workers)
+
+# Incremental verification. Results are stored per assertion, keyed by the text of the rules it compares and the declarations those rules use, the lines of the generated
+# CSP (the assertions file's preamble and the files it includes) that do not belong to other rules, and the installed refines. After an edit only the affected
+# assertions are re-checked, and a regenerated script or an FDR upgrade is never answered with old results.
+incremental_verification = True
+verification_store_max_bytes = 64 * 1024 * 1024
+verification_store_version = "3"
+
+# Project watcher. While the GUI is open the project folder is watched (with inotify on Linux, otherwise by polling every watch_poll_interval seconds). Once changes have
+# settled for watch_debounce seconds the file lists are refreshed, edited rulesets are re-parsed and regenerated assertions are verified in the background.
+watch_project = True
+watch_debounce = 1.0
+watch_poll_interval = 2.0
+
+# Static pre-analysis. Obvious redundancies and timing conflicts (rules with the same trigger, condition and response that differ only in polarity or deadline) are
+# spotted from the ruleset, and when refines confirms the failure the reason is added to the prompt next to the counterexample. refines still checks every assertion.
+static_pre_analysis = True
+
+# Prompt supplement budgets, in estimated tokens per model. When the SLEEC and agent specifications together exceed the budget of the model the backend uses they are split into chunks
+# of around supplement_chunk_tokens, and only the chunks most relevant to the failed assertions (ranked with BM25) are included.
+model_token_budgets = {"o3-mini": 40000, "o1": 40000, "o1-mini": 24000, "gpt-4o": 24000, "gpt-4.5-preview": 24000}
+default_token_budget = 24000
+supplement_chunk_tokens = 300
+
+# File viewers. The ruleset and system model panes hold only the lines on screen plus view_buffer_lines either side, so files of any size open instantly.
+# Reports are inserted into the report pane at most report_insert_chars characters per UI tick.
+view_buffer_lines = 200
+report_insert_chars = 20000
+
+# Model-Rule analysis. Each failed assertion from csp-gen/timed/verification_assertions.csp is sent with only the parts of the RoboChart model (.rct) that mention the
+# events and measures of the rules it checks, up to model_slice_tokens estimated tokens per assertion.
+model_slice_tokens = 3000
+
+# Rule-Rule reports are checked against the failed assertions. Sections that are missing, cut off or missing part of their template are requested again (up to
+# report_repair_attempts times) and spliced into the report, and the header is recounted.
+validate_reports = True
+report_repair_attempts = 1
+
+# Suggested fix verification. Each ADD/REMOVE/MODIFY/COMBINE suggestion in a Rule-Rule report is applied to a copy of the ruleset, the copy's assertions are regenerated
+# with sleec_generator_command and only the assertions involving the changed rules are checked, up to refines_workers suggestions at once. In the command, {sleec} is
+# replaced by the copied ruleset and {output} by the folder NAME-assertions.csp (and NAME.csp) should be written to. Without a command the 'Verify suggested fixes'
+# option (--verify-fixes) is disabled, as suggestions that add or rewrite rules could not be checked. Suggestions that only remove rules re-check nothing, so they
+# are never verified. verify_suggestions is the default for the option.
+verify_suggestions = False
+sleec_generator_command = None # e.g. ["java", "-jar", "sleec-generator.jar", "{sleec}", "{output}"]
+sleec_generator_timeout = 300
+
+# LLM response cache. Reports are reused for identical inputs (model, prompt template, ruleset, failed assertions and supplements) for up to response_cache_ttl seconds,
+# and the least recently used reports are removed once there are more than response_cache_max_entries.
+response_cache_ttl = 7 * 24 * 60 * 60
+response_cache_max_entries = 500
+
+# Analysis index, shared by every project. The section written for each failed assertion is also stored under the assertion's canonical form: the two rules, the
+# declarations they use and the compacted counterexample, with rules, events, measures, constants and scale values renamed in order of appearance. A failed assertion
+# in any ruleset that only differs by such a renaming reuses the section with its own names instead of a new LLM request. Reused sections are marked with a confidence,
+# which drops when the stored prose may still use the other ruleset's wording ("medium") or mentions its other rules ("low"). Sections below
+# analysis_reuse_min_confidence are requested as usual. The least recently used entries are removed beyond analysis_index_max_entries.
+analysis_index = True
+analysis_index_max_entries = 5000
+analysis_reuse_min_confidence = "medium"
+
+# Run traces. The stages of every analysis (wall time, CPU time, peak memory and byte/token counts) are appended to run_trace_file as JSON lines,
+# and profiles of runs with 'Profile next run' ticked are saved in profile_dir.
+run_trace_file = os.path.join(cache_dir, "run-traces.jsonl")
+profile_dir = os.path.join(cache_dir, "profiles")
+
+# Prompt templates, loaded once from the .txt files in this folder. Each prompt starts with the same instructions and worked examples so the provider can serve them from
+# its prompt cache, followed by the supplements, the ruleset and lastly the failed assertions.
+prompt_template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Prompt Templates")
+
+# Counterexample traces are compacted before prompting, e.g. 97 repeated tock events become tock×97.
+compact_traces = True
+
+def load_files(base_dir=None):
+    # Pre-loads the files that are expected to be used. Defaults to the current working directory.
+    base_dir = base_dir or os.getcwd()
+    sleec_files = glob.glob(os.path.join(base_dir, "*.sleec"))
+    assertions_files = glob.glob(os.path.join(base_dir, "src-gen", "*-assertions.csp"))
+    system_files = glob.glob(os.path.join(base_dir, "*.rct"))
+    verification_file = os.path.join(base_dir, "csp-gen", "timed", "verification_assertions.csp")
     verification_files = [verification_file] if os.path.exists(verification_file) else []
     return sleec_files, assertions_files, verification_files, system_files
 
-def load_prompt_supplements():
+def load_prompt_supplements(base_dir=None):
     # Loads the prompt supplements from the LLM Resources folder
-    base_dir = os.path.join(os.getcwd(), "LLM Resources")
+    base_dir = os.path.join(base_dir or os.getcwd(), "LLM Resources")
     if not os.path.exists(base_dir):
         return [], []
     sleec_spec_file = os.path.join(base_dir, "SLEEC Spec.pdf")
@@ -39,41 +208,863 @@ def load_prompt_supplements():
             agent_spec_files.append(full_path)
     return sleec_spec_list, agent_spec_files
 
-def read_pdf(file_path): #Uses PyPDF2 to read PDF's into text for the prompt.
+file_digest_memo = {} # path -> ((size, modification time), digest), for the file_digest_memo_max_entries most recently hashed files
+file_digest_memo_max_entries = 256
+file_digest_lock = threading.Lock()
+pdf_locks = weakref.WeakValueDictionary() # A lock is dropped once no thread is using it, so one is not kept for every PDF version ever read
+pdf_locks_guard = threading.Lock()
+
+def file_digest(file_path): # SHA-256 of the file contents. Remembered against size & modification time so unchanged files are not re-hashed.
+    stat = os.stat(file_path)
+    path, version = os.path.abspath(file_path), (stat.st_size, stat.st_mtime_ns)
+    with file_digest_lock:
+        memo = file_digest_memo.get(path)
+    if memo and memo[0] == version:
+        return memo[1]
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+    with file_digest_lock:
+        file_digest_memo.pop(path, None) # Re-inserted last, so the oldest entry is always first
+        while len(file_digest_memo) >= file_digest_memo_max_entries:
+            del file_digest_memo[next(iter(file_digest_memo))]
+        file_digest_memo[path] = (version, digest)
+    return digest
+
+def read_cache_file(cache_path): # Returns the cached text, or None if there is no entry. Reading an entry marks it as recently used.
     try:
-        with open(file_path, "rb") as f:
-            reader = PyPDF2.PdfReader(f)
-            text = ""
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text
+        with open(cache_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        os.utime(cache_path)
+        return text
+    except OSError:
+        return None
+
+def write_cache_file(cache_path, text): # Writes via a temporary file so a half-written entry is never read back. Cache failures are not fatal.
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+        tmp_path = None
+    except (OSError, ValueError): # e.g. text that cannot be encoded
+        pass
+    finally:
+        if tmp_path: # The write or rename failed, so the temporary file would be left behind
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+def prune_cache_dir(directory, max_bytes): # Removes the least recently used entries until the folder fits within max_bytes.
+    try:
+        entries = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def pdf_lock(cache_path): # One lock per cache entry so a background pre-warm and an analysis never extract the same PDF twice.
+    with pdf_locks_guard:
+        lock = pdf_locks.get(cache_path)
+        if lock is None:
+            lock = pdf_locks[cache_path] = threading.Lock()
+        return lock
+
+def extract_pdf_text(file_path): #Uses PyPDF2 to read PDF's into text for the prompt.
+    with open(file_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        pages = []
+        for page in reader.pages:
+            page_text = page.extract_text()
+            if page_text:
+                pages.append(page_text)
+        return "".join(pages)
+
+def read_pdf(file_path): # Returns the PDF text, using the on-disk cache when the same file has already been extracted.
+    try:
+        cache_key = hashlib.sha256((file_digest(file_path) + pdf_extractor_version).encode()).hexdigest()
+        cache_path = os.path.join(cache_dir, "pdf", cache_key + ".txt")
+        with pdf_lock(cache_path):
+            text = read_cache_file(cache_path)
+            if text is None:
+                text = extract_pdf_text(file_path)
+                write_cache_file(cache_path, text)
+                prune_cache_dir(os.path.dirname(cache_path), pdf_cache_max_bytes)
             return text
     except Exception as e:
         return "Error reading PDF file: " + str(e)
 
-def update_dropdowns(): # Populates dropdown boxes with all relevant file options.
+def prewarm_pdf_cache(file_paths): # Extracts the prompt supplements in the background so the first analysis does not wait on PyPDF2.
+    def worker():
+        for file_path in file_paths:
+            if file_path.lower().endswith(".pdf"):
+                read_pdf(file_path)
+    threading.Thread(target=worker, daemon=True).start()
+
+def refines_command(csp_path): # Automatic Windows/Linux detection ensures the correct command is used.
+    if os.name == "nt":
+        env = os.environ.copy()
+        env["LC_ALL"] = "C"
+        return [refines_exe_path, "--quiet", csp_path], os.path.dirname(refines_exe_path), env
+    return ["refines", "--quiet", csp_path], None, None
+
+def format_failed_assertions(records, compact=None): # The verification output given to the LLM: only the failed assertions.
+    compact = compact_traces if compact is None else compact
+    failed = [format_assertion(record, compact) for record in records if record.failed]
+    return "\n\n".join(failed) if failed else "All assertions passed."
+
+def estimate_tokens(text): # Rough token count, at around four characters per token for English text.
+    return (len(text) + 3) // 4
+
+def trace_compaction_savings(records): # Estimated prompt tokens saved by compacting the counterexample traces of the failed assertions.
+    full = estimate_tokens(format_failed_assertions(records, compact=False))
+    return full - estimate_tokens(format_failed_assertions(records, compact=True)), full
+
+def stream_refines(csp_path, timeout=None): # Runs refines over a CSP file, parsing its output straight from the pipe. Raises if refines fails or times out.
+    command, cwd, env = refines_command(csp_path)
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True, encoding="utf-8", errors="replace", cwd=cwd, env=env)
+        timed_out = threading.Event()
+        def expire():
+            timed_out.set()
+            process.kill()
+        timer = threading.Timer(timeout, expire) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            yield from parse_refines_output(process.stdout)
+            process.wait()
+        finally:
+            if timer:
+                timer.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(command, timeout)
+        if process.returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", errors="replace").strip()
+            raise RuntimeError(message or "refines exited with code " + str(process.returncode))
+
+def split_assertions_file(csp_path): # Splits a CSP file into the lines every check needs (includes, definitions) and the individual assert statements.
+    preamble, assertions = [], []
+    in_assert = False
+    with open(csp_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if re.match(r"assert\b", line):
+                assertions.append(line.rstrip("\n"))
+                in_assert = True
+            elif in_assert and line.strip() and line[0] in " \t": # Indented lines continue a multi-line assert
+                assertions[-1] += "\n" + line.rstrip("\n")
+            else:
+                preamble.append(line)
+                in_assert = False
+    return preamble, assertions
+
+def assertion_name(assertion): # The name refines and FDR give an assert statement, e.g. SLEECRule2Rule4 :[deadlock free].
+    return " ".join(assertion[len("assert"):].split())
+
+def error_record(assertion, reason): # Reports an assertion that could not be checked, in the same layout refines uses for results.
+    name = assertion_name(assertion)
+    return RefinesAssertion(name=name, kind=assertion_kind(name), result=f"Error ({reason})", text=f"{name}:\n    Log:\n        Result: Error ({reason})")
+
+def run_refines_shard(csp_path, preamble, shard_assertions): # Checks a subset of the assertions. Shard files sit next to the original so relative includes still resolve.
+    fd, shard_path = tempfile.mkstemp(dir=os.path.dirname(csp_path), prefix=".shard-", suffix=".csp")
+    records = []
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(preamble)
+            f.write("\n" + "\n".join(shard_assertions) + "\n")
+        with refines_slots:
+            records.extend(stream_refines(shard_path, timeout=refines_shard_timeout))
+        return records
+    except Exception as e:
+        if isinstance(e, subprocess.TimeoutExpired):
+            reason = f"refines timed out after {refines_shard_timeout} seconds"
+        else:
+            reason = "Error running refines: " + " ".join(str(e).split())
+        checked = records[:-1] # The last assertion refines reported may have been cut off
+        return checked + [error_record(assertion, reason) for assertion in shard_assertions[len(checked):]]
+    finally:
+        try:
+            os.remove(shard_path)
+        except OSError:
+            pass
+
+def check_assertions(csp_path, preamble, assertions): # Checks the given assertions, split into parallel shards when enabled.
+    if verification_backend != "refines": # Each assertion is checked in a session that already has the file loaded
+        pool = verification_session_pool()
+        return [future.result() for future in [pool.submit(csp_path, assertion) for assertion in assertions]]
+    workers = max(1, refines_workers) if refines_parallel else 1
+    shard_size = max(1, refines_shard_size or math.ceil(len(assertions) / workers)) if workers > 1 else max(1, len(assertions))
+    shards = [assertions[i:i + shard_size] for i in range(0, len(assertions), shard_size)]
+    if len(shards) == 1:
+        return run_refines_shard(csp_path, preamble, shards[0])
+    with ThreadPoolExecutor(max_workers=max(1, min(refines_workers, len(shards)))) as pool: # Each worker waits on its own refines process
+        return [record for records in pool.map(lambda shard: run_refines_shard(csp_path, preamble, shard), shards) for record in records]
+
+def describe_fdr_assertion(fdr, session, assertion): # The result of an assertion checked through FDR's Python API, laid out as refines prints it so parse_refines_output can read it.
+    # Also sent to fdr-worker processes, so it only uses its arguments and re.
+    labels = {"MinAcceptanceBehaviour": "Failure Behaviour", "ExplicitDivergenceBehaviour": "Divergence Behaviour"}
+    name = " ".join(assertion.to_string().split())
+    lines = [name + ":", "    Log:", "        Result: " + ("Passed" if assertion.passed() else "Failed")]
+    for counterexample in assertion.counterexamples():
+        lines.append("        Counterexample (" + re.sub(r"(?<=[a-z])(?=[A-Z])", " ", type(counterexample).__name__) + ")") # e.g. Deadlock Counterexample
+        lines.append("            Machine Debug:")
+        debug_context = fdr.DebugContext(counterexample, False)
+        debug_context.initialise(None)
+        for behaviour in debug_context.root_behaviours():
+            label = labels.get(type(behaviour).__name__, re.sub(r"(?<=[a-z])(?=[A-Z])", " ", type(behaviour).__name__))
+            events = ["-" if event == fdr.INT_MAX else str(session.uncompile_event(event)) for event in behaviour.trace()]
+            lines.append(f"                {name.split()[0]} ({label}):")
+            lines.append("                    Trace: <" + ", ".join(events) + ">")
+            if hasattr(behaviour, "min_acceptance"):
+                lines.append("                    Min Acceptance: {" + ", ".join(str(session.uncompile_event(event)) for event in behaviour.min_acceptance()) + "}")
+    return "\n".join(lines)
+
+fdr_worker_loop = r'''
+fdr.library_init()
+session, assertions = None, {}
+for line in sys.stdin: # One JSON request per line: {"command": "load", "path": ...} or {"command": "check", "name": ...}
+    request = json.loads(line)
+    try:
+        if request["command"] == "load":
+            session = fdr.Session()
+            session.load_file(request["path"])
+            assertions = {" ".join(assertion.to_string().split()): assertion for assertion in session.assertions()}
+            reply = {"ok": True}
+        elif request["name"] not in assertions:
+            reply = {"ok": False, "missing": True, "error": "assertion not found in the loaded script"}
+        else:
+            assertion = assertions[request["name"]]
+            assertion.execute(None)
+            reply = {"ok": True, "text": describe_fdr_assertion(fdr, session, assertion)}
+    except Exception as e:
+        reply = {"ok": False, "error": str(e) or type(e).__name__}
+    print(json.dumps(reply), flush=True)
+'''
+
+fdr_library_lock = threading.Lock()
+fdr_library_ready = False
+
+class FdrSession: # An assertions file loaded through FDR's Python API. FDR keeps what it compiles for the session, so later checks reuse it.
+    def __init__(self, csp_path):
+        global fdr_library_ready
+        if fdr is None:
+            raise RuntimeError("FDR's Python API (the fdr module) is not installed")
+        with fdr_library_lock:
+            if not fdr_library_ready:
+                fdr.library_init()
+                fdr_library_ready = True
+        self.session = fdr.Session()
+        self.session.load_file(csp_path)
+        self.assertions = {" ".join(assertion.to_string().split()): assertion for assertion in self.session.assertions()}
+
+    def check(self, name, timeout=None): # Returns the result in refines' layout. Raises LookupError if the script has no such assertion.
+        if name not in self.assertions:
+            raise LookupError("assertion not found in the loaded script")
+        canceller = fdr.Canceller()
+        timed_out = threading.Event()
+        def expire():
+            timed_out.set()
+            canceller.cancel()
+        timer = threading.Timer(timeout, expire) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            self.assertions[name].execute(canceller)
+        finally:
+            if timer:
+                timer.cancel()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(name, timeout)
+        return describe_fdr_assertion(fdr, self.session, self.assertions[name])
+
+    def close(self):
+        self.session, self.assertions = None, {}
+
+class FdrWorkerSession: # An assertions file loaded in a long-lived Python process running FDR's Python API, talking JSON lines over its stdin and stdout.
+    def __init__(self, csp_path):
+        source = "import json\nimport re\nimport sys\nimport fdr\n\n" + inspect.getsource(describe_fdr_assertion) + fdr_worker_loop
+        self.stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen([fdr_worker_python, "-c", source], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.stderr,
+                                        text=True, encoding="utf-8", errors="replace", cwd=os.path.dirname(os.path.abspath(csp_path)))
+        try:
+            self.request({"command": "load", "path": os.path.abspath(csp_path)}, refines_shard_timeout)
+        except Exception:
+            self.close()
+            raise
+
+    def request(self, message, timeout=None): # Sends one request and waits for its reply. The worker is killed if it takes longer than timeout seconds.
+        timed_out = threading.Event()
+        def expire():
+            timed_out.set()
+            self.process.kill()
+        timer = threading.Timer(timeout, expire) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            self.process.stdin.write(json.dumps(message) + "\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        except OSError:
+            line = ""
+        finally:
+            if timer:
+                timer.cancel()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(fdr_worker_python, timeout)
+        if not line:
+            self.process.wait()
+            self.stderr.seek(0)
+            message = self.stderr.read().decode("utf-8", errors="replace").strip().splitlines()
+            raise RuntimeError(message[-1] if message else "FDR worker exited with code " + str(self.process.returncode))
+        reply = json.loads(line)
+        if reply.get("missing"):
+            raise LookupError(reply["error"])
+        if not reply["ok"]:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def check(self, name, timeout=None):
+        return self.request({"command": "check", "name": name}, timeout)["text"]
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout, self.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+class StandInSession: # Stands in for an FDR session where FDR is not installed, so the session pool can be tested. Loading takes load_seconds and
+    # each check check_seconds. Assertions whose names match the failures pattern fail with a one-step counterexample; every other assertion passes.
+    load_seconds = 0.5
+    check_seconds = 0.01
+    failures = None
+    loads = Counter() # assertions file -> times it was loaded, for checking that sessions are reused
+
+    def __init__(self, csp_path):
+        time.sleep(self.load_seconds)
+        self.names = {assertion_name(assertion) for assertion in split_assertions_file(csp_path)[1]}
+        StandInSession.loads[os.path.abspath(csp_path)] += 1
+
+    def check(self, name, timeout=None):
+        if name not in self.names:
+            raise LookupError("assertion not found in the loaded script")
+        time.sleep(self.check_seconds)
+        failed = bool(self.failures and re.search(self.failures, name))
+        lines = [name + ":", "    Log:", "        Result: " + ("Failed" if failed else "Passed"), "        Backend: stand-in"]
+        if failed:
+            lines += ["        Counterexample (Deadlock Counterexample)", "            Machine Debug:", f"                {name.split()[0]} (Failure Behaviour):",
+                      "                    Trace: <tock>", "                    Min Acceptance: {}"]
+        return "\n".join(lines)
+
+    def close(self):
+        pass
+
+class VerificationSessionPool: # Keeps up to size sessions loaded and checks one assertion at a time in each. A session stays with its assertions file (and that
+    # file's modification time) and is reused by later checks of the same file; when the pool is full, an idle session of another file is closed to make room.
+    def __init__(self, open_session, size, checked_by):
+        self.open_session = open_session
+        self.checked_by = checked_by
+        self.size = size
+        self.idle = {} # (path, modification time) -> idle sessions
+        self.open_count = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="verification-session") # No more checks run at once than there are sessions
+
+    def submit(self, csp_path, assertion): # Queues a check of one assert statement of the file. Returns a Future of its RefinesAssertion. Safe to call from any thread.
+        return self.executor.submit(self.check, csp_path, assertion)
+
+    def acquire(self, key): # An idle session for key, or None when a new one should be opened, and the sessions to close.
+        with self.lock:
+            retired = [session for other, sessions in self.idle.items() if other[0] == key[0] and other != key for session in sessions] # The file has changed since
+            self.idle = {other: sessions for other, sessions in self.idle.items() if other[0] != key[0] or other == key}
+            self.open_count -= len(retired)
+            if self.idle.get(key):
+                return self.idle[key].pop(), retired
+            if self.open_count >= self.size:
+                other = next((other for other, sessions in self.idle.items() if sessions), None)
+                if other is None:
+                    raise RuntimeError("no FDR session available") # Not reached while checks only run on the pool's own workers
+                retired.append(self.idle[other].pop())
+                self.open_count -= 1
+            self.open_count += 1
+            return None, retired
+
+    def release(self, key, session, keep=True):
+        with self.lock:
+            if keep:
+                self.idle.setdefault(key, []).append(session)
+                return
+            self.open_count -= 1
+        if session is not None:
+            session.close()
+
+    def check(self, csp_path, assertion):
+        name = assertion_name(assertion)
+        try:
+            key = (os.path.abspath(csp_path), os.stat(csp_path).st_mtime_ns)
+        except OSError as e:
+            return error_record(assertion, "Error running FDR: " + " ".join(str(e).split()))
+        session, retired = self.acquire(key)
+        for stale in retired:
+            stale.close()
+        try:
+            if session is None:
+                session = self.open_session(csp_path)
+            text = session.check(name, refines_shard_timeout)
+        except LookupError as e:
+            self.release(key, session, keep=session is not None)
+            return error_record(assertion, str(e))
+        except Exception as e: # The session may be left in any state, so it is not reused
+            self.release(key, session, keep=False)
+            if isinstance(e, subprocess.TimeoutExpired):
+                return error_record(assertion, f"FDR timed out after {refines_shard_timeout} seconds")
+            return error_record(assertion, "Error running FDR: " + " ".join(str(e).split()))
+        self.release(key, session)
+        record = next(parse_refines_output(text.splitlines()), None) or error_record(assertion, "FDR returned no result")
+        record.checked_by = self.checked_by
+        return record
+
+    def close(self): # Closes the idle sessions, e.g. before changing verification_backend.
+        with self.lock:
+            sessions = [session for sessions in self.idle.values() for session in sessions]
+            self.open_count -= len(sessions)
+            self.idle = {}
+        for session in sessions:
+            session.close()
+
+session_backends = {"fdr": (FdrSession, "fdr"), "fdr-worker": (FdrWorkerSession, "fdr"), "stand-in": (StandInSession, "stand-in")}
+session_pools = {}
+session_pools_lock = threading.Lock()
+
+def verification_session_pool(): # The shared pool for verification_backend, created on first use.
+    with session_pools_lock:
+        if verification_backend not in session_pools:
+            if verification_backend not in session_backends:
+                raise ValueError(f"Unknown verification_backend {verification_backend!r}; expected refines, " + ", ".join(session_backends))
+            open_session, checked_by = session_backends[verification_backend]
+            session_pools[verification_backend] = VerificationSessionPool(open_session, max(1, refines_workers), checked_by)
+        return session_pools[verification_backend]
+
+@functools.lru_cache(maxsize=16)
+def parse_sleec_sections(text): # Splits a SLEEC ruleset into its declarations (name -> declaration) and rules (name -> rule text).
+    text = re.sub(r"//[^\n]*", "", text)
+    declarations, rules = {}, {}
+    for block in re.findall(r"def_start(.*?)def_end", text, re.S):
+        for line in block.splitlines():
+            match = re.match(r"\s*(?:event|measure|constant)\s+(\w+)", line)
+            if match:
+                declarations[match.group(1)] = " ".join(line.split())
+    for block in re.findall(r"rule_start(.*?)rule_end", text, re.S):
+        name = None
+        for line in block.splitlines():
+            match = re.match(r"\s*(\w+)\s+when\b", line)
+            if match:
+                name = match.group(1)
+                rules[name] = ""
+            if name and line.strip():
+                rules[name] += " " + " ".join(line.split())
+    return declarations, {name: rule.strip() for name, rule in rules.items()}
+
+def assertion_rule_names(assertion, rule_names): # Finds the pair of rules an assertion compares, e.g. SLEECRule2Rule4 or not Rule5_wrt_Rule4.
+    names = []
+    for first, second in re.findall(r"(\w+?)_wrt_(\w+)", assertion):
+        names += [name for name in (first, second) if name not in names]
+    if names:
+        return names if all(name in rule_names for name in names) else None
+    match = re.search(r"\bSLEEC(\w+)", assertion)
+    if match:
+        pair = match.group(1)
+        for i in range(1, len(pair)):
+            if pair[:i] in rule_names and pair[i:] in rule_names:
+                return [pair[:i], pair[i:]]
+    return None
+
+time_units = {"second": 1, "seconds": 1, "minute": 60, "minutes": 60, "hour": 3600, "hours": 3600, "day": 86400, "days": 86400}
+
+@dataclass
+class SleecRule: # The parts of a rule the static pre-analysis looks at, e.g. Rule4 when DetectUserFallen and emergencyLevel<E2 then not CallSupport within 3 minutes.
+    name: str
+    trigger: str
+    condition: str = "" # Trigger condition after "and", normalised
+    response: str = ""
+    negated: bool = False
+    within: float = None # Deadline in seconds, or None if the response has no deadline
+    deadline: str = "" # The deadline as written, e.g. "3 minutes"
+    defeaters: frozenset = frozenset() # Normalised unless clauses
+    otherwise: str = ""
+    events: frozenset = frozenset()
+    measures: frozenset = frozenset()
+
+@functools.lru_cache(maxsize=16)
+def parse_sleec_rules(text): # Parses the rules of a ruleset into SleecRules indexed by name. Rules in a form the pre-analysis does not understand are left out.
+    declarations, rules = parse_sleec_sections(text)
+    kinds = {name: declaration.split()[0] for name, declaration in declarations.items()}
+    constants = {}
+    for name, declaration in declarations.items():
+        match = re.match(r"constant\s+\w+\s*=\s*([\d.]+)", declaration)
+        if kinds[name] == "constant" and match:
+            constants[name] = float(match.group(1))
+    parsed = {}
+    for name, rule in rules.items():
+        match = re.match(r"(\w+)\s+when\s+(\w+)(?:\s+and\s+(.*?))?\s+then\s+(.*)$", rule)
+        if not match:
+            continue
+        clauses = re.split(r"\bunless\b", match.group(4))
+        response = re.match(r"(not\s+)?(\w+)(?:\s+within\s+(\w+(?:\.\d+)?)\s+(\w+))?\s*(?:otherwise\s+(.*))?$", clauses[0].strip())
+        if not response or kinds.get(match.group(2)) != "event" or kinds.get(response.group(2)) != "event":
+            continue
+        within = None
+        if response.group(3):
+            amount = constants.get(response.group(3)) if response.group(3) in constants else float(response.group(3)) if re.match(r"[\d.]+$", response.group(3)) else None
+            if amount is None or response.group(4) not in time_units:
+                continue
+            within = amount * time_units[response.group(4)]
+        words = set(re.findall(r"\w+", rule))
+        parsed[name] = SleecRule(
+            name=name,
+            trigger=match.group(2),
+            condition=" ".join((match.group(3) or "").split()),
+            response=response.group(2),
+            negated=bool(response.group(1)),
+            within=within,
+            deadline=f"{response.group(3)} {response.group(4)}" if response.group(3) else "",
+            defeaters=frozenset(" ".join(clause.split()) for clause in clauses[1:]),
+            otherwise=" ".join((response.group(5) or "").split()),
+            events=frozenset(word for word in words if kinds.get(word) == "event"),
+            measures=frozenset(word for word in words if kinds.get(word) == "measure"),
+        )
+    return parsed
+
+def describe_response(rule):
+    return ("not " if rule.negated else "") + rule.response + (f" within {rule.deadline}" if rule.deadline else "")
+
+def static_verdict(kind, first, second): # Returns (result, reason) when a pair of rules has an obvious issue, otherwise None. Only a hint: refines decides.
+    same_situation = (first.trigger, first.condition, first.response) == (second.trigger, second.condition, second.response) and not first.otherwise and not second.otherwise
+    if not same_situation:
+        return None
+    trigger = first.trigger + (f" when {first.condition}" if first.condition else "")
+    if kind == "conflict" and first.negated != second.negated and not first.defeaters and not second.defeaters:
+        required, forbidden = (second, first) if first.negated else (first, second)
+        if required.within is not None and (forbidden.within is None or required.within <= forbidden.within):
+            return "Failed", f"After {trigger}, {required.name} requires {describe_response(required)} but {forbidden.name} forbids it ({describe_response(forbidden)})."
+    if kind == "redundancy" and first.negated == second.negated and first.defeaters == second.defeaters:
+        # not first_wrt_second [T= second_wrt_first fails when second implies first: a tighter deadline for the response, or a longer ban on it
+        if first.negated:
+            implied = second.within is None or (first.within is not None and second.within >= first.within)
+        else:
+            implied = None not in (first.within, second.within) and second.within <= first.within
+        if implied:
+            return "Failed", f"After {trigger}, {second.name} ({describe_response(second)}) already ensures {first.name} ({describe_response(first)}), so {first.name} is redundant."
+    return None
+
+def static_assertion_hints(sleec_path, csp_path, assertions): # The reason the static pre-analysis expects each assertion to fail, or None.
+    if not static_pre_analysis or not sleec_path:
+        return [None] * len(assertions)
+    try:
+        if os.path.getmtime(sleec_path) > os.path.getmtime(csp_path): # The assertions may refer to rules that have since changed
+            return [None] * len(assertions)
+        with open(sleec_path, "r", encoding="utf-8") as f:
+            rules = parse_sleec_rules(f.read())
+    except OSError:
+        return [None] * len(assertions)
+    hints = []
+    for assertion in assertions:
+        names = assertion_rule_names(assertion, rules)
+        verdict = static_verdict(assertion_kind(" ".join(assertion[len("assert"):].split())), *(rules[rule] for rule in names)) if names and len(names) == 2 else None
+        hints.append(verdict[1] if verdict and verdict[0] == "Failed" else None)
+    return hints
+
+def add_static_hints(records, hints): # Adds each hint to its record when refines found the failure too, so the prompt gets the reason as well as the counterexample.
+    for record, hint in zip(records, hints):
+        if hint and record.failed:
+            record.statistics["Static Analysis"] = hint
+    return records
+
+def ruleset_for_assertions(csp_path): # SLEEC-TK generates src-gen/NAME-assertions.csp from NAME.sleec in the project folder.
+    name = os.path.basename(csp_path)
+    if not name.endswith("-assertions.csp"):
+        return None
+    sleec_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(csp_path))), name[:-len("-assertions.csp")] + ".sleec")
+    return sleec_path if os.path.exists(sleec_path) else None
+
+def refines_version(): # Identifies the installed FDR by its refines executable, which an upgrade replaces. None when refines cannot be found.
+    path = refines_exe_path if os.name == "nt" else shutil.which("refines")
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return [os.path.realpath(path), stat.st_size, stat.st_mtime_ns]
+
+def csp_script_lines(csp_path, lines, seen=None): # The given lines of a CSP file followed, after each include, by the lines of the included file, recursively.
+    seen = set() if seen is None else seen
+    script = []
+    for line in lines:
+        script.append(line)
+        match = re.match(r'\s*include\s+"([^"]+)"', line)
+        if not match:
+            continue
+        path = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(csp_path)), match.group(1)))
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                script += csp_script_lines(path, f.readlines(), seen)
+        except OSError:
+            script.append(f"-- {match.group(1)} not found")
+    return script
+
+def script_lines_by_rules(script, rules): # Groups the lines of a CSP script by the set of rules they mention, e.g. the definition of SLEECRule1Rule2 under {Rule1, Rule2}.
+    groups, token_rules = {}, {}
+    for line in script:
+        line = " ".join(line.split())
+        if not line:
+            continue
+        mentioned = set()
+        for token in re.findall(r"\w+", line):
+            if token not in token_rules:
+                token_rules[token] = [token] if token in rules else assertion_rule_names(token, rules) or []
+            mentioned.update(token_rules[token])
+        groups.setdefault(frozenset(mentioned), []).append(line)
+    return groups
+
+def verification_keys(csp_path, sleec_path, preamble, assertions): # Store key for each assertion, or None where the result cannot safely be reused.
+    # An assertion's script is taken to be every line of the generated CSP that mentions no rule other than the two it compares. Shared declarations are in every key.
+    if not incremental_verification or not sleec_path:
+        return [None] * len(assertions)
+    try:
+        if os.path.getmtime(sleec_path) > os.path.getmtime(csp_path): # The assertions have not been regenerated since the last edit
+            return [None] * len(assertions)
+        with open(sleec_path, "r", encoding="utf-8") as f:
+            declarations, rules = parse_sleec_sections(f.read())
+    except OSError:
+        return [None] * len(assertions)
+    script = script_lines_by_rules(csp_script_lines(csp_path, preamble), rules)
+    version = refines_version() if verification_backend == "refines" else [verification_backend, refines_version()]
+    keys = []
+    for assertion in assertions:
+        names = assertion_rule_names(assertion, rules)
+        if names is None:
+            keys.append(None)
+            continue
+        rule_texts = [rules[name] for name in names]
+        used = set(re.findall(r"\w+", " ".join(rule_texts)))
+        subsets = [frozenset(), *(frozenset([name]) for name in names), frozenset(names)]
+        material = [verification_store_version, version, " ".join(assertion.split()), rule_texts, sorted(declarations[name] for name in used if name in declarations),
+                    [script.get(subset, []) for subset in dict.fromkeys(subsets)]]
+        keys.append(hashlib.sha256(json.dumps(material).encode()).hexdigest())
+    return keys
+
+def verify_assertions(csp_path, sleec_path=None): # Returns a RefinesAssertion for every assertion in the file. Assertions replayed from the store are not
+    # checked again, and only the rest go to refines.
+    preamble, assertions = split_assertions_file(csp_path)
+    hints = static_assertion_hints(sleec_path, csp_path, assertions)
+    if verification_backend == "refines" and (not assertions or (not refines_parallel and not incremental_verification)):
+        with refines_slots:
+            return add_static_hints(list(stream_refines(csp_path)), hints)
+    store_dir = os.path.join(cache_dir, "verification")
+    keys = verification_keys(csp_path, sleec_path, preamble, assertions)
+    records = [None] * len(assertions)
+    for i, key in enumerate(keys):
+        text = read_cache_file(os.path.join(store_dir, key + ".txt")) if key else None
+        if text:
+            records[i] = next(parse_refines_output(text.splitlines()), None)
+    pending = [i for i, record in enumerate(records) if record is None]
+    if not pending:
+        return add_static_hints(records, hints)
+    new_records = check_assertions(csp_path, preamble, [assertions[i] for i in pending])
+    if len(new_records) != len(pending): # Results cannot be matched up to their assertions, so nothing is stored
+        return [record for record in records if record is not None] + new_records
+    for i, record in zip(pending, new_records):
+        records[i] = record
+        if keys[i] and not record.result.startswith("Error") and record.checked_by != "stand-in": # Stand-in results are never mistaken for real ones later
+            write_cache_file(os.path.join(store_dir, keys[i] + ".txt"), record.text)
+    prune_cache_dir(store_dir, verification_store_max_bytes)
+    return add_static_hints(records, hints)
+
+speculative_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative-verification") # Background verifications run one at a time, so they never take more than one analysis' share of refines_slots
+speculative_verifications = {} # assertions file -> Future of the latest background verification
+speculative_lock = threading.Lock()
+
+def speculative_verify(csp_path, sleec_path): # Verifies a regenerated assertions file in the background so its results are in the verification store before Analyse is clicked.
+    if not incremental_verification: # Without the store the results could not be reused
+        return
+    with speculative_lock:
+        speculative_verifications[os.path.abspath(csp_path)] = speculative_pool.submit(verify_assertions, csp_path, sleec_path)
+
+def wait_for_speculative_verification(csp_path): # Lets an analysis replay a background verification of the same file rather than running its assertions a second time.
+    with speculative_lock:
+        running = speculative_verifications.get(os.path.abspath(csp_path))
+    if running:
+        try:
+            running.result()
+        except Exception:
+            pass
+
+def is_project_file(base_dir, path): # Whether a change to path can affect an analysis. Hidden files, such as the shard files written during verification, are ignored.
+    name = os.path.basename(path)
+    if name.startswith("."):
+        return False
+    relative = os.path.relpath(path, base_dir)
+    return name.endswith((".sleec", ".rct", "-assertions.csp")) or relative == os.path.join("csp-gen", "timed", "verification_assertions.csp") or relative.startswith("LLM Resources" + os.sep)
+
+def watched_directories(base_dir):
+    return [os.path.join(base_dir, *parts) for parts in ((), ("src-gen",), ("csp-gen",), ("csp-gen", "timed"), ("LLM Resources",))]
+
+def inotify_events(base_dir, stop): # Yields each changed path as inotify reports it, and None every quarter second. Raises OSError where inotify is not available.
+    if not sys.platform.startswith("linux"):
+        raise OSError("inotify is only available on Linux")
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    mask = 0x8 | 0x40 | 0x80 | 0x100 | 0x200 # IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE
+    watches = {}
+    def add_watches(): # Directories such as src-gen may only appear once SLEEC-TK first generates them
+        for directory in watched_directories(base_dir):
+            if os.path.isdir(directory) and directory not in watches.values():
+                descriptor = libc.inotify_add_watch(fd, os.fsencode(directory), mask)
+                if descriptor >= 0:
+                    watches[descriptor] = directory
+    def events():
+        try:
+            add_watches()
+            while not stop.is_set():
+                if not select.select([fd], [], [], 0.25)[0]:
+                    yield None
+                    continue
+                data = os.read(fd, 65536)
+                offset = 0
+                while offset + 16 <= len(data):
+                    descriptor, event_mask, _, length = struct.unpack_from("iIII", data, offset)
+                    name = data[offset + 16:offset + 16 + length].rstrip(b"\0").decode("utf-8", "replace")
+                    offset += 16 + length
+                    if event_mask & 0x40000000: # IN_ISDIR
+                        add_watches()
+                    elif descriptor in watches:
+                        yield os.path.join(watches[descriptor], name)
+        finally:
+            os.close(fd)
+    return events()
+
+def polling_events(base_dir, stop): # Fallback for inotify_events: compares the modification times and sizes of the project files every watch_poll_interval seconds.
+    def snapshot():
+        files = {}
+        for directory in watched_directories(base_dir):
+            for path in glob.glob(os.path.join(directory, "*")):
+                if is_project_file(base_dir, path):
+                    try:
+                        info = os.stat(path)
+                        files[path] = (info.st_mtime_ns, info.st_size)
+                    except OSError:
+                        pass
+        return files
+    previous = snapshot()
+    while not stop.wait(watch_poll_interval):
+        current = snapshot()
+        for path in set(previous) | set(current):
+            if previous.get(path) != current.get(path):
+                yield path
+        previous = current
+        yield None
+
+def watch_project_folder(base_dir, on_change, stop): # Calls on_change with the changed project files once no further change has been seen for watch_debounce seconds.
+    try:
+        events = inotify_events(base_dir, stop)
+    except OSError:
+        events = polling_events(base_dir, stop)
+    pending, last_change = set(), 0
+    for path in events:
+        if path and is_project_file(base_dir, path):
+            pending.add(os.path.abspath(path))
+            last_change = time.monotonic()
+        if pending and time.monotonic() - last_change >= watch_debounce:
+            try:
+                on_change(pending)
+            except Exception:
+                pass
+            pending = set()
+
+def refresh_project(base_dir, changed): # Runs on the watcher thread after a burst of changes. Widgets are only touched through ui_call.
+    ui_call(update_dropdowns)
+    sleec_files, assertions_files, _, _ = load_files(base_dir)
+    for sleec_path in sleec_files:
+        if os.path.abspath(sleec_path) in changed:
+            try:
+                with open(sleec_path, "r", encoding="utf-8") as f:
+                    parse_sleec_rules(f.read()) # Parsed results are cached for the next analysis
+            except OSError:
+                pass
+    for csp_path in assertions_files:
+        sleec_path = ruleset_for_assertions(csp_path)
+        if os.path.abspath(csp_path) in changed or (sleec_path and os.path.abspath(sleec_path) in changed):
+            try:
+                regenerated = sleec_path is not None and os.path.getmtime(csp_path) >= os.path.getmtime(sleec_path)
+            except OSError:
+                regenerated = False
+            if regenerated: # An edited ruleset is only verified once SLEEC-TK has regenerated its assertions
+                speculative_verify(csp_path, sleec_path)
+
+def start_project_watcher(base_dir=None): # Watches the project on a daemon thread. Returns the event that stops it.
+    base_dir = os.path.abspath(base_dir or os.getcwd())
+    stop = threading.Event()
+    threading.Thread(target=watch_project_folder, args=(base_dir, lambda changed: refresh_project(base_dir, changed), stop), daemon=True).start()
+    return stop
+
+def selection_index(selector, names, default=0): # Keeps the current selection when the file is still there after a refresh.
+    current = selector.get()
+    return names.index(current) if current in names else default
+
+def update_dropdowns(): # Populates dropdown boxes with all relevant file options. Also called by the project watcher, so existing selections are kept where possible.
     global sleec_files, assertions_files, verification_files, system_files
     sleec_files, assertions_files, verification_files, system_files = load_files()
-    sleec_selector["values"] = [os.path.basename(f) for f in sleec_files]
-    assertions_selector["values"] = [os.path.basename(f) for f in assertions_files]
-    verification_selector["values"] = [os.path.basename(f) for f in verification_files]
-    system_selector["values"] = [os.path.basename(f) for f in system_files]
+    sleec_names = [os.path.basename(f) for f in sleec_files]
+    assertions_names = [os.path.basename(f) for f in assertions_files]
+    verification_names = [os.path.basename(f) for f in verification_files]
+    system_names = [os.path.basename(f) for f in system_files]
+    sleec_index = selection_index(sleec_selector, sleec_names)
+    assertions_index = selection_index(assertions_selector, assertions_names)
+    verification_index = selection_index(verification_selector, verification_names)
+    system_index = selection_index(system_selector, system_names, system_names.index("system.rct") if "system.rct" in system_names else 0)
+    sleec_selector["values"] = sleec_names
+    assertions_selector["values"] = assertions_names
+    verification_selector["values"] = verification_names
+    system_selector["values"] = system_names
     if sleec_files:
-        sleec_selector.current(0)
+        sleec_selector.current(sleec_index)
         read_sleec_file()
     if assertions_files:
-        assertions_selector.current(0)
+        assertions_selector.current(assertions_index)
         select_assertions_file()
     if verification_files:
-        verification_selector.current(0)
+        verification_selector.current(verification_index)
         select_verification_file()
     if system_files:
-        system_names = [os.path.basename(f) for f in system_files]
-        if "system.rct" in system_names:
-            system_selector.current(system_names.index("system.rct"))
-        else:
-            system_selector.current(0)
+        system_selector.current(system_index)
         read_system_file()
     update_prompt_supplements_section()
 
@@ -99,30 +1090,115 @@ def update_prompt_supplements_section(): #Updates the prompt supplements dropdow
         prompt_agent_entry.delete(0, "end")
         prompt_agent_entry.insert(0, "")
         prompt_agent_entry.config(state="readonly")
+    prewarm_pdf_cache(prompt_sleec_files + prompt_agent_files)
+
+class LazyFileView: # Read-only view of a text file. Its lines are indexed on a worker thread, and only the visible window of lines is read and rendered.
+    # The file is not kept open between reads, so it can be saved, truncated or replaced while it is shown. A change is noticed on the next render and re-indexed.
+    def __init__(self, parent, height=10, width=50):
+        self.frame = ttk.Frame(parent)
+        self.text = Text(self.frame, wrap="word", height=height, width=width, state="disabled")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.text.pack(side="left", fill="both", expand=True)
+        self.text.bind("<MouseWheel>", lambda event: self.scroll_lines(-3 if event.delta > 0 else 3))
+        self.text.bind("<Button-4>", lambda event: self.scroll_lines(-3)) # Mouse wheel on X11
+        self.text.bind("<Button-5>", lambda event: self.scroll_lines(3))
+        self.text.bind("<Configure>", lambda event: self.render())
+        self.path, self.starts, self.size, self.stamp, self.first, self.generation = None, None, 0, None, 0, 0
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def open(self, path): # Returns straight away. Switching files again before indexing finishes discards the older result.
+        self.generation += 1
+        self.show_message("Loading " + os.path.basename(path) + "...")
+        threading.Thread(target=self.index_file, args=(path, self.generation), daemon=True).start()
+
+    def index_file(self, path, generation): # Runs on a worker thread. Reads the file in blocks, noting the byte offset of the start of each line.
+        try:
+            with open(path, "rb") as f:
+                info = os.fstat(f.fileno())
+                starts, size = array("q", [0]), 0
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    position = block.find(b"\n")
+                    while position != -1:
+                        starts.append(size + position + 1)
+                        position = block.find(b"\n", position + 1)
+                    size += len(block)
+            if len(starts) > 1 and starts[-1] == size: # No empty last line after a trailing newline
+                starts.pop()
+            ui_call(self.loaded, generation, path, starts, size, (info.st_size, info.st_mtime_ns))
+        except OSError as e:
+            ui_call(self.loaded, generation, path, None, 0, None, "Error reading file: " + str(e))
+
+    def loaded(self, generation, path, starts, size, stamp, error=None):
+        if generation != self.generation:
+            return
+        if path != self.path: # A re-indexed file keeps its scroll position
+            self.first = 0
+        self.path, self.starts, self.size, self.stamp = path, starts, size, stamp
+        if error:
+            self.show_message(error)
+        else:
+            self.render()
+
+    def show_message(self, message):
+        self.text.config(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("end", message)
+        self.text.config(state="disabled")
+
+    def visible_lines(self):
+        line_height = tkfont.Font(font=self.text.cget("font")).metrics("linespace") or 1
+        return max(1, self.text.winfo_height() // line_height)
+
+    def render(self): # Replaces the text with the lines from self.first onwards that fill the view, plus a buffer for wrapped lines.
+        if self.starts is None:
+            return
+        total = len(self.starts)
+        visible = self.visible_lines()
+        self.first = max(0, min(self.first, total - visible))
+        last = min(total, self.first + visible + view_buffer_lines)
+        start, end = self.starts[self.first], self.starts[last] if last < total else self.size
+        try:
+            with open(self.path, "rb") as f:
+                info = os.fstat(f.fileno())
+                if (info.st_size, info.st_mtime_ns) != self.stamp: # Changed since it was indexed, so the line offsets no longer fit
+                    self.starts = None
+                    self.open(self.path)
+                    return
+                f.seek(start)
+                content = f.read(end - start).decode("utf-8", "replace")
+        except OSError as e:
+            self.starts = None
+            self.show_message("Error reading file: " + str(e))
+            return
+        self.show_message(content)
+        self.scrollbar.set(self.first / total, min(1.0, (self.first + visible) / total))
+
+    def scroll_lines(self, lines):
+        self.first += lines
+        self.render()
+        return "break" # Stops the Text widget scrolling its own contents as well
+
+    def on_scroll(self, action, amount, unit=None): # Scrollbar command: ("moveto", fraction) or ("scroll", n, "units"/"pages").
+        if self.starts is None:
+            return
+        if action == "moveto":
+            self.first = int(float(amount) * len(self.starts))
+            self.render()
+        else:
+            self.scroll_lines(int(amount) * (self.visible_lines() if unit == "pages" else 1))
 
 def read_sleec_file():
     selected_index = sleec_selector.current()
     if selected_index != -1:
-        selected_file = sleec_files[selected_index]
-        try:
-            with open(selected_file, "r", encoding="utf-8") as f:
-                content = f.read()
-        except Exception as e:
-            content = "Error reading file: " + str(e)
-        sleec_textbox.delete("1.0", "end")
-        sleec_textbox.insert("end", content)
+        sleec_textbox.open(sleec_files[selected_index])
 
 def read_system_file():
     selected_index = system_selector.current()
     if selected_index != -1:
-        selected_file = system_files[selected_index]
-        try:
-            with open(selected_file, "r", encoding="utf-8") as f:
-                content = f.read()
-        except Exception as e:
-            content = "Error reading file: " + str(e)
-        system_textbox.delete("1.0", "end")
-        system_textbox.insert("end", content)
+        system_textbox.open(system_files[selected_index])
 
 def select_assertions_file():
     selected_index = assertions_selector.current()
@@ -176,401 +1252,1904 @@ def update_analysis_text():
     else:
         analysis_text.set("Select an analysis option")
 
-def build_prompt():
-    spinner.start()
-    status_var.set("Building Prompt...")
-
-    # Currently only set to process rule-rule errors, model-rule errors will have to be implemented later.
-    if rule_rule_var.get() and not model_rule_var.get():
-        # Get SLEEC Spec text from PDF
-        sleec_spec_text = ""
-        if prompt_sleec_files:
-            sleec_spec_text = read_pdf(prompt_sleec_files[0])
-        
-        # Get SLEEC ruleset from selected SLEEC file
-        sleec_ruleset = ""
-        s_index = sleec_selector.current()
-        if s_index != -1:
+def search_terms(text): # Lower-case words used for relevance scoring. camelCase identifiers such as CallSupport also contribute their parts (call, support).
+    terms = []
+    for word in re.findall(r"[A-Za-z0-9_]+", text):
+        terms.append(word.lower())
+        parts = re.findall(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+", word)
+        if len(parts) > 1:
+            terms += [part.lower() for part in parts]
+    return terms
+
+@functools.lru_cache(maxsize=8)
+def supplement_chunks(text): # Splits supplement text along line boundaries into chunks of around supplement_chunk_tokens, with the term counts of each chunk.
+    chunks, current, size = [], [], 0
+    for line in text.splitlines(keepends=True):
+        current.append(line)
+        size += estimate_tokens(line)
+        if size >= supplement_chunk_tokens:
+            chunks.append("".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("".join(current))
+    return [(chunk, Counter(search_terms(chunk))) for chunk in chunks]
+
+def bm25_weight(frequency, length, average_length, document_frequency, documents, k1=1.5, b=0.75): # Okapi BM25 contribution of one query term to one document.
+    idf = math.log(1 + (documents - document_frequency + 0.5) / (document_frequency + 0.5))
+    return idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+
+def bm25_scores(term_counts, query): # Okapi BM25 score of each chunk (given as term Counters) against the query terms.
+    if not term_counts:
+        return []
+    lengths = [sum(counts.values()) for counts in term_counts]
+    average_length = sum(lengths) / len(lengths) or 1
+    document_frequency = Counter()
+    for counts in term_counts:
+        document_frequency.update(counts.keys())
+    scores = []
+    for counts, length in zip(term_counts, lengths):
+        score = 0.0
+        for term in set(query):
+            if counts.get(term):
+                score += bm25_weight(counts[term], length, average_length, document_frequency[term], len(term_counts))
+        scores.append(score)
+    return scores
+
+def relevance_query(sleec_ruleset, records): # Terms describing the failed assertions: their names, the rules they compare, the declarations those rules use and the trace events.
+    declarations, rules = parse_sleec_sections(sleec_ruleset)
+    text = []
+    for record in records:
+        if not record.failed:
+            continue
+        text.append(record.name)
+        for name in assertion_rule_names(record.name, rules) or []:
+            text.append(rules[name])
+            text += [declarations[word] for word in re.findall(r"\w+", rules[name]) if word in declarations]
+        for counterexample in record.counterexamples:
+            for trace in counterexample.traces:
+                text += trace.events
+    return search_terms(" ".join(text))
+
+def fit_supplements_to_budget(documents, query, budget): # Keeps the most relevant chunks of the supplements that fit within budget tokens, in their original order. Returns the texts and whether any were trimmed.
+    if sum(estimate_tokens(document) for document in documents) <= budget:
+        return documents, False
+    chunks = [(d, c, text, counts) for d, document in enumerate(documents) for c, (text, counts) in enumerate(supplement_chunks(document))]
+    scores = bm25_scores([counts for _, _, _, counts in chunks], query)
+    chosen, used = set(), 0
+    for i in sorted(range(len(chunks)), key=lambda i: (-scores[i], i)):
+        cost = estimate_tokens(chunks[i][2])
+        if used + cost <= budget:
+            chosen.add(i)
+            used += cost
+    trimmed = [[] for _ in documents]
+    for i, (d, c, text, _) in enumerate(chunks):
+        if i in chosen:
+            trimmed[d].append(text)
+        elif not trimmed[d] or trimmed[d][-1] != "\n[...]\n": # Mark where sections have been left out
+            trimmed[d].append("\n[...]\n")
+    return ["".join(parts) for parts in trimmed], True
+
+rct_element_pattern = re.compile(r"\b(robotic\s+platform|stm|controller|module|interface|state|transition|operation|function)\s+(\w+)\s*(?:\([^)]*\)\s*)?\{")
+
+@dataclass
+class ModelElement: # A state, transition, operation etc. of a RoboChart model, with the text of any nested elements left out.
+    kind: str
+    name: str
+    path: str # e.g. "stm Ctrl > state Calling"
+    text: str = ""
+    terms: Counter = field(default_factory=Counter)
+
+@dataclass
+class ModelIndex: # Index from the terms used in a RoboChart model to the elements that mention them.
+    elements: list
+    postings: dict # term -> indices of the elements that mention it
+    document_frequency: Counter
+    average_length: float
+
+def rct_elements(model_text): # Splits a .rct model into its elements. Comments are blanked out first so braces inside them are ignored.
+    code = re.sub(r"//[^\n]*|/\*.*?\*/", lambda match: re.sub(r"[^\n]", " ", match.group()), model_text, flags=re.S)
+    spans = []
+    for match in rct_element_pattern.finditer(code):
+        depth, end = 0, len(code)
+        for i in range(match.end() - 1, len(code)):
+            if code[i] == "{":
+                depth += 1
+            elif code[i] == "}":
+                depth -= 1
+                if depth == 0:
+                    end = i + 1
+                    break
+        spans.append((match.start(), end, " ".join(match.group(1).split()), match.group(2)))
+    elements, children, stack = [], {}, [] # stack holds the indices of the elements enclosing the current one
+    for i, (start, end, kind, name) in enumerate(spans):
+        while stack and spans[stack[-1]][1] <= start:
+            stack.pop()
+        parent = stack[-1] if stack else None
+        children.setdefault(parent, []).append(i)
+        path = (elements[parent].path + " > " if parent is not None else "") + f"{kind} {name}"
+        elements.append(ModelElement(kind=kind, name=name, path=path))
+        stack.append(i)
+    for i, (start, end, kind, name) in enumerate(spans):
+        parts, position = [], start
+        for child in children.get(i, []):
+            parts.append(model_text[position:spans[child][0]] + f"{spans[child][2]} {spans[child][3]} {{ ... }}")
+            position = spans[child][1]
+        parts.append(model_text[position:end])
+        elements[i].text = "".join(parts).strip()
+        elements[i].terms = Counter(search_terms(elements[i].text))
+    return elements
+
+@functools.lru_cache(maxsize=4)
+def model_index(model_text): # Built once per model, so each failed assertion only scores the elements that share a term with it.
+    elements = rct_elements(model_text)
+    postings, document_frequency = {}, Counter()
+    for i, element in enumerate(elements):
+        document_frequency.update(element.terms.keys())
+        for term in element.terms:
+            postings.setdefault(term, []).append(i)
+    average_length = sum(sum(element.terms.values()) for element in elements) / len(elements) if elements else 1
+    return ModelIndex(elements=elements, postings=postings, document_frequency=document_frequency, average_length=average_length or 1)
+
+def model_slice(index, query, budget): # The elements most relevant to the query terms that fit within budget tokens, in model order, each headed by where it sits in the model.
+    scores = Counter()
+    for term in set(query):
+        for i in index.postings.get(term, []):
+            element = index.elements[i]
+            scores[i] += bm25_weight(element.terms[term], sum(element.terms.values()), index.average_length, index.document_frequency[term], len(index.elements))
+    chosen, used = {}, 0
+    for i, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0])):
+        section = f"// {index.elements[i].path}\n{index.elements[i].text}"
+        if used + estimate_tokens(section) <= budget:
+            chosen[i] = section
+            used += estimate_tokens(section)
+    return "\n\n".join(chosen[i] for i in sorted(chosen))
+
+def model_rule_query(sleec_ruleset, record): # Terms for the model slice of a failed assertion: the events and measures of the rules it checks, and the events in its counterexamples.
+    declarations, rules = parse_sleec_sections(sleec_ruleset)
+    names = [name for name in rules if re.search(r"(?<![a-z])" + re.escape(name) + r"(?![0-9])", record.name)] # Rule names can be embedded, e.g. SLEECRule2_System
+    words = set()
+    for name in names:
+        words.update(word for word in re.findall(r"\w+", rules[name]) if word in declarations and not declarations[word].startswith("constant"))
+    for counterexample in record.counterexamples:
+        for trace in counterexample.traces:
+            words.update(part for event in trace.events for part in re.findall(r"\w+", event) if part != "tock")
+    return names, search_terms(" ".join(sorted(words)))
+
+@dataclass(frozen=True)
+class PromptTemplate: # One file from prompt_template_dir. Placeholders are written $name, so the braces in the report templates need no escaping.
+    name: str
+    text: str
+    version: str # Hash of the text, so a changed template gets a new prompt_template_version
+
+    def render(self, **values):
+        return string.Template(self.text).substitute(values).rstrip("\n")
+
+@functools.lru_cache(maxsize=1)
+def prompt_templates(): # Loads every template once, keyed by file name without .txt, e.g. "Rule-Rule Instructions".
+    templates = {}
+    for path in sorted(glob.glob(os.path.join(prompt_template_dir, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        templates[name] = PromptTemplate(name=name, text=text, version=hashlib.sha256(text.encode("utf-8")).hexdigest()[:12])
+    return templates
+
+def prompt_template(name):
+    templates = prompt_templates()
+    if name not in templates:
+        raise FileNotFoundError(f"Prompt template '{name}.txt' not found in {prompt_template_dir}")
+    return templates[name]
+
+def compacted_trace_notation(compact): # Explains the compacted trace notation to the LLM when traces are compacted.
+    return prompt_template("Compacted Traces").render() + "\n\n" if compact else ""
+
+@functools.lru_cache(maxsize=4)
+def prompt_instructions(name, compact): # The static start of a prompt: instructions, templates and worked examples. Rendered once, so every request starts with the same text.
+    example_trace = format_trace(["DetectUserFallen", "τ", "personAssent.true", "emergencyLevel.E1", "emergencyLevel.E1", "τ"] + ["tock"] * 99 + ["τ"], compact)
+    return prompt_template(name).render(trace_notation=compacted_trace_notation(compact), example_trace=example_trace)
+
+def assemble_prompt(instructions, sleec_spec_text, agent_text, sleec_ruleset, task): # Static instructions first, then the supplements and ruleset, with the part that changes
+    # between requests last. Providers cache prompts by prefix, so requests of the same analysis reuse everything before the task.
+    context = prompt_template("Project Context").render(sleec_spec_text=sleec_spec_text, agent_text=agent_text, sleec_ruleset=sleec_ruleset)
+    return "\n\n".join([prompt_instructions(instructions, compact_traces), context, task])
+
+def build_rule_rule_prompt(sleec_spec_text, sleec_ruleset, assertions_output, agent_text): # Asks for the full report covering every failed assertion in one response.
+    task = prompt_template("Rule-Rule Report").render(assertions_output=assertions_output)
+    return assemble_prompt("Rule-Rule Instructions", sleec_spec_text, agent_text, sleec_ruleset, task)
+
+def build_single_assertion_prompt(sleec_spec_text, sleec_ruleset, failed_assertion, title, agent_text): # Asks for the template of a single failed assertion. Used when each failed assertion is analysed separately.
+    task = prompt_template("Rule-Rule Single Assertion").render(failed_assertion=failed_assertion, title=title)
+    return assemble_prompt("Rule-Rule Instructions", sleec_spec_text, agent_text, sleec_ruleset, task)
+
+def build_model_rule_prompt(sleec_spec_text, sleec_ruleset, failed_assertion, model_slice, title, agent_text): # Asks for the template of one assertion the system model failed, with only the relevant part of the model.
+    task = prompt_template("Model-Rule Assertion").render(failed_assertion=failed_assertion, model_slice=model_slice or "No system model was provided.", title=title)
+    return assemble_prompt("Model-Rule Instructions", sleec_spec_text, agent_text, sleec_ruleset, task)
+
+def failed_assertions(records): # Every failed assertion with its report title, conflicts first then redundancies.
+    failed = [("Redundant Rules" if record.kind == "redundancy" else "Conflicting Rule", record) for record in records if record.failed]
+    return sorted(failed, key=lambda item: item[0] != "Conflicting Rule")
+
+def retry_delay(error, attempt): # Honours the retry-after headers sent with rate limit errors, otherwise backs off exponentially with jitter.
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return min(60, 2 ** attempt) + random.random()
+
+def add_usage(totals, usage): # Adds the token counts of one response to totals, including the prompt tokens the provider served from its prompt cache.
+    if usage is None:
+        return totals
+    if isinstance(usage, dict): # e.g. read from a batch output file
+        usage = json.loads(json.dumps(usage), object_hook=lambda values: SimpleNamespace(**values))
+    if hasattr(usage, "input_tokens"): # The Responses API names the counts differently
+        prompt_tokens, completion_tokens, details = usage.input_tokens, usage.output_tokens, getattr(usage, "input_tokens_details", None)
+    else:
+        prompt_tokens, completion_tokens, details = usage.prompt_tokens, usage.completion_tokens, getattr(usage, "prompt_tokens_details", None)
+    totals["prompt_tokens"] += prompt_tokens or 0
+    totals["cached_tokens"] += getattr(details, "cached_tokens", None) or 0
+    totals["completion_tokens"] += completion_tokens or 0
+    return totals
+
+def prompt_cache_note(totals): # e.g. "Prompt cache: 61,204 of 68,950 prompt tokens cached (89%)."
+    if not totals.get("prompt_tokens"):
+        return None
+    return f"Prompt cache: {totals['cached_tokens']:,} of {totals['prompt_tokens']:,} prompt tokens cached ({totals['cached_tokens'] / totals['prompt_tokens']:.0%})."
+
+llm_loop = None
+llm_loop_lock = threading.Lock()
+llm_clients = {} # (backend, base_url, api_key, timeout) -> AsyncOpenAI. Only used on the LLM loop.
+
+def llm_event_loop(): # The LLM event loop, started on first use. The loop lives as long as the tool, so the backends' clients keep their connections between analyses.
+    global llm_loop
+    with llm_loop_lock:
+        if llm_loop is None:
+            llm_loop = asyncio.new_event_loop()
+            threading.Thread(target=llm_loop.run_forever, name="llm-loop", daemon=True).start()
+    return llm_loop
+
+def run_llm(coroutine): # Runs a coroutine on the LLM event loop.
+    try:
+        return asyncio.run_coroutine_threadsafe(coroutine, llm_event_loop()).result()
+    except FutureCancelledError: # Raised here in place of the coroutine's own CancelledError
+        raise asyncio.CancelledError()
+
+def backend_settings(name): # The settings of an LLM backend, with the OpenAI endpoint and key filled in where the backend does not set its own.
+    if name not in llm_backends:
+        raise ValueError(f"Unknown LLM backend {name!r}; expected one of " + ", ".join(llm_backends))
+    return {"api": "chat", "base_url": openai_base_url, "api_key": openai_api_key, "timeout": llm_timeout, "model": None, "token_budget": None, **llm_backends[name]}
+
+def backend_model(name, model): # The model a backend is asked for: the backend's own model if it names one, otherwise the selected model.
+    return backend_settings(name)["model"] or model
+
+def token_budget(name, model): # The supplement budget for the model a backend is actually asked for, which is not the selected model when the backend names its own.
+    return backend_settings(name)["token_budget"] or model_token_budgets.get(backend_model(name, model), default_token_budget)
+
+def llm_client(name, settings): # One client per backend, created on the LLM loop and then reused.
+    key = (name, settings["base_url"], settings["api_key"], settings["timeout"])
+    if key not in llm_clients:
+        llm_clients[key] = AsyncOpenAI(api_key=settings["api_key"], base_url=settings["base_url"], timeout=settings["timeout"], max_retries=0)
+    return llm_clients[key]
+
+def llm_error(name, error):
+    return f"Error calling LLM backend '{name}': {error}"
+
+async def until_cancelled(coroutine, cancel): # Runs a request as a task and cancels the task as soon as cancel is set, even before the first token (e.g. while an
+    # o1/o3 model is still reasoning). The request sees the cancellation as asyncio.CancelledError.
+    task = asyncio.ensure_future(coroutine)
+    await asyncio.sleep(0) # Lets the request start, so even an immediate cancellation reaches it inside its own handler
+    try:
+        while cancel is not None and not task.done():
+            if cancel.is_set():
+                task.cancel()
+            await asyncio.wait({task}, timeout=0.1)
+        return await task
+    finally:
+        task.cancel() # No effect once it has finished, but stops the request if the caller is cancelled
+
+async def chat_request(client, model, prompt, on_text, cancel): # Chat Completions request, streamed to on_text when given. Returns the text, whether it was cancelled and the token usage.
+    messages = [{"role": "user", "content": prompt}]
+    parts, usage, stream = [], None, None
+    try:
+        if on_text is None:
+            completion = await client.chat.completions.create(model=model, messages=messages)
+            return completion.choices[0].message.content or "", False, completion.usage
+        stream = await client.chat.completions.create(model=model, messages=messages, stream=True, stream_options={"include_usage": True})
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage # Sent with the final chunk
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                on_text(chunk.choices[0].delta.content)
+    except asyncio.CancelledError:
+        if cancel is None or not cancel.is_set(): # Cancelled by the caller, e.g. a hedged request that lost the race
+            raise
+        return "".join(parts), True, usage
+    finally:
+        if stream is not None:
+            await stream.close() # Closing the stream aborts the request if it is still in flight
+    return "".join(parts), False, usage
+
+async def responses_request(client, model, prompt, on_text, cancel): # The same through the Responses API.
+    parts, usage, stream = [], None, None
+    try:
+        if on_text is None:
+            response = await client.responses.create(model=model, input=prompt)
+            return response.output_text or "", False, response.usage
+        stream = await client.responses.create(model=model, input=prompt, stream=True)
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                parts.append(event.delta)
+                on_text(event.delta)
+            elif event.type == "response.completed":
+                usage = event.response.usage
+            elif event.type in ("response.failed", "error"):
+                raise RuntimeError(getattr(getattr(event, "response", None), "error", None) or getattr(event, "message", "response failed"))
+    except asyncio.CancelledError:
+        if cancel is None or not cancel.is_set():
+            raise
+        return "".join(parts), True, usage
+    finally:
+        if stream is not None:
+            await stream.close()
+    return "".join(parts), False, usage
+
+async def backend_completion(name, prompt, model, on_text=None, cancel=None, usage=None): # Sends one prompt to one backend, retrying rate limited and transient failures.
+    # Returns the text and whether it was cancelled, and raises once the retries are used up.
+    settings = backend_settings(name)
+    client = llm_client(name, settings)
+    request = responses_request if settings["api"] == "responses" else chat_request
+    streamed = []
+    def forward(text):
+        streamed.append(text)
+        on_text(text)
+    for attempt in range(llm_max_retries + 1):
+        try:
+            text, cancelled, response_usage = await until_cancelled(request(client, settings["model"] or model, prompt, forward if on_text else None, cancel), cancel)
+        except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e: # APIConnectionError includes timeouts
+            if attempt == llm_max_retries or streamed: # Text that has been shown cannot be taken back, so a broken stream is not retried
+                raise
             try:
-                with open(sleec_files[s_index], "r", encoding="utf-8") as f:
-                    sleec_ruleset = f.read()
-            except Exception as e:
-                sleec_ruleset = "Error reading SLEEC file: " + str(e)
-        
-        # Get Assertions file output using the refines command. Automatic Windows/Linux detecttion ensures the correct command is used.
-        assertions_output = ""
-        a_index = assertions_selector.current()
-        if a_index != -1:
-            assertions_full_path = assertions_files[a_index]
+                await until_cancelled(asyncio.sleep(retry_delay(e, attempt)), cancel)
+            except asyncio.CancelledError:
+                if cancel is None or not cancel.is_set():
+                    raise
+                return "", True
+            continue
+        if usage is not None:
+            add_usage(usage, response_usage)
+        return text.strip(), cancelled
+
+async def complete(prompt, model, backend, on_text=None, cancel=None, usage=None): # Sends a prompt to backend, hedged with llm_hedge_backend when that is set. Returns the text and whether it was cancelled.
+    # If no answer (or, when streaming, no text) has arrived after llm_hedge_after seconds the prompt is also sent to the hedge backend, and the first valid answer wins.
+    # If backend fails before then without having shown any text, the hedge backend is asked straight away.
+    hedge = llm_hedge_backend if llm_hedge_backend != backend else None
+    if hedge is None:
+        return await backend_completion(backend, prompt, model, on_text, cancel, usage)
+    winner = []
+    def forward(name): # Only the request that starts streaming first is shown
+        def on_piece(text):
+            if not winner:
+                winner.append(name)
+            if winner[0] == name:
+                on_text(text)
+        return on_piece if on_text else None
+    primary = asyncio.ensure_future(backend_completion(backend, prompt, model, forward(backend), cancel, usage))
+    done, _ = await asyncio.wait({primary}, timeout=llm_hedge_after)
+    if winner or (done and (primary.cancelled() or primary.exception() is None)):
+        return await primary
+    if usage is not None:
+        usage["hedged_requests"] += 1
+    names = {primary: backend, asyncio.ensure_future(backend_completion(hedge, prompt, model, forward(hedge), cancel, usage)): hedge}
+    pending, error = set(names), None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                elif (task.result()[0] or task.result()[1]) and (not winner or winner[0] == names[task]):
+                    if usage is not None and names[task] == hedge:
+                        usage["hedge_wins"] += 1
+                    return task.result()
+        raise error or RuntimeError("no answer from either backend")
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def request_completions(prompts, model, cancel=None, usage=None, backend=None): # Sends every prompt concurrently, at most llm_max_concurrency at a time. Setting cancel aborts them all.
+    # The token counts of every response are added to the usage Counter when one is given. A failed request is returned as an error message in place of its text.
+    backend = backend or llm_backend
+    semaphore = asyncio.Semaphore(max(1, llm_max_concurrency))
+    async def complete_one(prompt):
+        async with semaphore:
             try:
-                if os.name == "nt":
-                    env = os.environ.copy()
-                    env["LC_ALL"] = "C"
-                    refines_dir = os.path.dirname(refines_exe_path)
-                    current_dir = os.getcwd()
-                    os.chdir(refines_dir)
-                    command = [os.path.basename(refines_exe_path), "--quiet", assertions_full_path]
-                    result = subprocess.run(command, capture_output=True, text=True, env=env)
-                    assertions_output = result.stdout.strip() if result.returncode == 0 else "Error: " + result.stderr.strip()
-                    os.chdir(current_dir)
+                return (await complete(prompt, model, backend, usage=usage))[0]
+            except Exception as e:
+                return llm_error(backend, e)
+    requests = asyncio.gather(*(complete_one(prompt) for prompt in prompts))
+    while cancel is not None and not requests.done():
+        if cancel.is_set():
+            requests.cancel()
+        await asyncio.wait({requests}, timeout=0.1)
+    return await requests
+
+async def batch_call(backend, request): # Runs one Files or Batch API call with the backend's client, e.g. lambda client: client.batches.retrieve(batch_id).
+    return await request(llm_client(backend, backend_settings(backend)))
+
+def batch_request_line(custom_id, prompt, model, api): # One line of a batch request file, for the Chat Completions or Responses API.
+    if api == "responses":
+        return {"custom_id": custom_id, "method": "POST", "url": "/v1/responses", "body": {"model": model, "input": prompt}}
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": {"model": model, "messages": [{"role": "user", "content": prompt}]}}
+
+def batch_response_text(body): # The text of one answered request in a batch output file.
+    if "choices" in body:
+        return body["choices"][0]["message"]["content"] or ""
+    return "".join(part.get("text", "") for item in body.get("output", []) if item.get("type") == "message" for part in item.get("content", []) if part.get("type") == "output_text")
+
+def run_batch(backend, lines, batch_dir, status=lambda message: None): # Submits the request lines as one batch and waits for it to finish. Returns the batch id and
+    # custom_id -> (text, usage) for every request that was answered. Each step is recorded in the checkpoint, so after an interruption the same lines resume the same batch.
+    content = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+    request_path = os.path.join(batch_dir, "batch_requests.jsonl")
+    checkpoint_path = os.path.join(batch_dir, "batch_checkpoint.json")
+    checkpoint = {"digest": hashlib.sha256(content).hexdigest(), "backend": backend}
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if [saved.get("digest"), saved.get("backend")] == [checkpoint["digest"], backend]:
+            checkpoint = saved
+    except (OSError, ValueError):
+        pass
+    def save():
+        write_cache_file(checkpoint_path, json.dumps(checkpoint, indent=2))
+    with open(request_path, "wb") as f:
+        f.write(content)
+    if "input_file_id" not in checkpoint:
+        status(f"Uploading {len(lines)} requests ...")
+        checkpoint["input_file_id"] = run_llm(batch_call(backend, lambda client: client.files.create(file=("batch_requests.jsonl", content), purpose="batch"))).id
+        save()
+    if "batch_id" not in checkpoint:
+        endpoint = "/v1/responses" if backend_settings(backend)["api"] == "responses" else "/v1/chat/completions"
+        checkpoint["batch_id"] = run_llm(batch_call(backend, lambda client: client.batches.create(input_file_id=checkpoint["input_file_id"], endpoint=endpoint, completion_window=batch_completion_window))).id
+        save()
+    else:
+        status(f"Resuming batch {checkpoint['batch_id']} ...")
+    while True:
+        batch = run_llm(batch_call(backend, lambda client: client.batches.retrieve(checkpoint["batch_id"])))
+        if batch.status != checkpoint.get("status"):
+            checkpoint["status"] = batch.status
+            save()
+            counts = batch.request_counts
+            status(f"Batch {batch.id} {batch.status}" + (f" ({counts.completed} of {counts.total} requests done)" if counts and counts.total else "") + ".")
+        if batch.status in ("completed", "failed", "expired", "cancelled"):
+            break
+        time.sleep(batch_poll_interval)
+    results = {}
+    if batch.output_file_id:
+        output = run_llm(batch_call(backend, lambda client: client.files.content(batch.output_file_id))).text
+        for line in output.splitlines():
+            if line.strip():
+                answer = json.loads(line)
+                response = answer.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[answer["custom_id"]] = (batch_response_text(response["body"]).strip(), response["body"].get("usage"))
+    return batch.id, results
+
+report_title_pattern = re.compile(r"^[ \t*#]*(Conflicting|Redundant) Rules? \((\d+) of (\d+)\)", re.M)
+report_header_pattern = re.compile(r"Total Rule Issues Discovered:\s*(\d+)\s*\|\s*Conflicts:\s*(\d+)\s*\|\s*Redundancies:\s*(\d+)")
+
+def report_titles(failed): # The title of each failed assertion's section, e.g. Conflicting Rule (2 of 3).
+    totals = Counter(kind for kind, _ in failed)
+    counters = Counter()
+    titles = []
+    for kind, _ in failed:
+        counters[kind] += 1
+        titles.append(f"{kind} ({counters[kind]} of {totals[kind]})")
+    return titles
+
+def titled_section(title, response): # Gives a response the title it was asked for, as the LLM sometimes numbers sections itself.
+    if report_title_pattern.search(response):
+        return report_title_pattern.sub(lambda _: title, response.strip(), count=1)
+    return title + ": " + response.strip()
+
+def assemble_report(failed, sections): # The report for the failed assertions, with a locally counted header and a spacer between sections.
+    totals = Counter(kind for kind, _ in failed)
+    header = f"Total Rule Issues Discovered: {len(failed)} | Conflicts: {totals['Conflicting Rule']} | Redundancies: {totals['Redundant Rules']}"
+    return header + "\n\n" + "\n-----------\n".join(sections)
+
+def fan_out_prompts(sleec_spec_text, sleec_ruleset, failed, agent_text): # One prompt per failed assertion, each asking for its section of the report.
+    return [build_single_assertion_prompt(sleec_spec_text, sleec_ruleset, format_assertion(record, compact_traces), title, agent_text) for (_, record), title in zip(failed, report_titles(failed))]
+
+def fan_out_report(failed, responses): # Assembles the responses to fan_out_prompts into the usual report.
+    return assemble_report(failed, [titled_section(title, response) for title, response in zip(report_titles(failed), responses)])
+
+def fan_out_analysis(sleec_spec_text, sleec_ruleset, failed, agent_text, model, cancel=None, usage=None, backend=None, reused=None): # Analyses each failed assertion in its own request and assembles the usual report with a locally counted header.
+    # Failed assertions that already have a section in reused (from the analysis index) are not requested.
+    sections = list(reused or [None] * len(failed))
+    prompts = fan_out_prompts(sleec_spec_text, sleec_ruleset, failed, agent_text)
+    missing = [i for i, section in enumerate(sections) if section is None]
+    for i, response in zip(missing, run_llm(request_completions([prompts[i] for i in missing], model, cancel, usage, backend))):
+        sections[i] = response
+    return fan_out_report(failed, sections)
+
+@dataclass
+class ReportSection: # One completed template from a Rule-Rule report, e.g. Conflicting Rule (1 of 3): { ... }.
+    kind: str # "Conflicting Rule" or "Redundant Rules", as in failed_assertions
+    text: str
+    rules: list # The rules named under Rule 1 and Rule 2 (or in the Rule Name)
+    problems: list # Why the section cannot be used as it is. Empty when it is complete.
+
+def parse_report_sections(report, rule_names): # Splits a Rule-Rule report into its sections, checking each one has every part of its template.
+    matches = list(report_title_pattern.finditer(report))
+    sections = []
+    for match, following in zip(matches, matches[1:] + [None]):
+        text = report[match.start():following.start() if following else len(report)].strip()
+        text = re.sub(r"\n[ \t]*-{3,}[ \t]*$", "", text).strip() # The spacer before the next section
+        fields = dict(re.findall(r"^[ \t]*(Rule Name|Rule 1|Rule 2)[ \t]*:[ \t]*(.*)$", text, re.M))
+        rules = [next((word for word in re.findall(r"\w+", fields.get(key, "")) if word in rule_names), None) for key in ("Rule 1", "Rule 2")]
+        if None in rules:
+            name = re.sub(r"^SLEEC", "", fields.get("Rule Name", "").strip())
+            rules = assertion_rule_names("SLEEC" + name if "_wrt_" not in name else name, rule_names) or [rule for rule in rules if rule]
+        problems = [f"no {part}" for part in ("Error", "Rule Name", "Rule 1", "Rule 2", "Scenario", "Justification", "Resolution", "Suggestion") if not re.search(r"\b" + part + r"\b[^:\n]*:", text)]
+        if text.count("{") > text.count("}"):
+            problems.append("cut off")
+        if re.search(r"\{\s*(your justification|a brief description|name of|using one)", text):
+            problems.append("template left unfilled")
+        sections.append(ReportSection(kind="Redundant Rules" if match.group(1) == "Redundant" else "Conflicting Rule", text=text, rules=rules, problems=problems))
+    return sections
+
+def match_report_sections(sections, failed, rule_names): # The section covering each failed assertion, or None where the report skipped it.
+    unused = list(sections)
+    matched = []
+    for kind, record in failed:
+        rules = assertion_rule_names(record.name, rule_names) or []
+        section = next((section for section in unused if section.kind == kind and rules and sorted(section.rules) == sorted(rules)), None)
+        if section is None: # Sections that do not name rules from the ruleset are matched in report order
+            section = next((section for section in unused if section.kind == kind and not section.rules), None)
+        if section is not None:
+            unused.remove(section)
+        matched.append(section)
+    return matched, unused
+
+def validate_report(analysis, report, failed, cancel=None, usage=None): # Checks a Rule-Rule report covers every failed assertion with a complete template and a correct header.
+    # Sections that are missing or malformed are requested again on their own and spliced in, so a partial failure does not mean re-running the whole prompt.
+    # Returns the report, corrected where needed, and what was found.
+    rule_names = parse_sleec_sections(analysis.sleec_ruleset)[1]
+    titles = report_titles(failed)
+    matched, extra = match_report_sections(parse_report_sections(report, rule_names), failed, rule_names)
+    header = report_header_pattern.search(report)
+    totals = Counter(kind for kind, _ in failed)
+    findings = {
+        "missing": sum(1 for section in matched if section is None),
+        "malformed": sum(1 for section in matched if section is not None and section.problems),
+        "extra": len(extra),
+        "header_wrong": int(not header or [int(count) for count in header.groups()] != [len(failed), totals["Conflicting Rule"], totals["Redundant Rules"]]),
+        "regenerated": 0,
+    }
+    misnumbered = any(section is not None and report_title_pattern.match(section.text).group(0).strip(" \t*#") != title for section, title in zip(matched, titles))
+    if not (findings["missing"] or findings["malformed"] or findings["extra"] or findings["header_wrong"] or misnumbered):
+        return report, findings
+    sections = [titled_section(title, section.text) if section is not None else None for section, title in zip(matched, titles)]
+    for _ in range(max(0, report_repair_attempts)):
+        retry = [i for i, section in enumerate(matched) if section is None or section.problems]
+        if not retry or (cancel is not None and cancel.is_set()):
+            break
+        prompts = [build_single_assertion_prompt(analysis.sleec_spec_text, analysis.sleec_ruleset, format_assertion(failed[i][1], compact_traces), titles[i], analysis.agent_text) for i in retry]
+        responses = run_llm(request_completions(prompts, analysis.model, cancel, usage, analysis.backend))
+        findings["regenerated"] += len(retry)
+        for i, response in zip(retry, responses):
+            replacement = parse_report_sections(titled_section(titles[i], response), rule_names)
+            if replacement and not replacement[0].problems:
+                matched[i], sections[i] = replacement[0], replacement[0].text
+            elif sections[i] is None and not response.startswith("Error calling LLM backend"):
+                sections[i] = titled_section(titles[i], response) # Better than leaving the assertion out
+    for i, section in enumerate(sections):
+        if section is None:
+            sections[i] = f"{titles[i]}: {{\n\tError: {{\n\t\tRule Name: {failed[i][1].name}\n\t\tJustification: No analysis could be generated for this assertion.\n\t}}\n}}"
+    return assemble_report(failed, sections), findings
+
+def report_findings_note(findings): # e.g. "Report checked: 1 missing and 2 malformed sections regenerated, header recounted."
+    parts = []
+    regenerated = [f"{findings[problem]} {problem}" for problem in ("missing", "malformed") if findings[problem]]
+    if regenerated:
+        parts.append(" and ".join(regenerated) + " sections regenerated")
+    if findings["extra"]:
+        parts.append(f"{findings['extra']} sections not matching a failed assertion removed")
+    if findings["header_wrong"]:
+        parts.append("header recounted")
+    return "Report checked: " + ", ".join(parts) + "." if parts else None
+
+suggestion_line_pattern = re.compile(r"^([ \t]*)(Suggestion(?:[ \t]*\d+)?)[ \t]*:[ \t]*(.*?)[ \t]*$", re.M)
+rule_edit_patterns = [ # One option of a suggestion, in the formats the Rule-Rule prompt asks for, and the (rules replaced, new rule) edit it makes
+    (re.compile(r"ADD\s+RULES?\s*:\s*(\w+\s+when\b.*)", re.I | re.S), lambda match: ([], match.group(1))),
+    (re.compile(r"REMOVE\s+RULES?\s*:\s*(\w+)", re.I), lambda match: ([match.group(1)], None)),
+    (re.compile(r"MODIFY\s+RULES?\s*:\s*(\w+)\s*->\s*(\w+\s+when\b.*)", re.I | re.S), lambda match: ([match.group(1)], match.group(2))),
+    (re.compile(r"COMBINE\s+RULES?\s*:\s*(\w+)\s+AND\s+(\w+)\s*->\s*(\w+\s+when\b.*)", re.I | re.S), lambda match: ([match.group(1), match.group(2)], match.group(3))),
+]
+fix_statuses = ["verified", "introduces failures", "still failing", "not checked"] # Best first, for ranking the suggestions of a section
+no_generator_reason = "new or modified rules need sleec_generator_command to regenerate the assertions"
+
+def parse_rule_edits(suggestion): # The edits a suggestion makes, e.g. "MODIFY RULE: Rule4 -> Rule4 when ..." AND "REMOVE RULE: Rule5", or None if it is not in the prompt's format.
+    edits = []
+    for option in re.split(r"\s+AND\s+(?=[\"'`]?(?:ADD|REMOVE|MODIFY|COMBINE)\s+RULES?\s*:)", suggestion, flags=re.I):
+        option = option.strip().strip("\"'`.").strip()
+        for pattern, edit in rule_edit_patterns:
+            match = pattern.fullmatch(option)
+            if match:
+                replaced, rule = edit(match)
+                edits.append((replaced, " ".join(rule.split()) if rule else None))
+                break
+        else:
+            return None
+    return edits
+
+def ruleset_rule_spans(text): # Where each rule sits in a ruleset, as name -> [start, end] offsets covering the rule and its unless clauses, and the offset of the last rule_end.
+    spans, name, inside, rule_end = {}, None, False, None
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.split("//")[0].strip()
+        if stripped.startswith("rule_start"):
+            inside = True
+        elif stripped.startswith("rule_end") and inside:
+            inside, name, rule_end = False, None, offset
+        elif inside:
+            match = re.match(r"\s*(\w+)\s+when\b", line)
+            if match:
+                name = match.group(1)
+                spans[name] = [offset, offset + len(line)]
+            elif name and stripped:
+                spans[name][1] = offset + len(line)
+        offset += len(line)
+    return spans, rule_end
+
+def apply_rule_edits(ruleset, edits): # Applies a suggestion's edits to the text of a ruleset. Returns the new text, the rules renamed or merged (old -> new name), the rules
+    # removed without a replacement and the rules added or rewritten. Raises ValueError if an edit does not fit the ruleset.
+    renamed, removed, changed = {}, set(), set()
+    for replaced, rule in edits:
+        spans, rule_end = ruleset_rule_spans(ruleset)
+        if rule_end is None:
+            raise ValueError("the ruleset has no rule_end")
+        missing = [name for name in replaced if name not in spans]
+        if missing:
+            raise ValueError(f"{missing[0]} is not in the ruleset")
+        new_name = rule.split()[0] if rule else None
+        if new_name in spans and new_name not in replaced:
+            raise ValueError(f"{new_name} is already in the ruleset")
+        line = "  " + rule + "\n" if rule else ""
+        if not replaced:
+            ruleset = ruleset[:rule_end] + line + ruleset[rule_end:]
+        first = min((spans[name][0] for name in replaced), default=None)
+        for start, end in sorted((spans[name] for name in replaced), reverse=True): # The new rule takes the place of the first rule it replaces
+            ruleset = ruleset[:start] + (line if start == first else "") + ruleset[end:]
+        for old, new in list(renamed.items()): # e.g. Rule4 was renamed to Rule6, which this edit removes
+            if new in replaced:
+                del renamed[old]
+                if rule:
+                    renamed[old] = new_name
                 else:
-                    command = ["refines", "--quiet", assertions_full_path]
-                    assertions_output = subprocess.check_output(command, universal_newlines=True).strip()
+                    removed.add(old)
+        for name in replaced:
+            changed.discard(name)
+            if rule:
+                renamed[name] = new_name
+            else:
+                removed.add(name)
+        if rule:
+            changed.add(new_name)
+            removed.discard(new_name)
+    return ruleset, renamed, removed, changed
+
+def successor_rules(rules, renamed, removed): # The rules an assertion compares once a suggestion is applied, or None when the pair no longer exists.
+    rules = [renamed.get(rule, rule) for rule in rules]
+    if any(rule in removed for rule in rules) or len(set(rules)) < len(rules):
+        return None
+    return rules
+
+def regenerate_assertions(sleec_path, work_dir): # Runs sleec_generator_command (SLEEC-TK) on a ruleset and returns the NAME-assertions.csp it wrote.
+    output = os.path.join(work_dir, "src-gen")
+    os.makedirs(output, exist_ok=True)
+    command = [part.replace("{sleec}", sleec_path).replace("{output}", output) for part in sleec_generator_command]
+    result = subprocess.run(command, capture_output=True, text=True, timeout=sleec_generator_timeout, cwd=work_dir)
+    if result.returncode != 0:
+        raise RuntimeError(" ".join((result.stderr or result.stdout).split())[-300:] or "the generator exited with code " + str(result.returncode))
+    name = os.path.splitext(os.path.basename(sleec_path))[0]
+    assertions_path = os.path.join(output, name + "-assertions.csp")
+    if not os.path.exists(assertions_path):
+        raise RuntimeError(f"no {name}-assertions.csp was written to {output}")
+    return assertions_path
+
+@dataclass
+class SuggestionCheck: # The outcome of applying one suggested fix and re-checking the assertions it affects.
+    assertion: str # The failed assertion the suggestion is meant to resolve
+    suggestion: str
+    status: str = "not checked" # One of fix_statuses
+    new_failures: list = field(default_factory=list) # Assertions that fail with the suggestion applied and did not fail before
+    also_resolved: list = field(default_factory=list) # Other failed assertions the suggestion resolves
+    checked: int = 0 # Assertions re-checked
+    reason: str = "" # Why the suggestion was not checked
+
+def check_suggestion(sleec_path, ruleset, records, target, suggestion, cancel=None): # Applies a suggestion to a copy of the ruleset and re-checks the assertions involving the rules it
+    # adds or rewrites. Assertions of unchanged rules keep their results, and those of removed or merged rules no longer exist.
+    check = SuggestionCheck(assertion=target.name, suggestion=suggestion.strip("\"'`"))
+    edits = parse_rule_edits(suggestion)
+    if not edits:
+        check.reason = "not in the ADD/REMOVE/MODIFY/COMBINE RULE format"
+        return check
+    rule_names = parse_sleec_sections(ruleset)[1]
+    target_rules = assertion_rule_names(target.name, rule_names)
+    if not target_rules:
+        check.reason = "the rules the assertion compares are not in the ruleset"
+        return check
+    try:
+        candidate, renamed, removed, changed = apply_rule_edits(ruleset, edits)
+    except ValueError as e:
+        check.reason = str(e)
+        return check
+    candidate_rules = parse_sleec_sections(candidate)[1]
+    checked = []
+    if changed:
+        if not sleec_generator_command:
+            check.reason = no_generator_reason
+            return check
+        if cancel is not None and cancel.is_set():
+            check.reason = "cancelled"
+            return check
+        work_dir = tempfile.mkdtemp(prefix="sleec-fix-")
+        try:
+            candidate_path = os.path.join(work_dir, os.path.basename(sleec_path))
+            with open(candidate_path, "w", encoding="utf-8") as f:
+                f.write(candidate)
+            assertions_path = regenerate_assertions(candidate_path, work_dir)
+            preamble, assertions = split_assertions_file(assertions_path)
+            affected = [assertion for assertion in assertions if set(assertion_rule_names(assertion, candidate_rules) or []) & changed]
+            if affected:
+                with open(assertions_path, "w", encoding="utf-8") as f: # Only the affected assertions are checked
+                    f.writelines(preamble)
+                    f.write("\n" + "\n".join(affected) + "\n")
+                checked = verify_assertions(assertions_path, candidate_path)
+        except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+            check.reason = "the assertions could not be regenerated: " + " ".join(str(e).split())
+            return check
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    check.checked = len(checked)
+    errors = [record for record in checked if record.result.startswith("Error")]
+    if errors:
+        check.reason = f"{errors[0].name} could not be checked: {errors[0].result}"
+        return check
+    if not checked: # Removing a rule drops its assertions without showing anything about the rules that remain
+        check.reason = "no assertions were re-checked, as " + ("the suggestion only removes rules" if not changed else "no regenerated assertion involves the changed rules")
+        return check
+    key = lambda kind, rules: (kind, frozenset(rules))
+    failing = {key(record.kind, assertion_rule_names(record.name, candidate_rules)) for record in checked if record.failed}
+    failed_before = set()
+    for record in records:
+        rules = assertion_rule_names(record.name, rule_names) if record.failed else None
+        if not rules:
+            continue
+        after = successor_rules(rules, renamed, removed)
+        resolved = after is None or (bool(set(after) & changed) and key(record.kind, after) not in failing) # A pair with no assertion after regeneration is no longer checked
+        if record is target:
+            check.status = "verified" if resolved else "still failing"
+        elif resolved:
+            check.also_resolved.append(record.name)
+        if after:
+            failed_before.add(key(record.kind, after))
+    check.new_failures = [record.name for record in checked if record.failed and key(record.kind, assertion_rule_names(record.name, candidate_rules)) not in failed_before]
+    if check.status == "verified" and check.new_failures:
+        check.status = "introduces failures"
+    return check
+
+def describe_suggestion_check(check): # e.g. "Verified: resolves SLEECRule2Rule4 :[deadlock free] with no new failures (3 assertions re-checked)."
+    if check.status == "not checked":
+        return f"Not checked: {check.reason}."
+    if check.status == "still failing":
+        text = f"Still failing: {check.assertion} still fails"
+    else:
+        text = ("Verified" if check.status == "verified" else "Introduces failures") + f": resolves {check.assertion}"
+    if check.new_failures:
+        text += (" but " if check.status != "still failing" else " and ") + ", ".join(check.new_failures) + (" now fails" if len(check.new_failures) == 1 else " now fail")
+    elif check.status == "verified":
+        text += " with no new failures"
+    if check.also_resolved:
+        text += "; also resolves " + ", ".join(check.also_resolved)
+    return text + (f" ({check.checked} assertions re-checked)." if check.checked else ".")
+
+def verify_suggested_fixes(analysis, report, status=lambda message: None, cancel=None): # Checks every suggestion in a Rule-Rule report against the assertion its section covers, all
+    # at once, and annotates each suggestion with the outcome. Sections with several suggestions are given a ranking. Returns the annotated report and the SuggestionChecks.
+    failed = failed_assertions(analysis.records)
+    if not failed or not analysis.sleec_path:
+        return report, []
+    rule_names = parse_sleec_sections(analysis.sleec_ruleset)[1]
+    sections, _ = match_report_sections(parse_report_sections(report, rule_names), failed, rule_names)
+    tasks = [(section, match, record) for section, (_, record) in zip(sections, failed) if section is not None for match in suggestion_line_pattern.finditer(section.text) if match.group(3)]
+    if not tasks:
+        return report, []
+    status(f"Verifying {len(tasks)} suggested fixes ...")
+    with analysis.trace.stage("fix_verification", suggestions=len(tasks)) as stage:
+        unique = list(dict.fromkeys((record.name, " ".join(match.group(3).split())) for _, match, record in tasks)) # A suggestion repeated for the same assertion is checked once
+        targets = {record.name: record for _, _, record in tasks}
+        with ThreadPoolExecutor(max_workers=max(1, min(refines_workers, len(unique)))) as pool: # Each worker waits on SLEEC-TK and refines processes
+            results = dict(zip(unique, pool.map(lambda item: check_suggestion(analysis.sleec_path, analysis.sleec_ruleset, analysis.records, targets[item[0]], item[1], cancel), unique)))
+        checks = [results[(record.name, " ".join(match.group(3).split()))] for _, match, record in tasks]
+        stage.update(Counter(check.status.replace(" ", "_") for check in checks))
+    for section in sections:
+        section_checks = [(match, check) for (owner, match, _), check in zip(tasks, checks) if owner is section]
+        if not section_checks:
+            continue
+        text = section.text
+        for match, check in reversed(section_checks):
+            text = text[:match.end()] + "\n" + match.group(1) + "Fix Check: " + describe_suggestion_check(check) + text[match.end():]
+        if len(section_checks) > 1:
+            ranked = sorted(section_checks, key=lambda item: (fix_statuses.index(item[1].status), len(item[1].new_failures), -len(item[1].also_resolved)))
+            ranking = "\tFix Ranking: " + ", ".join(f"{match.group(2)} ({check.status})" for match, check in ranked)
+            closing = text.rfind("}")
+            text = text[:closing].rstrip() + "\n" + ranking + "\n" + text[closing:] if closing != -1 else text + "\n" + ranking
+        report = report.replace(section.text, text, 1)
+    verified = sum(1 for check in checks if check.status == "verified")
+    analysis.notes.append(f"Suggested fixes: {verified} of {len(checks)} verified.")
+    skipped = sum(1 for check in checks if check.reason == no_generator_reason)
+    if skipped:
+        note = f"{skipped} suggested fixes that add or modify rules were not checked, as sleec_generator_command is not set."
+        analysis.notes.append(note)
+        report = report.rstrip() + "\n\nFix Check: " + note
+    return report, checks
+
+def prompt_template_version(): # Changes whenever a prompt template changes, so cached reports from older prompts are not reused.
+    versions = [template.name + ":" + template.version for template in prompt_templates().values()]
+    return hashlib.sha256(json.dumps([versions, compact_traces]).encode()).hexdigest()[:16]
+
+def response_cache_key(model, mode, sleec_ruleset, assertions_output, supplements): # Hash of everything that determines the LLM's report. Comments and whitespace are normalised away.
+    material = [model, mode, prompt_template_version(), " ".join(re.sub(r"//[^\n]*", "", sleec_ruleset).split()), " ".join(assertions_output.split())]
+    material += [hashlib.sha256(" ".join(text.split()).encode()).hexdigest() for text in supplements]
+    return hashlib.sha256(json.dumps(material).encode()).hexdigest()
+
+def open_response_cache():
+    os.makedirs(cache_dir, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(cache_dir, "responses.sqlite3"), timeout=10)
+    connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, last_used REAL)")
+    return connection
+
+def cached_response(key): # Returns the cached report for this key, or None if there isn't one or it has expired.
+    try:
+        with open_response_cache() as connection:
+            connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - response_cache_ttl,))
+            row = connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row:
+                connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+def store_response(key, model, response): # Saves a report and evicts the least recently used reports beyond response_cache_max_entries.
+    try:
+        with open_response_cache() as connection:
+            now = time.time()
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, model, response, now, now))
+            connection.execute("DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)", (response_cache_max_entries,))
+    except sqlite3.Error:
+        pass
+
+index_placeholder_pattern = re.compile(r"\$(rule|event|measure|constant|value)(\d+)")
+confidence_levels = ["high", "medium", "low"]
+
+def sleec_name_kinds(sleec_ruleset): # What each name in a ruleset is: "rule", "event", "measure", "constant" or "value" (of a scale measure). Also returns the parsed sections.
+    declarations, rules = parse_sleec_sections(sleec_ruleset)
+    kinds = {name: "rule" for name in rules}
+    for name, declaration in declarations.items():
+        kinds[name] = declaration.split()[0]
+        for values in re.findall(r"scale\s*\(([^)]*)\)", declaration):
+            for value in re.findall(r"\w+", values):
+                kinds.setdefault(value, "value")
+    return kinds, declarations, rules
+
+def canonical_assertion(sleec_ruleset, record): # A failed assertion up to a consistent renaming: the rules it compares, the declarations they use and its compacted counterexample,
+    # with each name replaced by a placeholder such as $event1, numbered in order of appearance. Returns the canonical text and real name -> placeholder (including
+    # compound names such as SLEECRule2Rule4), or None when the rules the assertion compares are not in the ruleset.
+    kinds, declarations, rules = sleec_name_kinds(sleec_ruleset)
+    pair = assertion_rule_names(record.name, rules)
+    if not pair or len(pair) != 2:
+        return None
+    names, counters = {}, Counter()
+    def rename(text):
+        def placeholder(match):
+            word = match.group(0)
+            if word not in names and word in kinds:
+                counters[kinds[word]] += 1
+                names[word] = f"${kinds[word]}{counters[kinds[word]]}"
+            return names.get(word, word)
+        return re.sub(r"\w+", placeholder, text)
+    rule_texts = [rename(rules[name]) for name in pair] # The compared rules become $rule1 and $rule2, in the order the assertion names them
+    (first, second), (first_name, second_name) = pair, (names[name] for name in pair)
+    names.update({f"SLEEC{first}{second}": f"SLEEC{first_name}{second_name}", f"{first}{second}": f"{first_name}{second_name}", f"{first}_wrt_{second}": f"{first_name}_wrt_{second_name}", f"{second}_wrt_{first}": f"{second_name}_wrt_{first_name}"})
+    output = rename(format_assertion(record, compact=True))
+    used = [rename(declarations[name]) for name in list(names) if name in declarations]
+    lines = [record.kind] + rule_texts + [output] + used
+    return "\n".join(" ".join(line.split()) for text in lines for line in text.splitlines() if line.strip()), names
+
+def replace_names(text, names): # Replaces whole names in one pass, so a replacement is never replaced again.
+    if not names:
+        return text
+    return re.sub(r"\b(?:" + "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True)) + r")\b", lambda match: names[match.group(0)], text)
+
+def section_body(section): # A report section without its title, e.g. { Error: ... } from Conflicting Rule (1 of 3): { Error: ... }.
+    match = report_title_pattern.match(section)
+    return re.sub(r"^[ \t*#]*:?\s*", "", section[match.end():]) if match else section.strip()
+
+def analysis_index_key(model, canonical):
+    return hashlib.sha256(json.dumps([model, prompt_template_version(), canonical]).encode()).hexdigest()
+
+def open_analysis_index():
+    os.makedirs(cache_dir, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(cache_dir, "analyses.sqlite3"), timeout=10)
+    connection.execute("CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, section TEXT, names TEXT, source TEXT, confidence TEXT, created REAL, last_used REAL)")
+    return connection
+
+def index_analyses(analysis, failed, report): # Stores the section of each failed assertion in the analysis index, with its names replaced by the placeholders of its canonical form.
+    # The confidence recorded says whether the section also mentions other names from this ruleset (low) or words from the renamed names, e.g. "call support" (medium).
+    if not analysis_index or not failed:
+        return
+    kinds, _, rules = sleec_name_kinds(analysis.sleec_ruleset)
+    matched, _ = match_report_sections(parse_report_sections(report, rules), failed, rules)
+    entries = []
+    for section, (_, record) in zip(matched, failed):
+        canonical = canonical_assertion(analysis.sleec_ruleset, record) if section is not None and not section.problems and "Reused Analysis:" not in section.text else None
+        if canonical is None:
+            continue
+        text, names = canonical
+        body = replace_names(section_body(section.text), names)
+        words = {term for name in names if kinds.get(name) not in (None, "rule") for term in search_terms(name) if len(term) > 3}
+        if any(word in kinds for word in re.findall(r"\w+", body)):
+            confidence = "low"
+        elif words & set(search_terms(body)):
+            confidence = "medium"
+        else:
+            confidence = "high"
+        source_names = {placeholder: name for name, placeholder in names.items() if index_placeholder_pattern.fullmatch(placeholder)}
+        entries.append((analysis_index_key(analysis.model, text), body, json.dumps(source_names), f"{record.name} in {os.path.basename(analysis.sleec_path) or 'another ruleset'}", confidence))
+    try:
+        with open_analysis_index() as connection:
+            now = time.time()
+            for key, body, source_names, source, confidence in entries:
+                row = connection.execute("SELECT confidence FROM analyses WHERE key = ?", (key,)).fetchone()
+                if row and confidence_levels.index(row[0]) < confidence_levels.index(confidence): # Keep the more reusable section
+                    continue
+                connection.execute("INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?)", (key, body, source_names, source, confidence, now, now))
+            connection.execute("DELETE FROM analyses WHERE key NOT IN (SELECT key FROM analyses ORDER BY last_used DESC LIMIT ?)", (analysis_index_max_entries,))
+    except sqlite3.Error:
+        pass
+
+def reuse_analyses(analysis, failed): # Looks up each failed assertion in the analysis index. Returns, for each, the stored section with this ruleset's names and a line saying
+    # where it came from and how confident the reuse is, or None when there is no section to reuse.
+    reused = [None] * len(failed)
+    if not analysis_index:
+        return reused
+    try:
+        with open_analysis_index() as connection:
+            for i, (_, record) in enumerate(failed):
+                canonical = canonical_assertion(analysis.sleec_ruleset, record)
+                if canonical is None:
+                    continue
+                text, names = canonical
+                key = analysis_index_key(analysis.model, text)
+                row = connection.execute("SELECT section, names, source, confidence FROM analyses WHERE key = ?", (key,)).fetchone()
+                if not row:
+                    continue
+                body, source_names, source, confidence = row
+                real_names = {placeholder: name for name, placeholder in names.items() if index_placeholder_pattern.fullmatch(placeholder)}
+                if confidence != "low" and json.loads(source_names) == real_names: # Same names, so the wording fits as well
+                    confidence = "high"
+                if confidence_levels.index(confidence) > confidence_levels.index(analysis_reuse_min_confidence):
+                    continue
+                connection.execute("UPDATE analyses SET last_used = ? WHERE key = ?", (time.time(), key))
+                body = index_placeholder_pattern.sub(lambda match: real_names.get(match.group(0), match.group(0)), body)
+                note = f"\tReused Analysis: alpha-equivalent to {source} (confidence: {confidence})"
+                reused[i] = body[:body.index("{") + 1] + "\n" + note + body[body.index("{") + 1:] if "{" in body else note.strip() + "\n" + body
+    except sqlite3.Error:
+        pass
+    return reused
+
+def merge_reused_sections(analysis, failed, reused, report): # Combines the reused sections with a report written for the remaining failed assertions only.
+    # Sections the report left out are missing from the result, for validate_report to request again.
+    rules = parse_sleec_sections(analysis.sleec_ruleset)[1]
+    remaining = [item for item, section in zip(failed, reused) if section is None]
+    answers = iter(match_report_sections(parse_report_sections(report, rules), remaining, rules)[0])
+    sections = [section if section is not None else next(answers) for section in reused]
+    return assemble_report(failed, [titled_section(title, section if isinstance(section, str) else section.text) for title, section in zip(report_titles(failed), sections) if section is not None])
+
+run_trace_lock = threading.Lock()
+
+def traced_peak_memory_mb(): # Peak memory allocated since the last reset, which is only known while tracemalloc is running (a profiled run).
+    if tracemalloc.is_tracing():
+        return round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+    return None
+
+def process_peak_memory_mb(): # Peak resident size of the whole process so far (Unix only). It never goes down, so a stage can only be charged for raising it.
+    if resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024, 1) # ru_maxrss is in bytes on macOS and KiB on Linux
+    return None
+
+class RunTrace: # Records how long each stage of one analysis run took and how much it processed.
+    def __init__(self, label=""):
+        self.run_id = time.strftime("%Y%m%d-%H%M%S-") + os.urandom(3).hex()
+        self.label = label
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, **counts): # Times the enclosed block. Byte/token counts can be passed in or added to the yielded dict.
+        entry = {"stage": name, **counts}
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        started_wall, started_cpu, started_children, started_peak = time.perf_counter(), time.process_time(), os.times(), process_peak_memory_mb()
+        try:
+            yield entry
+        finally:
+            children = os.times()
+            entry["wall_s"] = round(time.perf_counter() - started_wall, 3)
+            entry["cpu_s"] = round(time.process_time() - started_cpu, 3)
+            entry["child_cpu_s"] = round(children.children_user + children.children_system - started_children.children_user - started_children.children_system, 3) # e.g. refines
+            entry["peak_memory_mb"] = traced_peak_memory_mb() # Peak of this stage alone
+            entry["process_peak_memory_mb"] = process_peak_memory_mb()
+            entry["process_peak_growth_mb"] = None if started_peak is None else round(entry["process_peak_memory_mb"] - started_peak, 1) # How far this stage raised the process peak
+            self.stages.append(entry)
+
+    def to_dict(self):
+        return {"run_id": self.run_id, "label": self.label, "total_wall_s": round(sum(stage["wall_s"] for stage in self.stages), 3), "stages": self.stages}
+
+    def write(self): # Appends this run to the JSON-lines trace file.
+        try:
+            os.makedirs(os.path.dirname(run_trace_file), exist_ok=True)
+            with run_trace_lock, open(run_trace_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.to_dict(), ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+def stage_size(stage): # Short description of the counts recorded for a stage, for the run breakdown.
+    sizes = []
+    for key, value in stage.items():
+        if key not in ("stage", "wall_s", "cpu_s", "child_cpu_s", "peak_memory_mb", "process_peak_memory_mb", "process_peak_growth_mb") and isinstance(value, (int, float)) and not isinstance(value, bool):
+            sizes.append(f"{value:,} {key.replace('_', ' ')}")
+    return ", ".join(sizes)
+
+long_lived_threads = ("llm-loop", "verification-session", "speculative-verification") # Thread names of the workers that outlive an analysis
+
+def on_llm_loop(function): # Runs function on the LLM loop's thread and waits for it.
+    done = threading.Event()
+    llm_event_loop().call_soon_threadsafe(lambda: (function(), done.set()))
+    done.wait()
+
+def profile_run(function, *args): # Runs function under cProfile and tracemalloc, saving the statistics and top allocations to profile_dir. Returns the report paths.
+    # Besides the calling thread, the LLM event loop and every thread started during the run (such as the refines shard workers) get a profiler of their own, and
+    # their statistics are merged. Workers that outlive the run are not profiled: the verification session workers of the FDR and stand-in backends, and background
+    # verifications. From Python 3.12 cProfile sees every thread by itself.
+    os.makedirs(profile_dir, exist_ok=True)
+    base = os.path.join(profile_dir, "run-" + time.strftime("%Y%m%d-%H%M%S"))
+    profilers, profilers_lock = [cProfile.Profile()], threading.Lock()
+    per_thread = sys.version_info < (3, 12)
+    def profile_thread(frame, event, arg): # Installed in each new thread by threading.setprofile, and replaced by the thread's own profiler on its first call
+        sys.setprofile(None)
+        if threading.current_thread().name.startswith(long_lived_threads):
+            return
+        profiler = cProfile.Profile()
+        with profilers_lock:
+            profilers.append(profiler)
+        profiler.enable()
+    if per_thread:
+        profilers.append(cProfile.Profile())
+        on_llm_loop(profilers[1].enable)
+        threading.setprofile(profile_thread)
+    tracemalloc.start()
+    try:
+        profilers[0].runcall(function, *args)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        if per_thread:
+            threading.setprofile(None)
+            on_llm_loop(profilers[1].disable)
+        with profilers_lock:
+            for profiler in profilers:
+                profiler.create_stats()
+            stats = pstats.Stats(*(profiler for profiler in profilers if profiler.stats))
+        stats.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            stats.stream = f
+            stats.sort_stats("cumulative").print_stats(40)
+            f.write("Top memory allocations:\n")
+            for statistic in snapshot.statistics("lineno")[:25]:
+                f.write(str(statistic) + "\n")
+    return base + ".prof", base + ".txt"
+
+@dataclass
+class RuleRuleAnalysis: # Everything gathered for one Rule-Rule analysis before it is sent to the LLM.
+    model: str
+    fan_out: bool
+    backend: str = ""
+    sleec_path: str = ""
+    sleec_ruleset: str = ""
+    records: list = field(default_factory=list)
+    assertions_output: str = ""
+    sleec_spec_text: str = ""
+    agent_text: str = ""
+    notes: list = field(default_factory=list)
+    trace: RunTrace = field(default_factory=RunTrace)
+
+def prepare_rule_rule_analysis(sleec_path, assertions_path, sleec_spec_path, agent_spec_path, model, fan_out, backend=None): # Reads the inputs and runs the verification. Files that are not available are passed as None.
+    backend = backend or llm_backend
+    analysis = RuleRuleAnalysis(model=backend_model(backend, model), fan_out=fan_out, backend=backend, sleec_path=sleec_path or "")
+    analysis.trace.label = os.path.basename(assertions_path or sleec_path or "")
+
+    # Get SLEEC Spec text from PDF
+    if sleec_spec_path:
+        with analysis.trace.stage("read_sleec_spec") as stage:
+            analysis.sleec_spec_text = read_pdf(sleec_spec_path)
+            stage["bytes"] = len(analysis.sleec_spec_text.encode("utf-8"))
+
+    # Get SLEEC ruleset from selected SLEEC file
+    if sleec_path:
+        with analysis.trace.stage("read_ruleset") as stage:
+            try:
+                with open(sleec_path, "r", encoding="utf-8") as f:
+                    analysis.sleec_ruleset = f.read()
+            except Exception as e:
+                analysis.sleec_ruleset = "Error reading SLEEC file: " + str(e)
+            stage["bytes"] = len(analysis.sleec_ruleset.encode("utf-8"))
+
+    # Get Assertions file output using the refines command. Assertions are checked in parallel shards when refines_parallel is enabled, and unchanged ones are replayed from the verification store.
+    # Only the failed assertions are passed on to the LLM.
+    if assertions_path:
+        with analysis.trace.stage("verification") as stage:
+            try:
+                wait_for_speculative_verification(assertions_path)
+                analysis.records = verify_assertions(assertions_path, ruleset_for_assertions(assertions_path))
+                analysis.assertions_output = format_failed_assertions(analysis.records)
+                if compact_traces:
+                    saved, full = trace_compaction_savings(analysis.records)
+                    if saved > 0:
+                        analysis.notes.append(f"Trace compaction saved ~{saved:,} tokens ({saved / full:.0%}).")
+            except Exception as e:
+                analysis.assertions_output = "Error running refines: " + str(e)
+            stage["assertions"] = len(analysis.records)
+            stage["failed"] = sum(1 for record in analysis.records if record.failed)
+            stage["static"] = sum(1 for record in analysis.records if "Static Analysis" in record.statistics)
+            if stage["static"]:
+                analysis.notes.append(f"Static pre-analysis explained {stage['static']} of {stage['failed']} failed assertions.")
+            stage["output_tokens"] = estimate_tokens(analysis.assertions_output)
+
+    # Get agent Specification text from PDF
+    if agent_spec_path:
+        with analysis.trace.stage("read_agent_spec") as stage:
+            analysis.agent_text = read_pdf(agent_spec_path)
+            stage["bytes"] = len(analysis.agent_text.encode("utf-8"))
+
+    # Keep the specifications within the model's token budget, preferring the sections most relevant to the failed assertions.
+    with analysis.trace.stage("fit_supplements") as stage:
+        budget = token_budget(backend, model)
+        (analysis.sleec_spec_text, analysis.agent_text), trimmed = fit_supplements_to_budget([analysis.sleec_spec_text, analysis.agent_text], relevance_query(analysis.sleec_ruleset, analysis.records), budget)
+        if trimmed:
+            analysis.notes.append(f"Specifications trimmed to the {budget:,} token budget.")
+        stage["tokens"] = estimate_tokens(analysis.sleec_spec_text) + estimate_tokens(analysis.agent_text)
+    return analysis
+
+def analysis_cache_key(analysis): # The response cache key of a prepared analysis. Reports from per-assertion and single requests are kept apart.
+    mode = "per-assertion" if analysis.fan_out and failed_assertions(analysis.records) else "full"
+    return response_cache_key(analysis.model, mode, analysis.sleec_ruleset, analysis.assertions_output, [analysis.sleec_spec_text, analysis.agent_text])
+
+def analysis_prompts(analysis, reused=None): # The prompts analyse_rule_rule sends for a prepared analysis, and a function assembling their responses into the report.
+    # Failed assertions with a section in reused (from reuse_analyses) are not asked about, and their sections are merged into the report.
+    failed = failed_assertions(analysis.records)
+    reused = reused or [None] * len(failed)
+    missing = [i for i, section in enumerate(reused) if section is None]
+    if failed and (analysis.fan_out or not missing):
+        prompts = fan_out_prompts(analysis.sleec_spec_text, analysis.sleec_ruleset, failed, analysis.agent_text)
+        def assemble(responses):
+            sections = list(reused)
+            for i, response in zip(missing, responses):
+                sections[i] = response
+            return fan_out_report(failed, sections)
+        return [prompts[i] for i in missing], assemble
+    if len(missing) < len(failed):
+        assertions_output = format_failed_assertions([failed[i][1] for i in missing])
+        prompt = build_rule_rule_prompt(analysis.sleec_spec_text, analysis.sleec_ruleset, assertions_output, analysis.agent_text)
+        return [prompt], lambda responses: merge_reused_sections(analysis, failed, reused, responses[0])
+    return [build_rule_rule_prompt(analysis.sleec_spec_text, analysis.sleec_ruleset, analysis.assertions_output, analysis.agent_text)], lambda responses: responses[0]
+
+def analyse_rule_rule(analysis, bypass_cache=False, status=lambda message: None, on_text=None, cancel=None, on_replace=None): # Sends a prepared analysis to the LLM and returns the report.
+    # on_text receives the report as it arrives (streamed when a single request is made), and setting the cancel event aborts the request. If a streamed report
+    # is corrected by validate_report, on_replace receives the corrected report.
+    # With per-assertion analysis enabled, each failed assertion gets its own request and the report is assembled locally.
+    # A report for identical inputs is reused from the response cache, and sections for alpha-equivalent assertions from the analysis index, unless the cache is bypassed.
+    failed = failed_assertions(analysis.records)
+    fan_out = analysis.fan_out and bool(failed)
+    with analysis.trace.stage("response_cache"):
+        cache_key = analysis_cache_key(analysis)
+        llm_response = None if bypass_cache else cached_response(cache_key)
+    from_cache = llm_response is not None
+    reused = [None] * len(failed)
+    if analysis_index and failed and not from_cache and not bypass_cache:
+        with analysis.trace.stage("analysis_index") as stage:
+            reused = reuse_analyses(analysis, failed)
+            stage["reused"] = sum(1 for section in reused if section is not None)
+        if stage["reused"]:
+            analysis.notes.append(f"{stage['reused']} of {len(failed)} failed assertions reused from the analysis index.")
+    remaining = [item for item, section in zip(failed, reused) if section is None]
+    streamed = cancelled = False
+    if from_cache:
+        analysis.notes.append("Report loaded from the response cache.")
+    elif cancel is not None and cancel.is_set():
+        llm_response, cancelled = "", True
+    elif failed and not remaining:
+        llm_response = fan_out_report(failed, reused)
+    elif fan_out:
+        status(f"Forwarding {len(remaining)} failed assertions to LLM ...")
+        with analysis.trace.stage("llm_request", requests=len(remaining)) as stage:
+            usage = Counter()
+            try:
+                llm_response = fan_out_analysis(analysis.sleec_spec_text, analysis.sleec_ruleset, failed, analysis.agent_text, analysis.model, cancel, usage, analysis.backend, reused)
+            except asyncio.CancelledError:
+                llm_response, cancelled = "", True
+            except Exception as e:
+                llm_response = llm_error(analysis.backend, e)
+            stage.update(usage)
+            stage["response_tokens"] = estimate_tokens(llm_response)
+    else:
+        with analysis.trace.stage("prompt_assembly") as stage:
+            assertions_output = format_failed_assertions([record for _, record in remaining]) if len(remaining) < len(failed) else analysis.assertions_output
+            final_prompt = build_rule_rule_prompt(analysis.sleec_spec_text, analysis.sleec_ruleset, assertions_output, analysis.agent_text)
+            stage["prompt_tokens"] = estimate_tokens(final_prompt)
+        status("Forwarding Prompt to LLM ...")
+        with analysis.trace.stage("llm_request") as stage:
+            usage = Counter()
+            streamed = on_text is not None
+            try:
+                llm_response, cancelled = run_llm(complete(final_prompt, analysis.model, analysis.backend, on_text, cancel, usage))
+            except asyncio.CancelledError:
+                llm_response, cancelled = "", True
             except Exception as e:
-                assertions_output = "Error running refines: " + str(e)
-        
-        # Get agent Specification text from PDF
-        agent_text = ""
-        if prompt_agent_files:
-            agent_text = read_pdf(prompt_agent_files[0])
-        
-        # Build the final prompt using the provided template. f-strings have been added for this nicer formatting with this template but are not strictly necessary.
-        final_prompt = (
-    f"Sleec-TK is a toolkit for the specification, validation and verification of social, legal, ethical, empathetic and cultural requirements for autonomous agents and AI systems. "
-    f"You can see a full breakdown of the SLEEC application in the attached Sleec document: {sleec_spec_text}.\n\n"
-    f"The SLEEC tool runs a verification in the FDR4 software. In this, the sleec rules are verified against each other to check for inconsistencies and redundancies.\n\n"
-    f"Any issues discovered in the verification are outputted. These are denoted as 'failed' assertions and, if applicable, counterexample trace(s) are generated for each failed assertion.\n\n"
-    f"The users responsible for understanding and working with these outputs are often non-technical and therefore struggle to understand the mathematical outputs generated by the SLEEC tool. "
-    f"Your role is to translate any failed assertions into plain English to assist these users in fixing issues in their set of requirements. You will also be providing a resolution suggestion to assist the user in fixing the issue.\n\n"
-    f"Your responses will utilise pre-defined templates depending on the issue found. Let's look at the Rule-Rule inconsistencies (conflicts and redundancies), how they will be presented and the desired output formats for them.\n\n"
-    f"Rule-Rule Inconsistencies:\n\n"
-    f"Each rule is checked against each other rule for both conflicts and redundancies. The SLEEC tool will output all checks that it completes, but only rules denoted with 'Result: Failed' will need to be analysed. "
-    f"Rule conflicts will produce one or more counterexample traces which will need to be analysed by you. Rule redundancies will not produce a trace but the output will notify you of the existence of a redundancy between two rules.\n\n"
-    f"Conflicting rules will be outputted by the SLEEC tool in the following format:\n\n"
-    f"\"SLEEC[Name of rule 1][Name of rule 2]\n"
-    f"\tLog:\n"
-    f"\t\tResult: Failed\n"
-    f"\t\t...\n"
-    f"\t\t...\n"
-    f"\t\tCounterexample: {{Mathematical counterexample string here}}\"\n\n"
-    f"Each failed assertion may have multiple counterexample traces. When generating your response consider all counterexample traces to ensure your analysis catches all possible errors and also your proposed resolution fixes all listed counterexamples. "
-    f"For each of the rule combinations that fail, you must complete the following template:\n\n"
-    f"Conflicting Rule ({{Rule conflict out of total number of conflicting rules, i.e. \"1 of 3\", and the next analysis generated would be \"2 of 3\" etc.}}): {{\n"
-    f"\tError: {{\n"
-    f"\t\tRule Name: {{Name of rule combination e.g. SLEECRule1Rule2}}\n"
-    f"\t\tRule 1: {{name of Rule 1}}\n"
-    f"\t\tRule 2: {{name of Rule 2}}\n"
-    f"\t\tScenario: {{a brief description of the scenario when these rules would come into effect}}\n"
-    f"\t\tCategory: {{based on information such as the wider scenario, the specific SLEEC rules and the generated counter examples, categorise the error. Examples of categories may include divergence, timing and event/ measure names.}}\n"
-    f"\t\tJustification: {{your justification for why the error exists}}\n"
-    f"\t}},\n"
-    f"\tResolution: {{\n"
-    f"\t\tSuggestion 1: {{using one, or a combination of the following options: 'add rule', 'remove rule', 'modify rule' and 'combine rules', suggest a change to the SLEEC code that would resolve the error. These rules must be displayed in the format: \n"
-    f"\t\t\tAdd Rule: \"ADD RULE: RuleN when X then Y\"\n"
-    f"\t\t\tRemove Rule: \"REMOVE RULE: RuleN\"\n"
-    f"\t\t\tModify Rule: \"MODIFY RULE: RuleN -> RuleM when X then Y\"\n"
-    f"\t\t\tCombine Rules: \"COMBINE RULES: RuleA AND RuleB -> RuleC when X then Y\"\n"
-    f"\n"
-    f"\t\t\tIf multiple options are chosen, the format should follow:\n"
-    f"\t\t\t\"Option1 AND Option2 ... AND OptionN\" where Option1 - OptionN are in the formats described above.\n"
-    f"\n"
-    f"\t\t\tAny additions, removals, modifications, or combinations of rules must stay within the scope of the agent and not require actions or measures outside of the capability of the system. "
-    f"Where possible the changes should make use of existing rules and measures first, only creating new events and measures when absolutely necessary. "
-    f"New rules generated must also follow the SLEEC syntax. You are allowed to use any SLEEC features such as 'within' for timed actions, 'unless' for extra checks etc.}}\n"
-    f"\n"
-    f"\t\tJustification: {{your justification for why suggestion 1 would resolve the error}}\n\n"
-    f"\t\tSuggestion 2: {{using the same format as above, if applicable, suggest another resolution that could solve the problem. Make this suggestion distinct from the first suggestion.}}\n"
-    f"\t\tJustification: {{your justification for why suggestion 2 would resolve the error}}\n"
-    f"\t}}\n"
-    f"}}\n\n"
-    f"Redundant rules will be outputted by the SLEEC tool in the following format:\n\n"
-    f"\"not [Name of rule 1]_wrt_[Name of rule 2]\n"
-    f"\tLog:\n"
-    f"\t\tResult: Failed\n"
-    f"\t\t...\n"
-    f"\t\t...\"\n\n"
-    f"In this context 'wrt' means 'with reference to'. Unlike the rule conflicts, no counterexample traces are generated for redundant rules. For each of the redundancies found you must complete the following template:\n\n"
-    f"Redundant Rules ({{Rule redundancy out of total number of redundant rules, i.e. \"1 of 3\", and the next analysis generated would be \"2 of 3\" etc.}}): {{\n"
-    f"\tError: {{\n"
-    f"\t\tRule Name: {{Name of rule combination e.g. Rule1_wrt_Rule2}}\n"
-    f"\t\tRule 1: {{name of Rule 1}}\n"
-    f"\t\tRule 2: {{name of Rule 2}}\n"
-    f"\t\tScenario: {{a brief description of the scenario when these rules would come into effect}}\n"
-    f"\t\tJustification: {{your justification for why the rules are redundant}}\n"
-    f"\t}},\n"
-    f"\tResolution: {{\n"
-    f"\t\tSuggestion 1: {{using one, or a combination of the following options: 'add rule', 'remove rule', 'modify rule' and 'combine rules', suggest a change to the SLEEC code that would resolve the error. These rules must be displayed in the format: \n"
-    f"\t\t\tAdd Rule: \"ADD RULE: RuleN when X then Y\"\n"
-    f"\t\t\tRemove Rule: \"REMOVE RULE: RuleN\"\n"
-    f"\t\t\tModify Rule: \"MODIFY RULE: RuleN -> RuleM when X then Y\"\n"
-    f"\t\t\tCombine Rules: \"COMBINE RULES: RuleA AND RuleB -> RuleC when X then Y\"\n"
-    f"\n"
-    f"\t\t\tIf multiple options are chosen, the format should follow:\n"
-    f"\t\t\t\"Option1 AND Option2 ... AND OptionN\" where Option1 - OptionN are in the formats described above.\n"
-    f"\n"
-    f"\t\t\tAny additions, removals, modifications, or combinations of rules must stay within the scope of the agent and not require actions or measures outside of the capability of the system. "
-    f"Where possible the changes should make use of existing rules and measures first, only creating new events and measures when absolutely necessary. "
-    f"New rules generated must also follow the SLEEC syntax. You are allowed to use any SLEEC features such as 'within' for timed actions, 'unless' for extra checks etc.}}\n"
-    f"\n"
-    f"\t\tJustification: {{your justification for why suggestion 1 would resolve the error}}\n\n"
-    f"\t\tSuggestion 2: {{using the same format as above, if applicable, suggest another resolution that could solve the problem. Make this suggestion distinct from the first suggestion.}}\n"
-    f"\t\tJustification: {{your justification for why suggestion 2 would resolve the error}}\n"
-    f"\t}}\n"
-    f"}}\n\n"
-    f"I will now provide two example outputs, one for a set of conflicting rules, and one for a set of redundant rules. "
-    f"When providing your answers, please answer in a similar style and to a similar level of detail to the examples provided. "
-    f"Both the conflict and redundancy are based on the same set of SLEEC rules provided here:\n\n"
-    f"Example SLEEC Rules:\n\n"
-    f"def_start\n"
-    f"  event StartLunchTime\n"
-    f"  event InformUser\n"
-    f"  event DetectUserFallen\n"
-    f"  event CallSupport\n"
-    f"  event IdentifySafePath\n"
-    f"  event SoundWarning\n"
-    f"  event Wait\n"
-    f"  measure noSafePath:boolean\n"
-    f"  measure waiting:boolean\n"
-    f"  measure praying:boolean\n"
-    f"  measure timeSinceLastMeal:numeric\n"
-    f"  measure personAssent:boolean\n"
-    f"  measure emergencyLevel: scale(E1,E2,E3,E4,E5)\n"
-    f"  measure personStressLevel: scale(low,moderate,high)\n"
-    f"  constant MAX_TIME=8\n"
-    f"def_end\n\n"
-    f"rule_start\n"
-    f"  Rule1 when StartLunchTime then InformUser within 5 minutes \n"
-    f"        unless praying\n"
-    f"        unless timeSinceLastMeal>=MAX_TIME\n\n"
-    f"  Rule2 when DetectUserFallen then CallSupport within 2 minutes\n"
-    f"        unless not personAssent\n"
-    f"        unless emergencyLevel>=E4 then CallSupport\n\n"
-    f"  Rule3 when IdentifySafePath and noSafePath and not waiting then SoundWarning\n"
-    f"        unless personStressLevel>=moderate then Wait\n\n"
-    f"  Rule4 when DetectUserFallen and emergencyLevel<E2 then not CallSupport within 3 minutes\n\n"
-    f"  Rule5 when DetectUserFallen and emergencyLevel<E2 then not CallSupport within 2 minutes\n\n"
-    f"  Rule6 when SoundWarning then CallSupport within 2 minutes\n"
-    f"\tunless emergencyLevel>=E3 then CallSupport\n"
-    f"rule_end\n\n"
-    f"Let's analyse a set of conflicting rules first.\n\n"
-    f"Failed assertion:\n\n"
-    f"SLEECRule2Rule4 :[deadlock free]:\n"
-    f"    Log:\n"
-    f"        Result: Failed\n"
-    f"        Visited States: 820\n"
-    f"        Visited Transitions: 1,542\n"
-    f"        Visited Plys: 127\n"
-    f"        Estimated Total Storage: 201MB\n"
-    f"        Counterexample (Deadlock Counterexample)\n"
-    f"            Machine Debug:\n"
-    f"                SLEECRule2Rule4 (Failure Behaviour):\n"
-    f"                    Trace: <DetectUserFallen, τ, personAssent.true,\n"
-    f"                    emergencyLevel.E1, emergencyLevel.E1, τ, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, tock, tock, tock,\n"
-    f"                    tock, tock, tock, tock, tock, tock, tock, τ>\n"
-    f"                    Min Acceptance: {{}}\n\n"
-    f"Example interpretation of this:\n\n"
-    f"Conflicting Rules (1 of 1): {{\n"
-    f"\tError: {{\n"
-    f"\t\tRule Name: SLEECRule2Rule4\n"
-    f"\t\tRule 1: Rule2\n"
-    f"\t\tRule 2: Rule4\n"
-    f"\t\tScenario: These rules come into effect when a user has fallen. The rules dictate when and if to call support based upon wether the user assents to support being called, and the users emergency level.\n"
-    f"\t\tCategory: Deadlock due to timing\n"
-    f"\t\tJustification: In this scenario a user has fallen and assents to support being called. The user is of emergency level 1. In this case, Rule2 is asking for support to be called within 2 minutes (As the user has assented, and not of emergency level greater than or equal to E4). "
-    f"For a user of emergency level 1 (or more specifically, less than 2 as the rule states), Rule4 is asking for support to not be called for 3 minutes. Therefore these rules conflict as Rule2 is asking for support to be called within 2 minutes, and Rule4 is asking for support to not be called within 3 minutes, thus creating a deadlock due to timing.\n"
-    f"\t}},\n"
-    f"\tResolution: {{\n"
-    f"\t\tSuggestion: REMOVE Rule: Rule4\n\n"
-    f"\t\tJustification: Rule4 inhibts any user of emergencyLevel1 from getting support when they have fallen which could be unsafe as they may require assistance. If this is intentional, consider adding an 'unless emergencyLevel=E1 then not CallSupport' clause to Rule2 so that no timing deadlock is created.\n"
-    f"\t}}\n"
-    f"}}\n\n"
-    f"Now let's look at a deadlock example from the same ruleset:\n\n"
-    f"Failed assertion:\n\n"
-    f"not Rule5_wrt_Rule4 [T= Rule4_wrt_Rule5:\n"
-    f"    Log:\n"
-    f"        Result: Failed\n"
-    f"        Visited States: 1,104\n"
-    f"        Visited Transitions: 1,859\n"
-    f"        Visited Plys: 365\n"
-    f"        Estimated Total Storage: 201MB\n\n"
-    f"Example interpretation of this:\n\n"
-    f"Redundant Rules (1 of 1): {{\n"
-    f"\tError: {{\n"
-    f"\t\tRule Name: Rule5_wrt_Rule4\n"
-    f"\t\tRule 1: Rule4\n"
-    f"\t\tRule 2: Rule5\n"
-    f"\t\tScenario: Both of these rules come into effect when a user has fallen but is of emergencyLevel<E1.\n"
-    f"\t\tJustification: These rules are redundant, as they are both requesting the same action (not CallSupport) but with different timeframes. In Rule4 support cannot be called within 3 minutes, whereas in rule 5 support cannot be called within 2 minutes. "
-    f"If support is not called within 3 minutes, logically it cannot have been called within 2 either, therefore Rule5 is redundant here.\n"
-    f"\t}},\n"
-    f"\tResolution: {{\n"
-    f"\t\tSuggestion: REMOVE RULE: Rule5\n\n"
-    f"\t\tJustification: Rule5 is redundant here as not call support within 3 minutes (As suggested in Rule4), you also cannot call support within 2 minutes. As they both apply to the exact same scenario, rule5 is redundant here and can simply be removed.\n"
-    f"\t}}\n"
-    f"}}\n\n"
-    f"You must now analyse the following SLEEC ruleset and the resulting output from the verification tool to generate your responses for EACH and EVERY failed assertion. Please start your response with the following header:\n"
-    f"Total Rule Issues Discovered: {{a single integer of the total number of conflicting rules and redudant rules found in the ruleset}} | Conflicts: {{a single integer of the amount of conflicting rules found in the ruleset}} | Redundancies: {{a single integer of redundant rules found in the ruleset}}\n"
-    f"The number of total issues should be equal to the sum of conflicts and redundancies, and also match the number of rule-rule conflicts outputted underneath.\n\n"
-    f"Remember to use the specified templates and that any assertion with 'Result: Passed' can be ignored. Please make sure to correctly title conflicting and redundant rules in your responses. Your response should contain no extra words outside of the template, however please use dashes (e.g. \"-----------\") to create spacers between each rule-rule conflict template.\n\n"
-    f"SLEEC Ruleset:\n\n{sleec_ruleset}\n\n"
-    f"Verification output:\n\n{assertions_output}\n\n"
-    f"To assist in this, I have also provided a PDF with some more infomation as to the details and abilities of the agent behind this ruleset: {agent_text}"
-)
-
-
-        
-        status_var.set("Forwarding Prompt to LLM ...")
+                llm_response = llm_error(analysis.backend, e)
+                if streamed:
+                    on_text("\n\n" + llm_response)
+            stage.update(usage)
+            if not usage.get("completion_tokens"):
+                stage["response_tokens"] = estimate_tokens(llm_response)
+        if len(remaining) < len(failed) and not cancelled and not llm_response.startswith("Error calling LLM backend"):
+            llm_response = merge_reused_sections(analysis, failed, reused, llm_response)
+            if streamed and on_replace:
+                on_replace(llm_response)
+    if validate_reports and failed and not from_cache and not cancelled and not llm_response.startswith("Error calling LLM backend"):
+        status("Checking report ...")
+        with analysis.trace.stage("report_validation") as stage:
+            usage = Counter()
+            try:
+                checked, findings = validate_report(analysis, llm_response, failed, cancel, usage)
+                stage.update(findings)
+            except asyncio.CancelledError:
+                checked, findings, cancelled = llm_response, {}, True
+            stage.update(usage)
+        if findings and report_findings_note(findings):
+            analysis.notes.append(report_findings_note(findings))
+        if checked != llm_response:
+            llm_response = checked
+            if streamed and on_replace:
+                on_replace(llm_response)
+    if on_text and not streamed:
+        on_text(llm_response)
+    llm_stage = next((stage for stage in reversed(analysis.trace.stages) if stage["stage"] == "llm_request"), {}) if not from_cache else {}
+    if prompt_cache_note(llm_stage):
+        analysis.notes.append(prompt_cache_note(llm_stage))
+    if cancelled:
+        analysis.notes.append("Request cancelled.")
+    elif not from_cache and "Error calling LLM backend" not in llm_response:
+        store_response(cache_key, analysis.model, llm_response)
+        index_analyses(analysis, failed, llm_response)
+    return llm_response
+
+@dataclass
+class ModelRuleAnalysis: # Everything gathered for one Model-Rule analysis before it is sent to the LLM.
+    model: str
+    backend: str = ""
+    sleec_ruleset: str = ""
+    records: list = field(default_factory=list)
+    sections: list = field(default_factory=list) # (failed assertion as shown to the LLM, model slice) for each failed assertion
+    error: str = ""
+    sleec_spec_text: str = ""
+    agent_text: str = ""
+    notes: list = field(default_factory=list)
+    trace: RunTrace = field(default_factory=RunTrace)
+
+def prepare_model_rule_analysis(sleec_path, verification_path, system_path, sleec_spec_path, agent_spec_path, model, backend=None): # Reads the inputs, verifies the system model against the rules and slices the model for each failed assertion.
+    backend = backend or llm_backend
+    analysis = ModelRuleAnalysis(model=backend_model(backend, model), backend=backend)
+    analysis.trace.label = os.path.basename(verification_path or system_path or "")
+    if sleec_path:
+        with analysis.trace.stage("read_ruleset") as stage:
+            try:
+                with open(sleec_path, "r", encoding="utf-8") as f:
+                    analysis.sleec_ruleset = f.read()
+            except Exception as e:
+                analysis.sleec_ruleset = "Error reading SLEEC file: " + str(e)
+            stage["bytes"] = len(analysis.sleec_ruleset.encode("utf-8"))
+    system_model = ""
+    if system_path:
+        with analysis.trace.stage("index_model") as stage:
+            try:
+                with open(system_path, "r", encoding="utf-8") as f:
+                    system_model = f.read()
+                stage["elements"] = len(model_index(system_model).elements)
+            except Exception as e:
+                analysis.notes.append(f"System model not used ({e}).")
+            stage["bytes"] = len(system_model.encode("utf-8"))
+    if not verification_path:
+        analysis.error = "No verification assertions file (csp-gen/timed/verification_assertions.csp) was found."
+        return analysis
+    with analysis.trace.stage("verification") as stage:
         try:
-            client = OpenAI(api_key="----------------------------REPLACE THIS TEXT WITH YOUR OPENAI API KEY-------------------------------")
-            completion = client.chat.completions.create(
-                model=gpt_model_selector.get(),
-                messages=[{"role": "user", "content": final_prompt}]
-            )
-            llm_response = completion.choices[0].message.content.strip()
+            analysis.records = verify_assertions(verification_path)
         except Exception as e:
-            llm_response = f"Error calling OpenAI: {e}"
-    
-        llm_response_textbox.delete("1.0", "end")
-        llm_response_textbox.insert("end", llm_response)
-    
+            analysis.error = "Error running refines: " + str(e)
+        stage["assertions"] = len(analysis.records)
+        stage["failed"] = sum(1 for record in analysis.records if record.failed)
+    with analysis.trace.stage("slice_model") as stage:
+        for record in analysis.records:
+            if record.failed:
+                _, query = model_rule_query(analysis.sleec_ruleset, record)
+                analysis.sections.append((format_assertion(record, compact_traces), model_slice(model_index(system_model), query, model_slice_tokens) if system_model else ""))
+        stage["tokens"] = sum(estimate_tokens(model_part) for _, model_part in analysis.sections)
+        if system_model and analysis.sections:
+            analysis.notes.append(f"Model slices average {stage['tokens'] // len(analysis.sections):,} tokens (whole model {estimate_tokens(system_model):,}).")
+    if sleec_spec_path:
+        with analysis.trace.stage("read_sleec_spec") as stage:
+            analysis.sleec_spec_text = read_pdf(sleec_spec_path)
+            stage["bytes"] = len(analysis.sleec_spec_text.encode("utf-8"))
+    if agent_spec_path:
+        with analysis.trace.stage("read_agent_spec") as stage:
+            analysis.agent_text = read_pdf(agent_spec_path)
+            stage["bytes"] = len(analysis.agent_text.encode("utf-8"))
+    with analysis.trace.stage("fit_supplements") as stage:
+        budget = token_budget(backend, model)
+        query = search_terms(" ".join(assertion for assertion, _ in analysis.sections))
+        (analysis.sleec_spec_text, analysis.agent_text), trimmed = fit_supplements_to_budget([analysis.sleec_spec_text, analysis.agent_text], query, budget)
+        if trimmed:
+            analysis.notes.append(f"Specifications trimmed to the {budget:,} token budget.")
+        stage["tokens"] = estimate_tokens(analysis.sleec_spec_text) + estimate_tokens(analysis.agent_text)
+    return analysis
+
+def analyse_model_rule(analysis, bypass_cache=False, status=lambda message: None, on_text=None, cancel=None): # Sends each failed assertion with its model slice to the LLM and assembles the report.
+    if analysis.error:
+        report = analysis.error
+    elif not analysis.sections:
+        errors = [record for record in analysis.records if record.result.startswith("Error")]
+        report = f"Total Model-Rule Issues Discovered: 0\n\nThe system model satisfies {len(analysis.records) - len(errors)} of {len(analysis.records)} verification assertions."
+        if errors:
+            report += " These could not be checked:\n\n" + "\n".join(record.name + ": " + record.result for record in errors)
     else:
-        placeholder = (
-            "Placeholder: Model-Rule anaylsis hasn't been implemented yet. If you wish to add this, the framework has already been implemented with the system model and verifiction assertions files."
-        )
-        llm_response_textbox.delete("1.0", "end")
-        llm_response_textbox.insert("end", placeholder)
-    
-    spinner.stop()
-    status_var.set("Analysis Complete.")
-    analysis_text.set("Analysis Generated")
-
-def start_analysis_thread():
-    threading.Thread(target=build_prompt, daemon=True).start()
-
-# User Interface. Quickly modify the style with ttkbootstrap themes. Currently using 'united'.
-root = tb.Window(themename="united")
-root.title("SLEEC Ruleset Analysis Tool")
-root.geometry("1400x800")
-
-# File selection section
-file_selection_frame = ttk.Frame(root, padding=10, borderwidth=2, relief="ridge")
-file_selection_frame.pack(side="left", anchor="nw", fill="y", padx=10, pady=10)
-ttk.Label(file_selection_frame, text="File Selector", bootstyle="primary").pack(pady=5)
-
-# SLEEC file section
-sleec_frame = ttk.Frame(file_selection_frame)
-sleec_frame.pack(fill="x", pady=5)
-ttk.Label(sleec_frame, text="SLEEC Ruleset:", bootstyle="info").pack()
-sleec_selector = ttk.Combobox(sleec_frame, width=30, state="readonly")
-sleec_selector.pack(pady=5)
-sleec_selector.bind("<<ComboboxSelected>>", lambda e: read_sleec_file())
-sleec_textbox = ScrolledText(sleec_frame, wrap="word", height=10, width=50)
-sleec_textbox.pack(pady=5)
-
-# Assertions file section
-assertions_frame = ttk.Frame(file_selection_frame)
-assertions_frame.pack(fill="x", pady=5)
-ttk.Label(assertions_frame, text="Generated Assertions:", bootstyle="info").pack()
-assertions_selector = ttk.Combobox(assertions_frame, width=30, state="readonly")
-assertions_selector.pack(pady=5)
-assertions_selector.bind("<<ComboboxSelected>>", lambda e: select_assertions_file())
-assertions_textbox = ttk.Entry(assertions_frame, width=50, state="readonly")
-assertions_textbox.pack(pady=5)
-
-# Verification file section
-verification_frame = ttk.Frame(file_selection_frame)
-verification_frame.pack(fill="x", pady=5)
-ttk.Label(verification_frame, text="Verification Assertions:", bootstyle="info").pack()
-verification_selector = ttk.Combobox(verification_frame, width=30, state="readonly")
-verification_selector.pack(pady=5)
-verification_selector.bind("<<ComboboxSelected>>", lambda e: select_verification_file())
-verification_textbox = ttk.Entry(verification_frame, width=50, state="readonly")
-verification_textbox.pack(pady=5)
-
-# System file section
-system_frame = ttk.Frame(file_selection_frame)
-system_frame.pack(fill="x", pady=5)
-ttk.Label(system_frame, text="System Model:", bootstyle="info").pack()
-system_selector = ttk.Combobox(system_frame, width=30, state="readonly")
-system_selector.pack(pady=5)
-system_selector.bind("<<ComboboxSelected>>", lambda e: read_system_file())
-system_textbox = ScrolledText(system_frame, wrap="word", height=10, width=50)
-system_textbox.pack(pady=5)
-
-# Right side main content section
-right_side_frame = ttk.Frame(root)
-right_side_frame.pack(side="right", fill="both", expand=True, padx=10, pady=10)
-
-# Top right container section
-top_right_container = ttk.Frame(right_side_frame)
-top_right_container.pack(fill="x", pady=5)
-
-# Prompt supplements section
-prompt_supplements_frame = ttk.Frame(top_right_container, padding=10, borderwidth=2, relief="ridge")
-prompt_supplements_frame.pack(side="left", fill="both", expand=True, padx=5)
-ttk.Label(prompt_supplements_frame, text="Prompt supplements", bootstyle="primary").pack(pady=5)
-
-# SLEEC specification
-ttk.Label(prompt_supplements_frame, text="SLEEC Specification", bootstyle="info").pack()
-prompt_sleec_selector = ttk.Combobox(prompt_supplements_frame, width=30, state="readonly")
-prompt_sleec_selector.pack(pady=5)
-prompt_sleec_selector.bind("<<ComboboxSelected>>", lambda e: select_prompt_sleec_file())
-prompt_sleec_entry = ttk.Entry(prompt_supplements_frame, width=50, state="readonly")
-prompt_sleec_entry.pack(pady=5)
-
-# Agent specification
-ttk.Label(prompt_supplements_frame, text="Agent Specification", bootstyle="info").pack(pady=5)
-prompt_agent_selector = ttk.Combobox(prompt_supplements_frame, width=30, state="readonly")
-prompt_agent_selector.pack(pady=5)
-prompt_agent_selector.bind("<<ComboboxSelected>>", lambda e: select_prompt_agent_file())
-prompt_agent_entry = ttk.Entry(prompt_supplements_frame, width=50, state="readonly")
-prompt_agent_entry.pack(pady=5)
-
-# Model selector section
-model_selector_frame = ttk.Frame(top_right_container, padding=10, borderwidth=2, relief="ridge")
-model_selector_frame.pack(side="right", fill="both", expand=True, padx=5)
-ttk.Label(model_selector_frame, text="Model Selector", bootstyle="primary").pack(pady=5)
-
-# GPT model dropdown
-ttk.Label(model_selector_frame, text="GPT Model:", bootstyle="info").pack()
-ttk.Label(model_selector_frame, text="Recommended: o3-mini", bootstyle="info", font=("TkDefaultFont", 8,"bold", "italic")).pack()
-gpt_model_selector = ttk.Combobox(model_selector_frame, width=30, state="readonly")
-gpt_model_selector["values"] = ["o3-mini", "o1", "o1-mini", "gpt-4o", "gpt-4.5-preview"]
-gpt_model_selector.current(0)
-gpt_model_selector.pack(pady=5)
-
-# Frame for side by side rule-rule and mode-rule checkboxes
-checkbox_frame = ttk.Frame(model_selector_frame)
-checkbox_frame.pack(pady=5)
-rule_rule_var = BooleanVar()
-model_rule_var = BooleanVar()
-rule_rule_checkbox = ttk.Checkbutton(checkbox_frame, text="Analyse Rule-Rule Conflicts", variable=rule_rule_var, command=update_analysis_text)
-rule_rule_checkbox.pack(side="left", padx=10)
-model_rule_checkbox = ttk.Checkbutton(checkbox_frame, text="Analyse Model-Rule Conflicts", variable=model_rule_var, command=update_analysis_text)
-model_rule_checkbox.pack(side="left", padx=10)
-
-# Analysis status
-analysis_text = StringVar(value="Select an analysis option")
-analysis_textbox = ttk.Entry(model_selector_frame, width=60, state="readonly", textvariable=analysis_text)
-analysis_textbox.pack(pady=10)
-
-# Start Analysis button
-analysis_button = ttk.Button(model_selector_frame, text="Pass to LLM for Analysis", command=start_analysis_thread)
-analysis_button.pack(pady=5)
-
-# Progress bar and status label under analysis button
-spinner = ttk.Progressbar(model_selector_frame, mode="indeterminate", length=200)
-spinner.pack(pady=5)
-status_var = StringVar(value="Idle")
-status_label = ttk.Label(model_selector_frame, textvariable=status_var, bootstyle="info")
-status_label.pack(pady=5)
-
-# LLM response section
-llm_response_frame = ttk.Frame(right_side_frame, padding=10, borderwidth=2, relief="ridge")
-llm_response_frame.pack(fill="both", expand=True, padx=5, pady=5)
-ttk.Label(llm_response_frame, text="SLEEC Validation Report", bootstyle="info").pack(pady=5)
-llm_response_textbox = ScrolledText(llm_response_frame, wrap="word", height=20, width=70)
-llm_response_textbox.pack(pady=5, fill="both", expand=True)
-
-update_dropdowns()
-root.mainloop()
+        cache_key = response_cache_key(analysis.model, "model-rule", analysis.sleec_ruleset, "\n".join(assertion + "\n" + model_part for assertion, model_part in analysis.sections), [analysis.sleec_spec_text, analysis.agent_text])
+        report = None if bypass_cache else cached_response(cache_key)
+        if report is not None:
+            analysis.notes.append("Report loaded from the response cache.")
+        else:
+            titles = [f"Model-Rule Conflict ({i} of {len(analysis.sections)})" for i in range(1, len(analysis.sections) + 1)]
+            prompts = [build_model_rule_prompt(analysis.sleec_spec_text, analysis.sleec_ruleset, assertion, model_part, title, analysis.agent_text) for (assertion, model_part), title in zip(analysis.sections, titles)]
+            status(f"Forwarding {len(prompts)} failed assertions to LLM ...")
+            with analysis.trace.stage("llm_request", requests=len(prompts), prompt_tokens=sum(estimate_tokens(prompt) for prompt in prompts)) as stage:
+                usage = Counter()
+                try:
+                    responses = run_llm(request_completions(prompts, analysis.model, cancel, usage, analysis.backend))
+                except asyncio.CancelledError:
+                    responses = None
+                    analysis.notes.append("Request cancelled.")
+                report = ""
+                if responses is not None:
+                    title_pattern = r"Model-Rule Conflict \(\d+ of \d+\)"
+                    sections = [re.sub(title_pattern, lambda _: title, response, count=1) if re.search(title_pattern, response) else title + ": " + response for title, response in zip(titles, responses)]
+                    report = f"Total Model-Rule Issues Discovered: {len(sections)}\n\n" + "\n-----------\n".join(sections)
+                    if not any(response.startswith("Error calling LLM backend") for response in responses):
+                        store_response(cache_key, analysis.model, report)
+                stage.update(usage)
+                stage["response_tokens"] = estimate_tokens(report)
+            if prompt_cache_note(usage):
+                analysis.notes.append(prompt_cache_note(usage))
+    if on_text:
+        on_text(report)
+    return report
+
+ui_queue = queue.Queue()
+
+def ui_call(function, *args, **kwargs): # Widgets may only be used from the Tk main loop, so worker threads queue their updates here for drain_ui_queue to run.
+    ui_queue.put((function, args, kwargs))
+
+def drain_ui_queue():
+    for _ in range(500): # Bounded so a burst of streamed text cannot starve the rest of the UI
+        try:
+            function, args, kwargs = ui_queue.get_nowait()
+        except queue.Empty:
+            break
+        function(*args, **kwargs)
+    flush_report_backlog()
+    root.after(50, drain_ui_queue)
+
+report_backlog = [] # Report text waiting to be shown. Only used on the Tk thread.
+
+def append_report_text(text):
+    report_backlog.append(text)
+
+def replace_report_text(text): # Shows a corrected report in place of the one streamed so far.
+    report_backlog.clear()
+    llm_response_textbox.delete("1.0", "end")
+    report_backlog.append(text)
+
+def flush_report_backlog(): # Inserts the next slice of the report, so a large report is shown over several ticks instead of freezing the window.
+    if not report_backlog:
+        return
+    pending = "".join(report_backlog)
+    report_backlog.clear()
+    if len(pending) > report_insert_chars:
+        report_backlog.append(pending[report_insert_chars:])
+    llm_response_textbox.insert("end", pending[:report_insert_chars])
+    llm_response_textbox.see("end")
+
+def stage_memory(stage): # The stage's own peak when the run was profiled, otherwise how far it raised the process peak, which is all the OS reports without tracing.
+    if stage["peak_memory_mb"] is not None:
+        return f"{stage['peak_memory_mb']} MB"
+    if stage["process_peak_growth_mb"] is not None:
+        return f"+{stage['process_peak_growth_mb']} MB (process {stage['process_peak_memory_mb']} MB)"
+    return ""
+
+def show_run_trace(trace): # Fills the run breakdown table with the stages of the last run.
+    run_breakdown.delete(*run_breakdown.get_children())
+    for stage in trace.stages:
+        memory = stage_memory(stage)
+        run_breakdown.insert("", "end", values=(stage["stage"], f"{stage['wall_s']:.2f} s", f"{stage['cpu_s'] + stage['child_cpu_s']:.2f} s", memory, stage_size(stage)))
+
+def build_prompt(options): # Runs on a worker thread. All widget updates go through ui_call.
+    if options.get("profile"):
+        ui_call(profile_var.set, False) # Profiling only applies to a single run
+        try:
+            _, report_path = profile_run(build_prompt, dict(options, profile=False))
+            ui_call(status_var.set, "Analysis Complete. Profile saved to " + report_path)
+        except Exception as e:
+            ui_call(status_var.set, "Profile not saved: " + str(e))
+        return
+    ui_call(spinner.start)
+    ui_call(status_var.set, "Building Prompt...")
+    run_notes, error = [], None
+    try:
+        if options["rule_rule"]:
+            analysis = prepare_rule_rule_analysis(options["sleec_path"], options["assertions_path"], options["sleec_spec_path"], options["agent_spec_path"], options["model"], options["fan_out"], options["backend"])
+            report = analyse_rule_rule(
+                analysis,
+                options["bypass_cache"],
+                lambda message: ui_call(status_var.set, message),
+                lambda text: ui_call(append_report_text, text),
+                cancel_event,
+                lambda text: ui_call(replace_report_text, text),
+            )
+            if options["verify_fixes"] and not cancel_event.is_set() and not report.startswith("Error calling LLM backend"):
+                annotated, _ = verify_suggested_fixes(analysis, report, lambda message: ui_call(status_var.set, message), cancel_event)
+                if annotated != report:
+                    ui_call(replace_report_text, annotated)
+            run_notes += analysis.notes
+            analysis.trace.write()
+            ui_call(show_run_trace, analysis.trace)
+        if options["model_rule"] and not cancel_event.is_set():
+            if options["rule_rule"]:
+                ui_call(append_report_text, "\n\n===========\n\n")
+            ui_call(status_var.set, "Verifying System Model...")
+            analysis = prepare_model_rule_analysis(options["sleec_path"], options["verification_path"], options["system_path"], options["sleec_spec_path"], options["agent_spec_path"], options["model"], options["backend"])
+            analyse_model_rule(
+                analysis,
+                options["bypass_cache"],
+                lambda message: ui_call(status_var.set, message),
+                lambda text: ui_call(append_report_text, text),
+                cancel_event,
+            )
+            run_notes += analysis.notes
+            analysis.trace.write()
+            ui_call(show_run_trace, analysis.trace)
+    except Exception as e: # Shown in the report pane, as the worker thread would otherwise end without a word
+        error = " ".join(str(e).split()) or type(e).__name__
+        ui_call(append_report_text, "\n\nError during analysis: " + error)
+    finally:
+        ui_call(spinner.stop)
+        outcome = f"Analysis Failed ({error})." if error else "Analysis Cancelled." if cancel_event.is_set() else "Analysis Complete."
+        ui_call(status_var.set, " ".join([outcome] + run_notes))
+        ui_call(analysis_text.set, "Analysis Failed" if error else "Analysis Generated")
+        ui_call(analysis_button.config, state="normal")
+        ui_call(cancel_button.config, state="disabled")
+
+def start_analysis_thread(): # Reads the selections on the Tk thread, then runs the analysis on a worker thread.
+    s_index = sleec_selector.current()
+    a_index = assertions_selector.current()
+    v_index = verification_selector.current()
+    m_index = system_selector.current()
+    options = {
+        "rule_rule": rule_rule_var.get(),
+        "model_rule": model_rule_var.get(),
+        "sleec_path": sleec_files[s_index] if s_index != -1 else None,
+        "assertions_path": assertions_files[a_index] if a_index != -1 else None,
+        "verification_path": verification_files[v_index] if v_index != -1 else None,
+        "system_path": system_files[m_index] if m_index != -1 else None,
+        "sleec_spec_path": prompt_sleec_files[0] if prompt_sleec_files else None,
+        "agent_spec_path": prompt_agent_files[0] if prompt_agent_files else None,
+        "model": gpt_model_selector.get(),
+        "backend": backend_selector.get(),
+        "fan_out": fan_out_var.get(),
+        "verify_fixes": verify_fixes_var.get(),
+        "bypass_cache": bypass_cache_var.get(),
+        "profile": profile_var.get(),
+    }
+    cancel_event.clear()
+    analysis_button.config(state="disabled")
+    cancel_button.config(state="normal")
+    llm_response_textbox.delete("1.0", "end")
+    report_backlog.clear()
+    threading.Thread(target=build_prompt, args=(options,), daemon=True).start()
+
+def cancel_analysis():
+    cancel_event.set()
+    status_var.set("Cancelling...")
+
+cancel_event = threading.Event()
+
+def project_jobs(project_dir): # One Rule-Rule analysis per generated assertions file in a project, each paired with the ruleset it was generated from.
+    sleec_files, assertions_files, _, _ = load_files(project_dir)
+    sleec_spec_files, agent_spec_files = load_prompt_supplements(project_dir)
+    jobs = []
+    for assertions_path in sorted(assertions_files):
+        jobs.append({
+            "project": os.path.abspath(project_dir),
+            "ruleset": ruleset_for_assertions(assertions_path) or (sorted(sleec_files)[0] if sleec_files else None),
+            "assertions": assertions_path,
+            "sleec_spec": sleec_spec_files[0] if sleec_spec_files else None,
+            "agent_spec": agent_spec_files[0] if agent_spec_files else None,
+        })
+    if not jobs:
+        jobs.append({"project": os.path.abspath(project_dir), "ruleset": None, "assertions": None, "error": "No src-gen/*-assertions.csp file found"})
+    return jobs
+
+def verify_job(job, options): # Verification stage of a headless analysis.
+    started = time.perf_counter()
+    analysis = prepare_rule_rule_analysis(job["ruleset"], job["assertions"], job["sleec_spec"], job["agent_spec"], options.model, options.per_assertion, options.backend)
+    return analysis, time.perf_counter() - started
+
+def finish_job(job, verification, options): # LLM stage of a headless analysis. Returns the machine-readable result for the job.
+    result = {key: job.get(key) for key in ("project", "ruleset", "assertions")}
+    if "error" in job:
+        result["error"] = job["error"]
+        return result
+    try:
+        analysis, verification_time = verification.result()
+        started = time.perf_counter()
+        report = None if options.verify_only else analyse_rule_rule(analysis, options.bypass_cache)
+        checks = []
+        if options.verify_fixes and report and not report.startswith("Error calling LLM backend"):
+            report, checks = verify_suggested_fixes(analysis, report)
+        results = Counter("passed" if record.result == "Passed" else "failed" if record.failed else "errors" for record in analysis.records)
+        result.update({
+            "model": analysis.model,
+            "passed": results["passed"],
+            "failed": results["failed"],
+            "errors": results["errors"],
+            "failed_assertions": [{"name": record.name, "kind": record.kind, "output": format_assertion(record, compact_traces)} for record in analysis.records if record.failed],
+            "report": report,
+            "suggestion_checks": [asdict(check) for check in checks],
+            "notes": analysis.notes,
+            "timings": {"verification": round(verification_time, 3), "analysis": round(time.perf_counter() - started, 3)},
+            "trace": analysis.trace.to_dict(),
+        })
+        analysis.trace.write()
+        if analysis.assertions_output.startswith("Error running refines"):
+            result["error"] = analysis.assertions_output
+        elif report and report.startswith("Error calling LLM backend"):
+            result["error"] = report
+    except Exception as e:
+        result["error"] = str(e)
+    if options.output:
+        with open(os.path.join(options.output, result_file_name(job)), "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    return result
+
+def result_file_name(job): # e.g. ALMI-almi-1a2b3c4d.json. The hash of the assertions file's (or project's) path keeps projects with the same folder name apart.
+    name = os.path.basename(job["project"].rstrip(os.sep))
+    if job.get("assertions"):
+        name += "-" + os.path.basename(job["assertions"])[:-len("-assertions.csp")]
+    return name + "-" + hashlib.sha256(os.path.abspath(job.get("assertions") or job["project"]).encode("utf-8")).hexdigest()[:8] + ".json"
+
+def batch_analyses(analyses, options): # Batch mode: sends the prompts of every verified analysis as one batch and puts the reports in the response cache, where finish_job finds them.
+    # Analyses with a cached report are left out, and sections of alpha-equivalent assertions are reused from the analysis index instead of being requested.
+    # Requests the batch did not answer are sent directly. An analysis whose direct requests fail as well is left for finish_job to request in full.
+    lines, prompts_by_id, pending = {}, {}, []
+    api = backend_settings(options.backend)["api"]
+    for analysis in analyses:
+        key = analysis_cache_key(analysis)
+        if not options.bypass_cache and cached_response(key) is not None:
+            continue
+        failed = failed_assertions(analysis.records)
+        reused = None
+        if analysis_index and failed and not options.bypass_cache:
+            with analysis.trace.stage("analysis_index") as stage:
+                reused = reuse_analyses(analysis, failed)
+                stage["reused"] = sum(1 for section in reused if section is not None)
+            if stage["reused"]:
+                analysis.notes.append(f"{stage['reused']} of {len(failed)} failed assertions reused from the analysis index.")
+        prompts, assemble = analysis_prompts(analysis, reused)
+        ids = [f"{key[:32]}-{i}" for i in range(len(prompts))] # Identical analyses share their requests
+        for custom_id, prompt in zip(ids, prompts):
+            lines[custom_id] = batch_request_line(custom_id, prompt, analysis.model, api)
+            prompts_by_id[custom_id] = prompt
+        pending.append((analysis, key, ids, assemble))
+    batch_dir = options.output or os.path.join(cache_dir, "batches")
+    batch_id, results = None, {}
+    if lines:
+        os.makedirs(batch_dir, exist_ok=True)
+        batch_id, results = run_batch(options.backend, list(lines.values()), batch_dir, lambda message: print(message, file=sys.stderr))
+    for analysis, key, ids, assemble in pending:
+        with analysis.trace.stage("llm_batch", requests=len(ids)) as stage:
+            usage = Counter()
+            for custom_id in ids:
+                if custom_id in results:
+                    add_usage(usage, results[custom_id][1])
+            missing = [custom_id for custom_id in ids if custom_id not in results]
+            if missing: # Only the requests the batch did not answer are sent again
+                stage["direct_requests"] = len(missing)
+                print(f"Batch {batch_id} did not answer {len(missing)} requests, sending them directly ...", file=sys.stderr)
+                for custom_id, response in zip(missing, run_llm(request_completions([prompts_by_id[custom_id] for custom_id in missing], analysis.model, usage=usage, backend=options.backend))):
+                    if not response.startswith("Error calling LLM backend"):
+                        results[custom_id] = (response, None) # Its usage is already counted, and an identical analysis reuses the answer
+            if any(custom_id not in results for custom_id in ids):
+                stage.update(usage)
+                analysis.notes.append(f"Batch {batch_id} did not answer every request and they could not be sent directly, so the report was requested again.")
+                continue
+            report = assemble([results[custom_id][0] for custom_id in ids])
+            failed = failed_assertions(analysis.records)
+            if validate_reports and failed:
+                report, findings = validate_report(analysis, report, failed, usage=usage)
+                if report_findings_note(findings):
+                    analysis.notes.append(report_findings_note(findings))
+            stage.update(usage)
+        store_response(key, analysis.model, report)
+        index_analyses(analysis, failed, report)
+        if missing:
+            analysis.notes.append(f"Report generated by batch {batch_id}, with {len(missing)} of {len(ids)} requests sent directly.")
+        else:
+            analysis.notes.append(f"Report generated by batch {batch_id}." if ids else "Report assembled from the analysis index.")
+    if lines:
+        try:
+            os.remove(os.path.join(batch_dir, "batch_checkpoint.json")) # Every answer is in the response cache, so a rerun starts afresh
+        except OSError:
+            pass
+
+def run_headless(argv): # Analyses one or more SLEEC projects without the GUI and writes machine-readable results.
+    global refines_workers, refines_slots, verification_backend, llm_hedge_backend, llm_hedge_after, batch_poll_interval
+    parser = argparse.ArgumentParser(prog="SLEEC LLM Tool.py", description="Analyse SLEEC projects without the GUI. Each project folder uses the same layout as the GUI: *.sleec, src-gen/*-assertions.csp and LLM Resources.")
+    parser.add_argument("projects", nargs="+", help="SLEEC project folders to analyse")
+    parser.add_argument("--model", default="o3-mini", help="LLM model to use (default: o3-mini)")
+    parser.add_argument("--per-assertion", action="store_true", help="analyse each failed assertion in its own request")
+    parser.add_argument("--bypass-cache", action="store_true", help="ignore cached reports and request fresh analyses")
+    parser.add_argument("--verify-only", action="store_true", help="run the verification without calling the LLM")
+    parser.add_argument("--verify-fixes", action="store_true", default=verify_suggestions and bool(sleec_generator_command), help="apply each suggested fix to a copy of the ruleset and re-check the assertions it affects (needs sleec_generator_command)")
+    parser.add_argument("--output", help="folder to write a JSON result per ruleset and a summary.jsonl into (default: JSON lines on stdout)")
+    parser.add_argument("--verify-workers", type=int, default=2, help="projects verified at the same time (default: 2)")
+    parser.add_argument("--llm-workers", type=int, default=4, help="LLM analyses run at the same time (default: 4)")
+    parser.add_argument("--refines-workers", type=int, default=refines_workers, help="refines processes (or FDR sessions) shared by all projects (default: one per CPU core)")
+    parser.add_argument("--verification-backend", choices=["refines"] + list(session_backends), default=verification_backend, help=f"how assertions are checked (default: {verification_backend})")
+    parser.add_argument("--backend", choices=list(llm_backends), default=llm_backend, help=f"LLM backend to send prompts to (default: {llm_backend})")
+    parser.add_argument("--hedge-backend", choices=list(llm_backends), default=llm_hedge_backend, help="backend to race when a request is slow (default: no hedging)")
+    parser.add_argument("--hedge-after", type=float, default=llm_hedge_after, help=f"seconds before a slow request is hedged (default: {llm_hedge_after})")
+    parser.add_argument("--batch", action="store_true", help="send every prompt as one request to the backend's Batch API and wait for it, resuming an interrupted batch")
+    parser.add_argument("--batch-poll-interval", type=float, default=batch_poll_interval, help=f"seconds between checks on a batch (default: {batch_poll_interval})")
+    options = parser.parse_args(argv)
+    if options.verify_fixes and not sleec_generator_command:
+        parser.error("--verify-fixes needs sleec_generator_command to be set at the top of the script")
+
+    llm_hedge_backend, llm_hedge_after = options.hedge_backend, options.hedge_after
+    batch_poll_interval = options.batch_poll_interval
+    refines_workers = max(1, options.refines_workers)
+    refines_slots = threading.BoundedSemaphore(refines_workers)
+    verification_backend = options.verification_backend
+    if options.output:
+        os.makedirs(options.output, exist_ok=True)
+
+    # Verification and LLM stages are pipelined: as soon as a project is verified its LLM analysis starts, while the next project is still being verified.
+    jobs = [job for project in options.projects for job in project_jobs(project)]
+    with ThreadPoolExecutor(max_workers=max(1, options.verify_workers)) as verify_pool, ThreadPoolExecutor(max_workers=max(1, options.llm_workers)) as llm_pool:
+        verifications = {}
+        for index, job in enumerate(jobs):
+            if "error" not in job:
+                verifications[verify_pool.submit(verify_job, job, options)] = index
+        finished = {index: llm_pool.submit(finish_job, job, None, options) for index, job in enumerate(jobs) if "error" in job}
+        finish_options = options
+        if options.batch and not options.verify_only: # The batch needs every prompt, so the LLM stage waits for all the verifications
+            try:
+                batch_analyses([verification.result()[0] for verification in verifications if verification.exception() is None], options)
+            except Exception as e:
+                print(f"Batch failed: {e}. Run again to resume it.", file=sys.stderr)
+                return 1
+            finish_options = argparse.Namespace(**dict(vars(options), bypass_cache=False)) # The reports are now in the response cache
+        for verification in as_completed(verifications):
+            index = verifications[verification]
+            finished[index] = llm_pool.submit(finish_job, jobs[index], verification, finish_options)
+        results = [finished[index].result() for index in range(len(jobs))]
+
+    summary = open(os.path.join(options.output, "summary.jsonl"), "w", encoding="utf-8") if options.output else None
+    for result in results:
+        line = {key: value for key, value in result.items() if key not in ("report", "failed_assertions", "suggestion_checks", "trace")} if summary else result
+        print(json.dumps(line, ensure_ascii=False))
+        if summary:
+            summary.write(json.dumps(line, ensure_ascii=False) + "\n")
+    if summary:
+        summary.close()
+    return 1 if any("error" in result for result in results) else 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1: # Headless mode when project folders are given on the command line
+        sys.exit(run_headless(sys.argv[1:]))
+
+    # User Interface. Quickly modify the style with ttkbootstrap themes. Currently using 'united'.
+    root = tb.Window(themename="united")
+    root.title("SLEEC Ruleset Analysis Tool")
+    root.geometry("1400x800")
+
+    # File selection section
+    file_selection_frame = ttk.Frame(root, padding=10, borderwidth=2, relief="ridge")
+    file_selection_frame.pack(side="left", anchor="nw", fill="y", padx=10, pady=10)
+    ttk.Label(file_selection_frame, text="File Selector", bootstyle="primary").pack(pady=5)
+
+    # SLEEC file section
+    sleec_frame = ttk.Frame(file_selection_frame)
+    sleec_frame.pack(fill="x", pady=5)
+    ttk.Label(sleec_frame, text="SLEEC Ruleset:", bootstyle="info").pack()
+    sleec_selector = ttk.Combobox(sleec_frame, width=30, state="readonly")
+    sleec_selector.pack(pady=5)
+    sleec_selector.bind("<<ComboboxSelected>>", lambda e: read_sleec_file())
+    sleec_textbox = LazyFileView(sleec_frame, height=10, width=50)
+    sleec_textbox.pack(pady=5)
+
+    # Assertions file section
+    assertions_frame = ttk.Frame(file_selection_frame)
+    assertions_frame.pack(fill="x", pady=5)
+    ttk.Label(assertions_frame, text="Generated Assertions:", bootstyle="info").pack()
+    assertions_selector = ttk.Combobox(assertions_frame, width=30, state="readonly")
+    assertions_selector.pack(pady=5)
+    assertions_selector.bind("<<ComboboxSelected>>", lambda e: select_assertions_file())
+    assertions_textbox = ttk.Entry(assertions_frame, width=50, state="readonly")
+    assertions_textbox.pack(pady=5)
+
+    # Verification file section
+    verification_frame = ttk.Frame(file_selection_frame)
+    verification_frame.pack(fill="x", pady=5)
+    ttk.Label(verification_frame, text="Verification Assertions:", bootstyle="info").pack()
+    verification_selector = ttk.Combobox(verification_frame, width=30, state="readonly")
+    verification_selector.pack(pady=5)
+    verification_selector.bind("<<ComboboxSelected>>", lambda e: select_verification_file())
+    verification_textbox = ttk.Entry(verification_frame, width=50, state="readonly")
+    verification_textbox.pack(pady=5)
+
+    # System file section
+    system_frame = ttk.Frame(file_selection_frame)
+    system_frame.pack(fill="x", pady=5)
+    ttk.Label(system_frame, text="System Model:", bootstyle="info").pack()
+    system_selector = ttk.Combobox(system_frame, width=30, state="readonly")
+    system_selector.pack(pady=5)
+    system_selector.bind("<<ComboboxSelected>>", lambda e: read_system_file())
+    system_textbox = LazyFileView(system_frame, height=10, width=50)
+    system_textbox.pack(pady=5)
+
+    # Right side main content section
+    right_side_frame = ttk.Frame(root)
+    right_side_frame.pack(side="right", fill="both", expand=True, padx=10, pady=10)
+
+    # Top right container section
+    top_right_container = ttk.Frame(right_side_frame)
+    top_right_container.pack(fill="x", pady=5)
+
+    # Prompt supplements section
+    prompt_supplements_frame = ttk.Frame(top_right_container, padding=10, borderwidth=2, relief="ridge")
+    prompt_supplements_frame.pack(side="left", fill="both", expand=True, padx=5)
+    ttk.Label(prompt_supplements_frame, text="Prompt supplements", bootstyle="primary").pack(pady=5)
+
+    # SLEEC specification
+    ttk.Label(prompt_supplements_frame, text="SLEEC Specification", bootstyle="info").pack()
+    prompt_sleec_selector = ttk.Combobox(prompt_supplements_frame, width=30, state="readonly")
+    prompt_sleec_selector.pack(pady=5)
+    prompt_sleec_selector.bind("<<ComboboxSelected>>", lambda e: select_prompt_sleec_file())
+    prompt_sleec_entry = ttk.Entry(prompt_supplements_frame, width=50, state="readonly")
+    prompt_sleec_entry.pack(pady=5)
+
+    # Agent specification
+    ttk.Label(prompt_supplements_frame, text="Agent Specification", bootstyle="info").pack(pady=5)
+    prompt_agent_selector = ttk.Combobox(prompt_supplements_frame, width=30, state="readonly")
+    prompt_agent_selector.pack(pady=5)
+    prompt_agent_selector.bind("<<ComboboxSelected>>", lambda e: select_prompt_agent_file())
+    prompt_agent_entry = ttk.Entry(prompt_supplements_frame, width=50, state="readonly")
+    prompt_agent_entry.pack(pady=5)
+
+    # Model selector section
+    model_selector_frame = ttk.Frame(top_right_container, padding=10, borderwidth=2, relief="ridge")
+    model_selector_frame.pack(side="right", fill="both", expand=True, padx=5)
+    ttk.Label(model_selector_frame, text="Model Selector", bootstyle="primary").pack(pady=5)
+
+    # GPT model dropdown
+    ttk.Label(model_selector_frame, text="GPT Model:", bootstyle="info").pack()
+    ttk.Label(model_selector_frame, text="Recommended: o3-mini", bootstyle="info", font=("TkDefaultFont", 8,"bold", "italic")).pack()
+    gpt_model_selector = ttk.Combobox(model_selector_frame, width=30, state="readonly")
+    gpt_model_selector["values"] = ["o3-mini", "o1", "o1-mini", "gpt-4o", "gpt-4.5-preview"]
+    gpt_model_selector.current(0)
+    gpt_model_selector.pack(pady=5)
+
+    # LLM backend dropdown. Backends that name their own model (e.g. a local server) use it in place of the GPT model.
+    ttk.Label(model_selector_frame, text="LLM Backend:", bootstyle="info").pack()
+    backend_selector = ttk.Combobox(model_selector_frame, width=30, state="readonly")
+    backend_selector["values"] = list(llm_backends)
+    backend_selector.current(list(llm_backends).index(llm_backend))
+    backend_selector.pack(pady=5)
+
+    # Frame for side by side rule-rule and mode-rule checkboxes
+    checkbox_frame = ttk.Frame(model_selector_frame)
+    checkbox_frame.pack(pady=5)
+    rule_rule_var = BooleanVar()
+    model_rule_var = BooleanVar()
+    rule_rule_checkbox = ttk.Checkbutton(checkbox_frame, text="Analyse Rule-Rule Conflicts", variable=rule_rule_var, command=update_analysis_text)
+    rule_rule_checkbox.pack(side="left", padx=10)
+    model_rule_checkbox = ttk.Checkbutton(checkbox_frame, text="Analyse Model-Rule Conflicts", variable=model_rule_var, command=update_analysis_text)
+    model_rule_checkbox.pack(side="left", padx=10)
+
+    # Per-assertion analysis option
+    fan_out_var = BooleanVar()
+    fan_out_checkbox = ttk.Checkbutton(model_selector_frame, text="Analyse each failed assertion separately", variable=fan_out_var)
+    fan_out_checkbox.pack(pady=5)
+
+    # Suggested fix verification option
+    verify_fixes_var = BooleanVar(value=verify_suggestions and bool(sleec_generator_command))
+    verify_fixes_checkbox = ttk.Checkbutton(model_selector_frame, text="Verify suggested fixes" if sleec_generator_command else "Verify suggested fixes (set sleec_generator_command)",
+                                            variable=verify_fixes_var, state="normal" if sleec_generator_command else "disabled")
+    verify_fixes_checkbox.pack(pady=5)
+
+    # Response cache option
+    bypass_cache_var = BooleanVar()
+    bypass_cache_checkbox = ttk.Checkbutton(model_selector_frame, text="Bypass response cache", variable=bypass_cache_var)
+    bypass_cache_checkbox.pack(pady=5)
+
+    # Analysis status
+    analysis_text = StringVar(value="Select an analysis option")
+    analysis_textbox = ttk.Entry(model_selector_frame, width=60, state="readonly", textvariable=analysis_text)
+    analysis_textbox.pack(pady=10)
+
+    # Start Analysis button
+    analysis_button = ttk.Button(model_selector_frame, text="Pass to LLM for Analysis", command=start_analysis_thread)
+    analysis_button.pack(pady=5)
+    cancel_button = ttk.Button(model_selector_frame, text="Cancel", command=cancel_analysis, state="disabled", bootstyle="secondary")
+    cancel_button.pack(pady=5)
+
+    # Progress bar and status label under analysis button
+    spinner = ttk.Progressbar(model_selector_frame, mode="indeterminate", length=200)
+    spinner.pack(pady=5)
+    status_var = StringVar(value="Idle")
+    status_label = ttk.Label(model_selector_frame, textvariable=status_var, bootstyle="info")
+    status_label.pack(pady=5)
+
+    # Per-stage breakdown of the last run, and the option to profile the next one
+    run_breakdown = ttk.Treeview(model_selector_frame, columns=("stage", "wall", "cpu", "memory", "size"), show="headings", height=6)
+    for column, heading, width in (("stage", "Stage", 110), ("wall", "Wall", 60), ("cpu", "CPU", 60), ("memory", "Peak Memory", 150), ("size", "Processed", 200)):
+        run_breakdown.heading(column, text=heading)
+        run_breakdown.column(column, width=width, stretch=column == "size")
+    run_breakdown.pack(pady=5, fill="x")
+    profile_var = BooleanVar()
+    profile_checkbox = ttk.Checkbutton(model_selector_frame, text="Profile next run", variable=profile_var)
+    profile_checkbox.pack(pady=5)
+
+    # LLM response section
+    llm_response_frame = ttk.Frame(right_side_frame, padding=10, borderwidth=2, relief="ridge")
+    llm_response_frame.pack(fill="both", expand=True, padx=5, pady=5)
+    ttk.Label(llm_response_frame, text="SLEEC Validation Report", bootstyle="info").pack(pady=5)
+    llm_response_textbox = ScrolledText(llm_response_frame, wrap="word", height=20, width=70)
+    llm_response_textbox.pack(pady=5, fill="both", expand=True)
 
+    update_dropdowns()
+    if watch_project:
+        start_project_watcher()
+    drain_ui_queue()
+    root.mainloop()
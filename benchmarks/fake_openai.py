@@ -0,0 +1,223 @@
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI chat completions and responses endpoints used by the benchmarks. It answers with one templated analysis per failed assertion it finds in the
+# prompt, reports token usage, supports streaming and simulates a latency of `latency` seconds plus `seconds_per_token` for each token generated.
+# The Files and Batch APIs are stood in for as well: an uploaded batch request file is answered batch_seconds after the batch is created.
+# Prompt caching is simulated as providers do it: the longest prefix (in blocks of cache_block_chars, and at least min_cached_chars long) already seen in an
+# earlier prompt is reported as cached tokens.
+# Point the tool at it by setting openai_base_url (or OPENAI_BASE_URL) to the URL returned by start().
+
+latency = 0.05
+seconds_per_token = 0.0002
+cache_block_chars = 512
+min_cached_chars = 4096
+batch_seconds = 0.5 # How long a batch stays in progress before it is answered
+batch_failures = 0 # The first batch_failures requests of each batch fail, to test how missing answers are handled
+files = {} # Files API: file id -> (file object, content)
+batches = {} # Batch API: batch id -> batch object
+store_lock = threading.Lock()
+requests = Counter() # Requests received per endpoint, e.g. requests["batches"], for tests
+prompt_prefixes = set() # Hashes of every prompt prefix seen, one per block
+prompt_prefixes_lock = threading.Lock()
+
+def cached_tokens(prompt): # Tokens of the prompt's longest prefix that was seen before, then remembers the prompt's prefixes.
+    digest, cached = hashlib.sha256(), 0
+    with prompt_prefixes_lock:
+        for end in range(cache_block_chars, len(prompt) + 1, cache_block_chars):
+            digest.update(prompt[end - cache_block_chars:end].encode("utf-8"))
+            key = digest.hexdigest()
+            if key in prompt_prefixes:
+                cached = end
+            prompt_prefixes.add(key)
+    return cached // 4 if cached >= min_cached_chars else 0
+
+task_markers = ("Verification output:", "Failed assertion:") # Each prompt ends with one of these followed by the assertions to analyse
+
+def task_part(prompt): # The part of a prompt after its last task marker. The instructions before it contain worked examples whose assertions are not to be analysed.
+    start = max(prompt.rfind(marker) for marker in task_markers)
+    return prompt[start:] if start >= 0 else prompt
+
+def analysis_text(prompt): # The report for a prompt, following the templates in the Rule-Rule prompt.
+    titles = re.findall(r'title it "([^"]+)"', prompt) # Only the single assertion templates ask for a title, just before their task marker
+    title = titles[-1] if titles else None
+    task = task_part(prompt)
+    conflicts = list(dict.fromkeys(re.findall(r"^\s*SLEEC(Rule\w+?)(Rule\w+?)\s*:\[deadlock free\]", task, re.M)))
+    redundancies = list(dict.fromkeys(re.findall(r"^\s*not (Rule\w+?)_wrt_(Rule\w+)", task, re.M)))
+    sections = [("Conflicting Rule", pair) for pair in conflicts] + [("Redundant Rules", pair) for pair in redundancies]
+    if title:
+        sections = sections[:1] or [("", ("Rule1", "Rule2"))]
+    reports = []
+    for i, (kind, (first, second)) in enumerate(sections, 1):
+        count = sum(1 for section in sections if section[0] == kind)
+        index = sum(1 for section in sections[:i] if section[0] == kind)
+        heading = title if title else f"{kind} ({index} of {count})"
+        reports.append(
+            f"{heading}: {{\n"
+            f"\tError: {{\n"
+            f"\t\tRule Name: {first}{second}\n"
+            f"\t\tRule 1: {first}\n"
+            f"\t\tRule 2: {second}\n"
+            f"\t\tScenario: Both rules are triggered by the same event while their measures allow opposing responses.\n"
+            f"\t\tJustification: {second} can forbid the response that {first} requires before its deadline has passed.\n"
+            f"\t}},\n"
+            f"\tResolution: {{\n"
+            f"\t\tSuggestion 1: \"MODIFY RULE: {second} -> {second} when Event1 then Event2 within 5 minutes unless measure1\"\n"
+            f"\t\tJustification: The added defeater separates the situations in which each rule applies.\n\n"
+            f"\t\tSuggestion 2: \"REMOVE RULE: {second}\"\n"
+            f"\t\tJustification: {first} already covers the intended behaviour.\n"
+            f"\t}}\n"
+            f"}}"
+        )
+    if task.startswith("Verification output:"): # The full report starts with the header the Rule-Rule Report template asks for, with spacers between sections
+        header = f"Total Rule Issues Discovered: {len(sections)} | Conflicts: {len(conflicts)} | Redundancies: {len(redundancies)}"
+        return header + "\n\n" + "\n-----------\n".join(reports)
+    return "\n\n".join(reports) or "No rule issues were found."
+
+def chat_completion(body): # The text, usage and completion object answering a Chat Completions request.
+    prompt = "\n".join(message["content"] for message in body.get("messages", []) if isinstance(message.get("content"), str))
+    text = analysis_text(prompt)
+    usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4, "total_tokens": (len(prompt) + len(text)) // 4, "prompt_tokens_details": {"cached_tokens": cached_tokens(prompt)}}
+    completion = {
+        "id": "bench", "object": "chat.completion", "created": 0, "model": body["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": usage,
+    }
+    return text, usage, completion
+
+def response_object(body): # The same for the Responses API: the prompt is the input.
+    prompt = body["input"] if isinstance(body["input"], str) else "\n".join(item.get("content", "") for item in body["input"] if isinstance(item.get("content"), str))
+    text = analysis_text(prompt)
+    usage = {"input_tokens": len(prompt) // 4, "input_tokens_details": {"cached_tokens": cached_tokens(prompt)}, "output_tokens": len(text) // 4,
+             "output_tokens_details": {"reasoning_tokens": 0}, "total_tokens": (len(prompt) + len(text)) // 4}
+    response = {"id": "bench", "object": "response", "created_at": 0, "model": body["model"], "status": "completed", "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+                "output": [{"id": "msg", "type": "message", "role": "assistant", "status": "completed", "content": [{"type": "output_text", "text": text, "annotations": []}]}], "usage": usage}
+    return text, usage, response
+
+def store_file(filename, purpose, data): # Keeps an uploaded or generated file and returns its file object.
+    with store_lock:
+        file = {"id": f"file-{len(files) + 1}", "object": "file", "bytes": len(data), "created_at": int(time.time()), "filename": filename, "purpose": purpose, "status": "processed"}
+        files[file["id"]] = (file, data)
+    return file
+
+def process_batch(batch_id): # Answers every request in a batch once batch_seconds have passed, writing the answers to an output file and any failures to an error file.
+    time.sleep(batch_seconds)
+    batch = batches[batch_id]
+    requests = [json.loads(line) for line in files[batch["input_file_id"]][1].decode("utf-8").splitlines() if line.strip()]
+    output, errors = [], []
+    for number, request in enumerate(requests):
+        line = {"id": f"batch_req_{number}", "custom_id": request["custom_id"]}
+        if number < batch_failures:
+            errors.append(dict(line, response={"status_code": 500, "request_id": f"req_{number}", "body": {"error": {"message": "stand-in failure", "type": "server_error"}}}, error=None))
+            continue
+        _, _, answer = response_object(request["body"]) if request["url"].endswith("/responses") else chat_completion(request["body"])
+        output.append(dict(line, response={"status_code": 200, "request_id": f"req_{number}", "body": answer}, error=None))
+    for key, lines, filename in (("output_file_id", output, "batch_output.jsonl"), ("error_file_id", errors, "batch_errors.jsonl")):
+        if lines:
+            batch[key] = store_file(filename, "batch_output", "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8"))["id"]
+    batch.update(status="completed", completed_at=int(time.time()), request_counts={"total": len(requests), "completed": len(output), "failed": len(errors)})
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        requests[self.path.rstrip("/").split("/")[-1]] += 1
+        if self.path.endswith("/files"):
+            return self.upload(data)
+        body = json.loads(data)
+        if self.path.endswith("/batches"):
+            return self.create_batch(body)
+        if self.path.endswith("/responses"):
+            return self.respond(body)
+        text, usage, completion = chat_completion(body)
+        time.sleep(latency)
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for start in range(0, len(text), 200):
+                piece = text[start:start + 200]
+                time.sleep(seconds_per_token * len(piece) / 4)
+                self.send_event({"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": body["model"], "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+            self.send_event({"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": body["model"], "choices": [], "usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        time.sleep(seconds_per_token * usage["completion_tokens"])
+        self.send_json(completion)
+
+    def respond(self, body): # The Responses API: a stream is a series of typed events.
+        text, usage, response = response_object(body)
+        time.sleep(latency)
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for number, start in enumerate(range(0, len(text), 200)):
+                piece = text[start:start + 200]
+                time.sleep(seconds_per_token * len(piece) / 4)
+                self.send_event({"type": "response.output_text.delta", "item_id": "msg", "output_index": 0, "content_index": 0, "delta": piece, "logprobs": [], "sequence_number": number})
+            self.send_event({"type": "response.completed", "response": response, "sequence_number": len(text) // 200 + 1})
+            return
+        time.sleep(seconds_per_token * usage["output_tokens"])
+        self.send_json(response)
+
+    def upload(self, data): # Files API upload, sent as multipart/form-data with the file and its purpose.
+        message = BytesParser(policy=policy.HTTP).parsebytes(b"Content-Type: " + self.headers["Content-Type"].encode("latin-1") + b"\r\n\r\n" + data)
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+        purpose = fields["purpose"].get_payload(decode=True).decode("utf-8")
+        self.send_json(store_file(fields["file"].get_filename() or "upload.jsonl", purpose, fields["file"].get_payload(decode=True)))
+
+    def create_batch(self, body): # Batch API: the batch is answered in the background and polled through do_GET.
+        with store_lock:
+            batch_id = f"batch_{len(batches) + 1}"
+            batches[batch_id] = {"id": batch_id, "object": "batch", "endpoint": body["endpoint"], "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+                                 "status": "in_progress", "created_at": int(time.time()), "output_file_id": None, "error_file_id": None,
+                                 "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+        threading.Thread(target=process_batch, args=(batch_id,), daemon=True).start()
+        self.send_json(batches[batch_id])
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].rstrip("/").split("/")
+        if parts[-2] == "batches" and parts[-1] in batches:
+            return self.send_json(batches[parts[-1]])
+        if parts[-1] == "content" and parts[-2] in files:
+            return self.send_json(files[parts[-2]][1], content_type="application/octet-stream")
+        if parts[-2] == "files" and parts[-1] in files:
+            return self.send_json(files[parts[-1]][0])
+        self.send_json({"error": {"message": "not found", "type": "invalid_request_error"}}, status=404)
+
+    def send_json(self, payload, status=200, content_type="application/json"): # Sends a JSON object, or raw bytes such as a file's content.
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_event(self, payload):
+        self.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+class CompletionServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address): # Clients hang up on purpose, e.g. when a hedged request loses the race
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def start(): # Serves on a free local port in a background thread and returns the base URL.
+    server = CompletionServer(("127.0.0.1", 0), CompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    print(start(), flush=True)
+    threading.Event().wait()
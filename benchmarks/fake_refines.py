@@ -0,0 +1,91 @@
+import hashlib
+import os
+import re
+import sys
+import time
+
+# Stand-in for FDR's `refines --quiet FILE` used by the benchmarks. It prints a log for every assertion in FILE in the same layout as refines,
+# with long counterexample traces for failed conflict checks. Results are derived from a hash of the assertion, so a run is repeatable.
+# Tuned through environment variables:
+#   SLEEC_BENCH_FAIL_RATE      fraction of assertions that fail (default 0.1)
+#   SLEEC_BENCH_TRACE_LENGTH   events in each counterexample trace (default 400)
+#   SLEEC_BENCH_CHECK_SECONDS  time spent "checking" each assertion (default 0.002)
+#   SLEEC_BENCH_CRASH          exit with an error on reaching an assertion matching this pattern
+#   SLEEC_BENCH_HANG           hang on reaching an assertion matching this pattern
+#   SLEEC_BENCH_RUN_LOG        file to append the number of assertions of each run to
+
+fail_rate = float(os.environ.get("SLEEC_BENCH_FAIL_RATE", "0.1"))
+trace_length = int(os.environ.get("SLEEC_BENCH_TRACE_LENGTH", "400"))
+check_seconds = float(os.environ.get("SLEEC_BENCH_CHECK_SECONDS", "0.002"))
+crash = os.environ.get("SLEEC_BENCH_CRASH")
+hang = os.environ.get("SLEEC_BENCH_HANG")
+run_log = os.environ.get("SLEEC_BENCH_RUN_LOG")
+
+def assertion_hash(assertion): # Stable value in [0, 1) for an assertion.
+    return int(hashlib.sha256(assertion.encode("utf-8")).hexdigest()[:8], 16) / 0x100000000
+
+def trace_events(assertion, length): # A plausible SLEEC trace: the rules' events, measure readings, internal τ steps and long runs of tock.
+    events = re.findall(r"Rule\d+", assertion) or ["Rule"]
+    trace, seed = [], int(assertion_hash(assertion) * 1000)
+    while len(trace) < length:
+        seed = (seed * 1103515245 + 12345) % 2 ** 31
+        step = seed % 10
+        if step < 5:
+            trace.extend(["tock"] * (seed % 37 + 1))
+        elif step < 7:
+            trace.extend(["τ"] * (seed % 3 + 1))
+        elif step < 9:
+            trace.append(f"measure{seed % 7 + 1}.{'true' if seed % 2 else 'L' + str(seed % 5 + 1)}")
+        else:
+            trace.append(f"{events[seed % len(events)]}Event")
+    return trace[:length]
+
+def wrap_trace(events, indent): # Wraps a trace over several lines the way refines does.
+    lines, current = [], []
+    for event in events:
+        current.append(event)
+        if len(current) == 12:
+            lines.append(", ".join(current) + ",")
+            current = []
+    if current:
+        lines.append(", ".join(current))
+    lines[-1] = lines[-1].rstrip(",")
+    lines[0] = "Trace: <" + lines[0]
+    lines[-1] += ">"
+    return [indent + line for line in lines]
+
+def report(assertion): # The refines log for one assertion.
+    failed = assertion_hash(assertion) < fail_rate
+    states = int(assertion_hash(assertion + "states") * 50000) + 100
+    lines = [
+        assertion + ":",
+        "    Log:",
+        "        Result: " + ("Failed" if failed else "Passed"),
+        f"        Visited States: {states:,}",
+        f"        Visited Transitions: {states * 2:,}",
+        f"        Visited Plys: {states // 40 + 1}",
+        f"        Estimated Total Storage: {states // 200 + 67}MB",
+    ]
+    if failed and "_wrt_" not in assertion: # A refinement that holds under "assert not" has no counterexample to show
+        name = assertion.split()[0]
+        lines.append("        Counterexample (Deadlock Counterexample)")
+        lines.append("            Machine Debug:")
+        lines.append(f"                {name} (Failure Behaviour):")
+        lines.extend(wrap_trace(trace_events(assertion, trace_length), " " * 20))
+        lines.append("                    Min Acceptance: {}")
+    return lines
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8") # The tool reads refines output as UTF-8
+    with open(sys.argv[-1], "r", encoding="utf-8") as f:
+        assertions = re.findall(r"^assert\s+(.*?)\s*$", f.read(), re.M)
+    if run_log:
+        with open(run_log, "a", encoding="utf-8") as f:
+            f.write(f"{len(assertions)}\n")
+    for assertion in assertions:
+        if crash and re.search(crash, assertion):
+            sys.exit(f"stand-in crash on {assertion}")
+        if hang and re.search(hang, assertion):
+            time.sleep(3600)
+        time.sleep(check_seconds)
+        print("\n".join(report(assertion)), flush=True)
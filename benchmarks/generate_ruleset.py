@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+
+# Synthetic SLEEC projects for the benchmarks. A project is laid out the way SLEEC-TK leaves it: NAME.sleec in the project folder and the generated
+# assertions in src-gen/NAME-assertions.csp, so the tool finds and pairs them exactly as it does for a real project.
+
+def generate_ruleset(rules, events=None, measures=None, within_rate=0.7, unless_rate=0.5, seed=0): # Returns the text of a ruleset in the def_start/rule_start format.
+    rng = random.Random(seed)
+    events = events or max(4, rules // 2)
+    measures = measures or max(2, rules // 5)
+    event_names = [f"Event{i}" for i in range(1, events + 1)]
+    measure_types = {}
+    lines = ["def_start"]
+    for name in event_names:
+        lines.append(f"  event {name}")
+    for i in range(1, measures + 1):
+        kind = ("boolean", "numeric", "scale")[i % 3]
+        measure_types[f"measure{i}"] = kind
+        lines.append(f"  measure measure{i}:" + ("scale(L1,L2,L3,L4,L5)" if kind == "scale" else kind))
+    lines.append("  constant MAX_VALUE=8")
+    lines.append("def_end")
+    lines.append("")
+    lines.append("rule_start")
+
+    def condition(): # A random condition on one of the measures, e.g. measure3>=MAX_VALUE or not measure1
+        name = rng.choice(list(measure_types))
+        kind = measure_types[name]
+        if kind == "boolean":
+            return name if rng.random() < 0.5 else "not " + name
+        if kind == "scale":
+            return f"{name}{rng.choice(['<', '>=', '='])}L{rng.randint(1, 5)}"
+        return f"{name}{rng.choice(['<', '>='])}" + rng.choice(["MAX_VALUE", str(rng.randint(1, 20))])
+
+    for i in range(1, rules + 1):
+        trigger, response = rng.sample(event_names, 2)
+        rule = f"  Rule{i} when {trigger}"
+        if rng.random() < 0.3:
+            rule += " and " + condition()
+        rule += " then " + ("not " if rng.random() < 0.15 else "") + response
+        if rng.random() < within_rate:
+            rule += f" within {rng.randint(1, 10)} {rng.choice(['seconds', 'minutes'])}"
+        lines.append(rule)
+        while rng.random() < unless_rate:
+            clause = "        unless " + condition()
+            if rng.random() < 0.3:
+                clause += " then " + rng.choice(event_names)
+            lines.append(clause)
+    lines.append("rule_end")
+    return "\n".join(lines) + "\n"
+
+def rule_events(ruleset): # Maps each rule name to the events it mentions.
+    rules = {}
+    inside = False
+    for line in ruleset.splitlines():
+        stripped = line.strip()
+        if stripped in ("rule_start", "rule_end"):
+            inside = stripped == "rule_start"
+            continue
+        if not inside or not stripped:
+            continue
+        words = stripped.split()
+        if not stripped.startswith("unless"):
+            name = words[0]
+            rules[name] = set()
+        rules[name].update(word for word in words if word.startswith("Event"))
+    return rules
+
+def generate_assertions(name, ruleset, max_pairs_per_rule=3, all_pairs=False): # Returns the text of NAME-assertions.csp, checking each rule against the rules that share an event with it.
+    # With all_pairs, every pair of rules gets a conflict check, as SLEEC-TK generates them, whether or not the rules can interact.
+    rules = rule_events(ruleset)
+    names = list(rules)
+    lines = [f'include "{name}.csp"']
+    for i, first in enumerate(names):
+        related = [second for second in names[i + 1:] if rules[first] & rules[second]][:max_pairs_per_rule]
+        for second in names[i + 1:] if all_pairs else related:
+            lines.append(f"assert SLEEC{first}{second} :[deadlock free]")
+        for second in related:
+            lines.append(f"assert not {second}_wrt_{first} [T= {first}_wrt_{second}")
+    return "\n".join(lines) + "\n"
+
+def write_project(project_dir, rules, name="bench", seed=0, all_pairs=False, **options): # Writes a synthetic project and returns the paths of its ruleset and assertions file.
+    os.makedirs(os.path.join(project_dir, "src-gen"), exist_ok=True)
+    ruleset = generate_ruleset(rules, seed=seed, **options)
+    sleec_path = os.path.join(project_dir, name + ".sleec")
+    assertions_path = os.path.join(project_dir, "src-gen", name + "-assertions.csp")
+    with open(sleec_path, "w", encoding="utf-8") as f:
+        f.write(ruleset)
+    with open(assertions_path, "w", encoding="utf-8") as f:
+        f.write(generate_assertions(name, ruleset, all_pairs=all_pairs))
+    return sleec_path, assertions_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic SLEEC project for benchmarking.")
+    parser.add_argument("project_dir")
+    parser.add_argument("--rules", type=int, default=50)
+    parser.add_argument("--events", type=int)
+    parser.add_argument("--measures", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--all-pairs", action="store_true", help="Check every pair of rules for conflicts, not only rules that share an event")
+    args = parser.parse_args()
+    for path in write_project(args.project_dir, args.rules, seed=args.seed, all_pairs=args.all_pairs, events=args.events, measures=args.measures):
+        print(path)
@@ -0,0 +1,193 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fake_openai
+from generate_ruleset import write_project
+
+# Scalability benchmarks. For each ruleset size a synthetic project is generated and the full Rule-Rule pipeline (PDF supplements, verification through a
+# fake refines, supplement budgeting, prompt assembly and the LLM request to a fake OpenAI endpoint) is run several times with the verification store and response cache cold.
+# Results are compared against the stored baselines and any metric that is worse by more than the tolerance is reported as a regression.
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+default_sizes = [10, 50, 200, 1000]
+default_baselines = os.path.join(benchmarks_dir, "baselines.json")
+lower_is_better = ["latency_p50_s", "latency_p95_s", "verification_s", "llm_s", "prompt_tokens", "peak_memory_mb"] # Metrics checked for regressions
+higher_is_better = ["assertions_per_s"]
+
+def load_tool(home): # Imports the tool with its caches and run traces redirected to a scratch home directory, so benchmarks never touch the user's caches.
+    os.environ["HOME"] = os.environ["USERPROFILE"] = home
+    if repo_dir not in sys.path: # For the modules the tool imports from its own folder
+        sys.path.insert(0, repo_dir)
+    spec = importlib.util.spec_from_file_location("sleec_llm_tool", os.path.join(repo_dir, "SLEEC LLM Tool.py"))
+    tool = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tool)
+    return tool
+
+def install_fake_refines(tool, bin_dir): # Puts a `refines` launcher for fake_refines.py where the tool looks for refines.
+    os.makedirs(bin_dir, exist_ok=True)
+    script = os.path.join(benchmarks_dir, "fake_refines.py")
+    if os.name == "nt":
+        tool.refines_exe_path = os.path.join(bin_dir, "refines.cmd")
+        with open(tool.refines_exe_path, "w", encoding="utf-8") as f:
+            f.write(f'@"{sys.executable}" "{script}" %*\n')
+    else:
+        launcher = os.path.join(bin_dir, "refines")
+        with open(launcher, "w", encoding="utf-8") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        os.chmod(launcher, 0o755)
+        os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+def reset_caches(tool): # Removes the verification results, reports and indexed analyses of the previous run. The extracted PDF text is kept, as it does not depend on the ruleset.
+    shutil.rmtree(os.path.join(tool.cache_dir, "verification"), ignore_errors=True)
+    for name in ("responses.sqlite3", "analyses.sqlite3"):
+        try:
+            os.remove(os.path.join(tool.cache_dir, name))
+        except FileNotFoundError:
+            pass
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+def stage_wall(trace, name):
+    return sum(stage["wall_s"] for stage in trace.stages if stage["stage"] == name)
+
+def run_once(tool, project, supplements, options): # One cold run of the pipeline. Returns its latency and the analysis.
+    reset_caches(tool)
+    started = time.perf_counter()
+    analysis = tool.prepare_rule_rule_analysis(project["sleec"], project["assertions"], supplements[0], supplements[1], options.model, options.per_assertion)
+    with analysis.trace.stage("prompt_size") as stage: # The prompt the single-request path would send, for comparing sizes across modes
+        stage["prompt_tokens"] = tool.estimate_tokens(tool.build_rule_rule_prompt(analysis.sleec_spec_text, analysis.sleec_ruleset, analysis.assertions_output, analysis.agent_text))
+    report = tool.analyse_rule_rule(analysis, bypass_cache=True)
+    if report.startswith("Error"):
+        raise RuntimeError(report)
+    return time.perf_counter() - started, analysis
+
+def benchmark_size(tool, rules, supplements, options, work_dir): # Runs the pipeline repeat times for one ruleset size and summarises the runs.
+    project_dir = os.path.join(work_dir, f"rules-{rules}")
+    sleec_path, assertions_path = write_project(project_dir, rules, seed=options.seed, all_pairs=options.all_pairs)
+    project = {"sleec": sleec_path, "assertions": assertions_path}
+    latencies, runs = [], []
+    for _ in range(options.repeat):
+        latency, analysis = run_once(tool, project, supplements, options)
+        latencies.append(latency)
+        runs.append(analysis)
+    tracemalloc.start() # Memory is measured on a separate run, since tracing slows everything down
+    try:
+        _, measured = run_once(tool, project, supplements, options)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assertions = len(runs[0].records)
+    verification = statistics.median(stage_wall(run.trace, "verification") for run in runs)
+    return {
+        "rules": rules,
+        "assertions": assertions,
+        "failed": sum(1 for record in runs[0].records if record.failed),
+        "static": sum(1 for record in runs[0].records if "Static Analysis" in record.statistics),
+        "latency_p50_s": round(percentile(latencies, 0.5), 3),
+        "latency_p95_s": round(percentile(latencies, 0.95), 3),
+        "verification_s": round(verification, 3),
+        "llm_s": round(statistics.median(stage_wall(run.trace, "llm_request") for run in runs), 3),
+        "assertions_per_s": round(assertions / verification, 1) if verification else None,
+        "prompt_tokens": next(stage["prompt_tokens"] for stage in measured.trace.stages if stage["stage"] == "prompt_size"),
+        "cached_tokens": int(statistics.median(sum(stage.get("cached_tokens", 0) for stage in run.trace.stages if stage["stage"] == "llm_request") for run in runs)),
+        "peak_memory_mb": round(peak_memory / 1024 / 1024, 1),
+    }
+
+def compare(results, baselines, tolerance): # Lists the metrics that are worse than the baseline by more than tolerance.
+    regressions = []
+    baseline_sizes = {entry["rules"]: entry for entry in baselines.get("results", [])}
+    for result in results:
+        baseline = baseline_sizes.get(result["rules"])
+        if not baseline:
+            continue
+        for metric in lower_is_better + higher_is_better:
+            current, previous = result.get(metric), baseline.get(metric)
+            if not current or not previous:
+                continue
+            change = (current - previous) / previous
+            if (metric in lower_is_better and change > tolerance) or (metric in higher_is_better and -change > tolerance):
+                regressions.append(f"{result['rules']} rules: {metric} {previous} -> {current} ({change:+.0%})")
+    return regressions
+
+def print_table(results):
+    columns = ["rules", "assertions", "failed", "static", "latency_p50_s", "latency_p95_s", "verification_s", "llm_s", "assertions_per_s", "prompt_tokens", "cached_tokens", "peak_memory_mb"]
+    print("  ".join(f"{column:>16}" for column in columns))
+    for result in results:
+        print("  ".join(f"{str(result[column]):>16}" for column in columns))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how the SLEEC LLM Tool scales with the size of the ruleset.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes, help="Ruleset sizes, in rules")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", default="o3-mini")
+    parser.add_argument("--per-assertion", action="store_true", help="Analyse each failed assertion with its own request")
+    parser.add_argument("--all-pairs", action="store_true", help="Check every pair of rules for conflicts, as SLEEC-TK does")
+    parser.add_argument("--no-supplements", action="store_true", help="Leave the PDFs in 'LLM Resources' out of the prompt")
+    parser.add_argument("--baselines", default=default_baselines, help="Baselines file to compare against")
+    parser.add_argument("--save-baselines", action="store_true", help="Store these results as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative change allowed before a metric counts as a regression")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    options = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="sleec-bench-")
+    try:
+        tool = load_tool(os.path.join(work_dir, "home"))
+        install_fake_refines(tool, os.path.join(work_dir, "bin"))
+        tool.openai_api_key = "benchmark"
+        tool.openai_base_url = fake_openai.start()
+        supplements = (None, None)
+        if not options.no_supplements:
+            sleec_spec_files, agent_spec_files = tool.load_prompt_supplements(repo_dir)
+            supplements = (sleec_spec_files[0] if sleec_spec_files else None, agent_spec_files[0] if agent_spec_files else None)
+        results = []
+        for rules in options.sizes:
+            results.append(benchmark_size(tool, rules, supplements, options, work_dir))
+            print(f"{rules} rules done", file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    run = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"repeat": options.repeat, "seed": options.seed, "model": options.model, "per_assertion": options.per_assertion, "all_pairs": options.all_pairs, "supplements": not options.no_supplements},
+        "results": results,
+    }
+    print_table(results)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+    if options.save_baselines:
+        with open(options.baselines, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"Baselines saved to {options.baselines}")
+        return 0
+    if not os.path.exists(options.baselines):
+        return 0
+    with open(options.baselines, "r", encoding="utf-8") as f:
+        baselines = json.load(f)
+    if baselines.get("settings") != run["settings"]:
+        print("Baselines were recorded with different settings; skipping the comparison.")
+        return 0
+    regressions = compare(results, baselines, options.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    if not regressions:
+        print(f"No regressions against {options.baselines} (tolerance {options.tolerance:.0%}).")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import re
+from dataclasses import dataclass, field
+
+# Streaming parser for the output of FDR's refines. parse_refines_output turns the log of each assertion into a RefinesAssertion as soon as the log ends, so outputs
+# of any size are read in constant memory straight from the pipe, and format_assertion renders a failed assertion for a prompt without the search statistics.
+# Only uses the standard library, so it can be imported without the GUI or the LLM client, e.g. by tests.
+
+@dataclass
+class RefinesTrace: # One trace from a counterexample, e.g. the Failure Behaviour of SLEECRule2Rule4.
+    behaviour: str
+    events: list
+    details: dict = field(default_factory=dict) # Min Acceptance, Error Event etc.
+
+@dataclass
+class RefinesCounterexample:
+    kind: str # e.g. Deadlock Counterexample
+    traces: list = field(default_factory=list)
+
+@dataclass
+class RefinesAssertion: # The result of one assertion from the refines output.
+    name: str
+    kind: str # "conflict" (deadlock freedom of a SLEECRuleXRuleY pair), "redundancy" (RuleX_wrt_RuleY) or "other"
+    result: str = ""
+    statistics: dict = field(default_factory=dict) # Visited States, Estimated Total Storage etc.
+    counterexamples: list = field(default_factory=list)
+    text: str = "" # The assertion's output exactly as refines printed it
+    checked_by: str = "refines" # "refines", or "fdr" or "stand-in" for the session backends
+
+    @property
+    def failed(self):
+        return self.result == "Failed"
+
+def assertion_kind(name):
+    if "_wrt_" in name:
+        return "redundancy"
+    if re.search(r"\bSLEEC\w+", name) and "deadlock free" in name:
+        return "conflict"
+    return "other"
+
+def split_events(trace_text): # Splits the inside of a <...> trace on the commas between events, ignoring commas nested in brackets.
+    events, depth, current = [], 0, []
+    for char in trace_text:
+        if char in "({[<":
+            depth += 1
+        elif char in ")}]>":
+            depth -= 1
+        if char == "," and depth == 0:
+            events.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if "".join(current).strip():
+        events.append("".join(current).strip())
+    return events
+
+def parse_refines_output(lines): # Turns refines output into RefinesAssertion records, yielding each one as soon as its log ends so only one assertion is held in memory.
+    record, raw, trace_parts, behaviour = None, [], None, ""
+    for line in lines:
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+        if stripped and line[0] not in " \t": # An unindented line starts the next assertion
+            if record:
+                record.text = "\n".join(raw).rstrip()
+                yield record
+            name = stripped[:-1].rstrip() if stripped.endswith(":") else stripped
+            record, raw, trace_parts, behaviour = RefinesAssertion(name=name, kind=assertion_kind(name)), [line], None, ""
+            continue
+        if record is None:
+            continue
+        raw.append(line)
+        if trace_parts is None and stripped.startswith("Trace:"):
+            trace_parts = []
+            stripped = stripped[len("Trace:"):].strip()
+        if trace_parts is not None: # Traces are wrapped over several lines, so collect them until the closing bracket
+            trace_parts.append(stripped)
+            trace = " ".join(trace_parts)
+            if trace.count("<") <= trace.count(">"):
+                if not record.counterexamples:
+                    record.counterexamples.append(RefinesCounterexample(kind=""))
+                record.counterexamples[-1].traces.append(RefinesTrace(behaviour=behaviour, events=split_events(trace.strip()[1:-1])))
+                trace_parts = None
+            continue
+        if stripped.startswith("Result:"):
+            record.result = stripped[len("Result:"):].strip()
+        elif stripped.startswith("Counterexample"):
+            match = re.match(r"Counterexample\s*\((.*)\)", stripped)
+            record.counterexamples.append(RefinesCounterexample(kind=match.group(1) if match else ""))
+        elif stripped.endswith(":") and record.counterexamples: # e.g. "SLEECRule2Rule4 (Failure Behaviour):"
+            if stripped != "Machine Debug:":
+                behaviour = stripped[:-1]
+        elif ":" in stripped and stripped != "Log:":
+            key, value = (part.strip() for part in stripped.split(":", 1))
+            if record.counterexamples and record.counterexamples[-1].traces:
+                record.counterexamples[-1].traces[-1].details[key] = value
+            elif not record.counterexamples:
+                record.statistics[key] = value
+    if record:
+        record.text = "\n".join(raw).rstrip()
+        yield record
+
+def compact_events(events): # Rewrites runs of a repeated event as event×n and collapses runs of τ (internal events) into a single τ.
+    compacted = []
+    previous, count = None, 0
+    for event in events + [None]:
+        if event == previous:
+            count += 1
+            continue
+        if previous is not None:
+            compacted.append(previous if count == 1 or previous == "τ" else f"{previous}×{count}")
+        previous, count = event, 1
+    return compacted
+
+def format_trace(events, compact=True):
+    return "<" + ", ".join(compact_events(events) if compact else events) + ">"
+
+def format_assertion(record, compact=True): # Renders a failed assertion for the prompt without the search statistics refines reports. Identical counterexamples are only listed once when traces are compacted.
+    lines = [record.name + ":", "    Result: " + record.result]
+    if "Static Analysis" in record.statistics: # The reason the static pre-analysis found for the failure
+        lines.append("    Static Analysis: " + record.statistics["Static Analysis"])
+    seen = set()
+    for counterexample in record.counterexamples:
+        rendered = [f"    Counterexample ({counterexample.kind})" if counterexample.kind else "    Counterexample"]
+        for trace in counterexample.traces:
+            indent = "        "
+            trace_lines = []
+            if trace.behaviour:
+                trace_lines.append(indent + trace.behaviour + ":")
+                indent += "    "
+            trace_lines.append(indent + "Trace: " + format_trace(trace.events, compact))
+            trace_lines += [f"{indent}{key}: {value}" for key, value in trace.details.items()]
+            if not (compact and "\n".join(trace_lines) in rendered):
+                rendered.append("\n".join(trace_lines))
+        if compact and tuple(rendered) in seen:
+            continue
+        seen.add(tuple(rendered))
+        lines += rendered
+    return "\n".join(lines)
@@ -0,0 +1,71 @@
+import importlib.util
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+# The tool's modules sit in the repository root, and the stand-ins for refines and OpenAI in benchmarks.
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (repo_dir, os.path.join(repo_dir, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import fake_openai
+from generate_ruleset import write_project
+
+@pytest.fixture(scope="session")
+def tool(tmp_path_factory): # The tool imported as a module, which does not start the GUI, with its caches and run traces in a scratch home directory.
+    home = str(tmp_path_factory.mktemp("home"))
+    saved = {name: os.environ.get(name) for name in ("HOME", "USERPROFILE")}
+    os.environ["HOME"] = os.environ["USERPROFILE"] = home
+    try:
+        spec = importlib.util.spec_from_file_location("sleec_llm_tool", os.path.join(repo_dir, "SLEEC LLM Tool.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return module
+
+@pytest.fixture(scope="session")
+def fake_openai_url():
+    return fake_openai.start()
+
+@pytest.fixture
+def fake_llm(tool, fake_openai_url, monkeypatch): # Points every backend at the stand-in OpenAI server. Its settings are restored after each test.
+    monkeypatch.setattr(tool, "openai_base_url", fake_openai_url)
+    monkeypatch.setattr(tool, "openai_api_key", "test")
+    monkeypatch.setattr(tool, "llm_backends", {"openai": {"api": "chat"}, "openai-responses": {"api": "responses"}})
+    for name in ("latency", "seconds_per_token", "batch_seconds", "batch_failures"):
+        monkeypatch.setattr(fake_openai, name, getattr(fake_openai, name))
+    return fake_openai
+
+@pytest.fixture
+def project(tool, fake_llm, tmp_path, monkeypatch): # A generated project verified by stand-in FDR sessions that fail every conflict and redundancy check, with empty caches.
+    monkeypatch.setattr(tool, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(tool, "verification_backend", "stand-in")
+    monkeypatch.setattr(tool.StandInSession, "load_seconds", 0)
+    monkeypatch.setattr(tool.StandInSession, "check_seconds", 0)
+    monkeypatch.setattr(tool.StandInSession, "failures", r"^(SLEEC|not )")
+    monkeypatch.setattr(tool.StandInSession, "loads", Counter())
+    return write_project(str(tmp_path / "project"), 6)
+
+@pytest.fixture
+def fake_refines(tool, tmp_path, monkeypatch): # Puts benchmarks/fake_refines.py on the PATH as refines. Its behaviour is set through the SLEEC_BENCH_* variables,
+    # and the number of assertions of every run is logged to the returned file.
+    if os.name == "nt":
+        pytest.skip("the stand-in refines is installed as a shell script")
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    launcher = bin_dir / "refines"
+    launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(repo_dir, "benchmarks", "fake_refines.py")}" "$@"\n')
+    launcher.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.setenv("SLEEC_BENCH_CHECK_SECONDS", "0")
+    monkeypatch.setenv("SLEEC_BENCH_RUN_LOG", str(tmp_path / "refines-runs.log"))
+    monkeypatch.setattr(tool, "verification_backend", "refines")
+    return tmp_path / "refines-runs.log"
@@ -0,0 +1,91 @@
+import pytest
+
+ruleset = """def_start
+  event DetectUserFallen
+  event CallSupport
+  event OpenDoor
+  measure userUnresponsive: boolean
+def_end
+
+rule_start
+  Rule1 when DetectUserFallen then CallSupport within 2 minutes
+  Rule2 when DetectUserFallen then not CallSupport within 5 minutes unless userUnresponsive
+rule_end
+"""
+renamed = """def_start
+  event AlarmRaised
+  event NotifyStaff
+  measure patientAsleep: boolean
+def_end
+
+rule_start
+  Rule7 when AlarmRaised then NotifyStaff within 2 minutes
+  Rule9 when AlarmRaised then not NotifyStaff within 5 minutes unless patientAsleep
+rule_end
+"""
+
+def record(tool, first, second, trigger, response):
+    name = f"SLEEC{first}{second} :[deadlock free]"
+    text = f"{name}:\n    Log:\n        Result: Failed\n        Counterexample (Deadlock Counterexample)\n            Machine Debug:\n" \
+           f"                SLEEC{first}{second} (Failure Behaviour):\n                    Trace: <{trigger}, tock, tock, {response}>\n"
+    return next(tool.parse_refines_output(text.splitlines()))
+
+def original(tool):
+    return ruleset, record(tool, "Rule1", "Rule2", "DetectUserFallen", "CallSupport")
+
+def alpha_equivalent(tool):
+    return renamed, record(tool, "Rule7", "Rule9", "AlarmRaised", "NotifyStaff")
+
+def test_alpha_equivalent_assertions_have_the_same_canonical_form(tool):
+    text, names = tool.canonical_assertion(*original(tool))
+    assert tool.canonical_assertion(*alpha_equivalent(tool))[0] == text
+    assert "DetectUserFallen" not in text and "$event1" in text
+    assert names["DetectUserFallen"] == "$event1" and names["userUnresponsive"] == "$measure1"
+    assert names["SLEECRule1Rule2"] == "SLEEC$rule1$rule2" and names["Rule2_wrt_Rule1"] == "$rule2_wrt_$rule1"
+
+def test_different_assertions_have_different_canonical_forms(tool):
+    text, _ = tool.canonical_assertion(*original(tool))
+    _, renamed_record = alpha_equivalent(tool)
+    assert tool.canonical_assertion(renamed.replace("within 2 minutes", "within 3 minutes"), renamed_record)[0] != text
+    assert tool.canonical_assertion(ruleset, record(tool, "Rule1", "Rule5", "DetectUserFallen", "CallSupport")) is None # Rule5 is not in the ruleset
+
+def test_names_are_replaced_in_one_pass(tool):
+    assert tool.replace_names("Rule1 then Rule12 then Rule2", {"Rule1": "Rule2", "Rule2": "Rule1"}) == "Rule2 then Rule12 then Rule1"
+    assert tool.replace_names("SLEECRule1Rule2 and Rule1", {"Rule1": "$rule1", "SLEECRule1Rule2": "SLEEC$rule1$rule2"}) == "SLEEC$rule1$rule2 and $rule1"
+
+def section(first, second, scenario):
+    return (f"Conflicting Rule (1 of 1): {{\n    Error: {first} and {second} disagree\n    Rule Name: SLEEC{first}{second}\n    Rule 1: {first}\n    Rule 2: {second}\n"
+            f"    Scenario: {scenario}\n    Justification: They cannot both hold.\n    Resolution: Relax one rule.\n    Suggestion: MODIFY {second}\n}}")
+
+@pytest.fixture
+def index(tool, tmp_path, monkeypatch): # Indexes the analysis of SLEECRule1Rule2 with the given scenario, then looks it up from a ruleset. Returns the reused section or None.
+    monkeypatch.setattr(tool, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(tool, "analysis_index", True)
+    def lookup(scenario, ruleset_and_record):
+        sleec_ruleset, failed_record = original(tool)
+        failed = [("Conflicting Rule", failed_record)]
+        analysis = tool.RuleRuleAnalysis(model="o3-mini", fan_out=False, sleec_path="home.sleec", sleec_ruleset=sleec_ruleset)
+        tool.index_analyses(analysis, failed, tool.assemble_report(failed, [section("Rule1", "Rule2", scenario)]))
+        sleec_ruleset, failed_record = ruleset_and_record
+        return tool.reuse_analyses(tool.RuleRuleAnalysis(model="o3-mini", fan_out=False, sleec_ruleset=sleec_ruleset), [("Conflicting Rule", failed_record)])[0]
+    return lookup
+
+def test_sections_naming_only_the_renamed_names_are_reused_with_high_confidence(tool, index):
+    reused = index("After DetectUserFallen, CallSupport is both required and forbidden.", alpha_equivalent(tool))
+    assert "Reused Analysis: alpha-equivalent to SLEECRule1Rule2 :[deadlock free] in home.sleec (confidence: high)" in reused
+    assert "Scenario: After AlarmRaised, NotifyStaff is both required and forbidden." in reused
+    body = reused.split("\n", 2)[2] # After the line saying where it came from
+    assert "Rule Name: SLEECRule7Rule9" in body and "Rule 2: Rule9" in body and "Rule1" not in body
+
+def test_sections_echoing_the_wording_of_names_have_medium_confidence(tool, index, monkeypatch):
+    scenario = "The robot must call support within 2 minutes but may not for 5."
+    assert "(confidence: medium)" in index(scenario, alpha_equivalent(tool))
+    assert "(confidence: high)" in index(scenario, original(tool)) # The same names, so the wording still fits
+    monkeypatch.setattr(tool, "analysis_reuse_min_confidence", "high")
+    assert index(scenario, alpha_equivalent(tool)) is None
+
+def test_sections_naming_other_parts_of_the_ruleset_have_low_confidence(tool, index, monkeypatch):
+    scenario = "After DetectUserFallen, CallSupport is forbidden until OpenDoor." # OpenDoor is not renamed, as neither rule uses it
+    assert index(scenario, alpha_equivalent(tool)) is None
+    monkeypatch.setattr(tool, "analysis_reuse_min_confidence", "low")
+    assert "(confidence: low)" in index(scenario, alpha_equivalent(tool))
@@ -0,0 +1,79 @@
+import argparse
+import os
+
+import pytest
+
+@pytest.fixture
+def batch_options(tool, fake_llm, tmp_path, monkeypatch):
+    monkeypatch.setattr(tool, "batch_poll_interval", 0.05)
+    fake_llm.batch_seconds = 0.2
+    return argparse.Namespace(backend="openai", bypass_cache=False, output=str(tmp_path / "batch"))
+
+def test_an_interrupted_batch_is_resumed(tool, fake_llm, batch_options, tmp_path):
+    lines = [tool.batch_request_line(f"request-{i}", f"Failed assertion:\n\nSLEECRule{i}Rule9 :[deadlock free]:", "o3-mini", "chat") for i in range(3)]
+    def interrupt(message):
+        if message.startswith("Batch "): # The batch has been submitted and recorded in the checkpoint
+            raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        tool.run_batch("openai", lines, str(tmp_path), interrupt)
+    uploads, batches = fake_llm.requests["files"], fake_llm.requests["batches"]
+    messages = []
+    batch_id, results = tool.run_batch("openai", lines, str(tmp_path), messages.append)
+    assert messages[0] == f"Resuming batch {batch_id} ..."
+    assert (fake_llm.requests["files"], fake_llm.requests["batches"]) == (uploads, batches) # Nothing was uploaded or submitted again
+    assert sorted(results) == ["request-0", "request-1", "request-2"]
+    assert "Rule Name: Rule1Rule9" in results["request-1"][0]
+
+@pytest.mark.parametrize("fan_out", [False, True])
+def test_batch_reports_go_to_the_response_cache(tool, fake_llm, project, batch_options, fan_out):
+    analysis = tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", fan_out)
+    direct = fake_llm.requests["completions"]
+    tool.batch_analyses([analysis], batch_options)
+    assert fake_llm.requests["completions"] == direct
+    assert tool.cached_response(tool.analysis_cache_key(analysis)).startswith(f"Total Rule Issues Discovered: {len(tool.failed_assertions(analysis.records))} |")
+    assert analysis.notes[-1].startswith("Report generated by batch ")
+    assert not any(note.startswith("Report checked:") for note in analysis.notes)
+    assert not os.path.exists(os.path.join(batch_options.output, "batch_checkpoint.json"))
+
+def test_only_requests_the_batch_did_not_answer_are_sent_directly(tool, fake_llm, project, batch_options):
+    fake_llm.batch_failures = 1
+    analysis = tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", True)
+    requests = len(tool.failed_assertions(analysis.records))
+    direct = fake_llm.requests["completions"]
+    tool.batch_analyses([analysis], batch_options)
+    assert fake_llm.requests["completions"] == direct + 1
+    assert analysis.notes[-1].endswith(f"with 1 of {requests} requests sent directly.")
+    stage = next(stage for stage in analysis.trace.stages if stage["stage"] == "llm_batch")
+    assert stage["direct_requests"] == 1
+    assert tool.cached_response(tool.analysis_cache_key(analysis)) is not None
+
+@pytest.mark.parametrize("fan_out", [False, True])
+def test_batch_reuses_the_analysis_index(tool, fake_llm, project, batch_options, fan_out, monkeypatch):
+    monkeypatch.setattr(tool, "analysis_reuse_min_confidence", "low") # The stand-in's suggestions mention other events of the ruleset
+    tool.batch_analyses([tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", fan_out)], batch_options)
+    os.remove(os.path.join(tool.cache_dir, "responses.sqlite3")) # Only the analysis index is left
+    analysis = tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", fan_out)
+    failed = len(tool.failed_assertions(analysis.records))
+    batches, direct = fake_llm.requests["batches"], fake_llm.requests["completions"]
+    tool.batch_analyses([analysis], batch_options)
+    assert (fake_llm.requests["batches"], fake_llm.requests["completions"]) == (batches, direct)
+    assert f"{failed} of {failed} failed assertions reused from the analysis index." in analysis.notes
+    assert analysis.notes[-1] == "Report assembled from the analysis index."
+    assert "Reused Analysis: alpha-equivalent to " in tool.cached_response(tool.analysis_cache_key(analysis))
+
+@pytest.mark.parametrize("fan_out", [False, True])
+def test_batch_requests_only_the_assertions_not_in_the_index(tool, fake_llm, project, batch_options, fan_out, monkeypatch):
+    monkeypatch.setattr(tool, "analysis_reuse_min_confidence", "low")
+    tool.batch_analyses([tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", fan_out)], batch_options)
+    os.remove(os.path.join(tool.cache_dir, "responses.sqlite3"))
+    with tool.open_analysis_index() as connection:
+        connection.execute("DELETE FROM analyses WHERE rowid % 2 = 0")
+        indexed = connection.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+    analysis = tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", fan_out)
+    failed = tool.failed_assertions(analysis.records)
+    tool.batch_analyses([analysis], batch_options)
+    stage = next(stage for stage in analysis.trace.stages if stage["stage"] == "llm_batch")
+    assert stage["requests"] == (len(failed) - indexed if fan_out else 1)
+    assert f"{indexed} of {len(failed)} failed assertions reused from the analysis index." in analysis.notes
+    assert not any(note.startswith("Report checked:") for note in analysis.notes) # The reused and requested sections make up the whole report
+    assert tool.cached_response(tool.analysis_cache_key(analysis)).count("Reused Analysis: ") == indexed
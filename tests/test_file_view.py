@@ -0,0 +1,101 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+class Widget: # Stands in for the Tk widgets of a LazyFileView, remembering the text shown and the scrollbar position
+    def __init__(self, *args, **kwargs):
+        self.content, self.position = "", None
+
+    def pack(self, **kwargs):
+        pass
+
+    def bind(self, *args):
+        pass
+
+    def config(self, **kwargs):
+        pass
+
+    def delete(self, *args):
+        self.content = ""
+
+    def insert(self, index, text):
+        self.content += text
+
+    def set(self, first, last):
+        self.position = (first, last)
+
+@pytest.fixture
+def view(tool, monkeypatch): # A view showing three lines at a time, with widget updates run straight away
+    monkeypatch.setattr(tool, "ttk", SimpleNamespace(Frame=Widget, Scrollbar=Widget))
+    monkeypatch.setattr(tool, "Text", Widget)
+    monkeypatch.setattr(tool, "ui_call", lambda function, *args: function(*args))
+    monkeypatch.setattr(tool, "view_buffer_lines", 0)
+    monkeypatch.setattr(tool.LazyFileView, "visible_lines", lambda self: 3)
+    return tool.LazyFileView(None)
+
+def lines(count, start=0):
+    return "".join(f"line {i}\n" for i in range(start, start + count))
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def show(view, path): # Opens a file and waits for it to be indexed and shown
+    view.open(str(path))
+    wait_for(lambda: view.starts is not None and view.path == str(path))
+    return view.text.content
+
+@pytest.mark.parametrize("text, count", [("", 1), ("one", 1), ("one\n", 1), ("one\r\ntwo\r\n", 2), ("one\n\nthree", 3)])
+def test_lines_are_indexed(view, tmp_path, text, count):
+    (tmp_path / "rules.sleec").write_bytes(text.encode())
+    show(view, tmp_path / "rules.sleec")
+    assert len(view.starts) == count and view.size == len(text)
+
+def test_index_spans_read_blocks(view, tmp_path):
+    text = lines(200000) # Several 1 MiB blocks
+    (tmp_path / "big.rct").write_text(text)
+    view.index_file(str(tmp_path / "big.rct"), view.generation)
+    assert len(view.starts) == 200000 and view.size == len(text)
+    assert all(text[view.starts[i] - 1] == "\n" for i in (1, 99999, 199999))
+
+def test_only_the_visible_window_is_rendered(view, tmp_path):
+    (tmp_path / "rules.sleec").write_text(lines(10))
+    assert show(view, tmp_path / "rules.sleec") == lines(3)
+    view.scroll_lines(4)
+    assert view.text.content == lines(3, 4) and view.scrollbar.position == (0.4, 0.7)
+    view.scroll_lines(100) # Stops at the last screenful
+    assert view.text.content == lines(3, 7)
+    view.on_scroll("moveto", "0.5")
+    assert view.text.content == lines(3, 5)
+
+def test_no_handle_is_kept_open(view, tmp_path):
+    path = tmp_path / "rules.sleec"
+    path.write_text(lines(10))
+    show(view, path)
+    view.scroll_lines(2)
+    if os.path.isdir("/proc/self/fd"):
+        assert str(path) not in {os.path.realpath(os.path.join("/proc/self/fd", fd)) for fd in os.listdir("/proc/self/fd")}
+
+def test_a_changed_file_is_indexed_again(view, tmp_path):
+    path = tmp_path / "rules.sleec"
+    path.write_text(lines(10))
+    show(view, path)
+    view.scroll_lines(4)
+    path.write_text("short\n") # Truncated while shown
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000_000))
+    view.render()
+    wait_for(lambda: view.text.content == "short\n")
+    assert view.text.content == "short\n" and len(view.starts) == 1
+
+def test_reopening_shows_the_new_file_from_the_top(view, tmp_path):
+    (tmp_path / "a.sleec").write_text(lines(10))
+    (tmp_path / "b.sleec").write_text(lines(10, 100))
+    show(view, tmp_path / "a.sleec")
+    view.scroll_lines(5)
+    assert show(view, tmp_path / "b.sleec") == lines(3, 100)
+    view.open(str(tmp_path / "missing.sleec"))
+    wait_for(lambda: view.text.content.startswith("Error reading file:"))
+    assert view.text.content.startswith("Error reading file:") and view.starts is None
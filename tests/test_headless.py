@@ -0,0 +1,18 @@
+import json
+import os
+
+from generate_ruleset import write_project
+
+def test_projects_with_the_same_folder_name_keep_their_results(tool, project, tmp_path, monkeypatch):
+    for setting in ("refines_workers", "refines_slots", "verification_backend", "llm_hedge_backend", "llm_hedge_after", "batch_poll_interval"): # Set by run_headless
+        monkeypatch.setattr(tool, setting, getattr(tool, setting))
+    projects = [str(tmp_path / site / "ALMI") for site in ("site-a", "site-b")]
+    for seed, project_dir in enumerate(projects):
+        write_project(project_dir, 4 + seed, name="almi", seed=seed)
+    output = tmp_path / "results"
+    assert tool.run_headless(projects + ["--verify-only", "--output", str(output)]) == 0
+    files = sorted(name for name in os.listdir(output) if name.endswith(".json"))
+    assert len(files) == 2 and all(name.startswith("ALMI-almi-") for name in files)
+    results = [json.loads((output / name).read_text()) for name in files]
+    assert sorted(result["project"] for result in results) == sorted(os.path.abspath(project_dir) for project_dir in projects)
+    assert tool.result_file_name({"project": projects[0], "assertions": os.path.join(projects[0], "src-gen", "almi-assertions.csp")}) in files # Stable between runs
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from collections import Counter
+
+import pytest
+
+@pytest.fixture
+def backends(tool, monkeypatch): # Stands in for backend_completion. Each backend answers (or raises) after its delay; records when each request started.
+    monkeypatch.setattr(tool, "llm_hedge_backend", "hedge")
+    monkeypatch.setattr(tool, "llm_hedge_after", 0.2)
+    behaviour, started = {}, {}
+    async def backend_completion(name, prompt, model, on_text=None, cancel=None, usage=None):
+        started[name] = time.monotonic()
+        seconds, answer = behaviour[name]
+        await asyncio.sleep(seconds)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer, False
+    monkeypatch.setattr(tool, "backend_completion", backend_completion)
+    return behaviour, started
+
+def complete(tool):
+    usage = Counter()
+    started = time.monotonic()
+    text, _ = asyncio.run(tool.complete("prompt", "o3-mini", "primary", usage=usage))
+    return text, usage, time.monotonic() - started
+
+def test_fast_answers_are_not_hedged(tool, backends):
+    behaviour, started = backends
+    behaviour.update(primary=(0.05, "primary"), hedge=(0, "hedge"))
+    text, usage, _ = complete(tool)
+    assert text == "primary" and "hedge" not in started
+    assert usage["hedged_requests"] == usage["hedge_wins"] == 0
+
+def test_slow_requests_are_hedged_after_the_delay(tool, backends):
+    behaviour, started = backends
+    behaviour.update(primary=(2, "primary"), hedge=(0.05, "hedge"))
+    text, usage, elapsed = complete(tool)
+    assert text == "hedge" and elapsed < 1
+    assert started["hedge"] - started["primary"] == pytest.approx(0.2, abs=0.1)
+    assert usage["hedged_requests"] == usage["hedge_wins"] == 1
+
+def test_the_primary_can_still_win(tool, backends):
+    behaviour, _ = backends
+    behaviour.update(primary=(0.3, "primary"), hedge=(2, "hedge"))
+    text, usage, _ = complete(tool)
+    assert text == "primary"
+    assert (usage["hedged_requests"], usage["hedge_wins"]) == (1, 0)
+
+def test_an_early_failure_falls_back_to_the_hedge(tool, backends, monkeypatch):
+    monkeypatch.setattr(tool, "llm_hedge_after", 30)
+    behaviour, started = backends
+    behaviour.update(primary=(0.01, RuntimeError("primary down")), hedge=(0.05, "hedge"))
+    text, usage, elapsed = complete(tool)
+    assert text == "hedge" and elapsed < 1
+    assert usage["hedged_requests"] == usage["hedge_wins"] == 1
+
+def test_the_first_error_is_raised_when_both_fail(tool, backends):
+    behaviour, _ = backends
+    behaviour.update(primary=(0.01, RuntimeError("primary down")), hedge=(0.05, RuntimeError("hedge down")))
+    with pytest.raises(RuntimeError, match="primary down"):
+        complete(tool)
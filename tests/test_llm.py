@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import Counter
+
+import pytest
+
+backends = ["openai", "openai-responses"] # Chat Completions and Responses API
+
+def task(*assertions): # A prompt whose task part names the given failed assertions, after a unique start so no earlier prompt shares its prefix.
+    return f"Request {uuid.uuid4()}\n\nFailed assertion:\n\n" + "\n".join(assertions)
+
+@pytest.mark.parametrize("backend", backends)
+def test_streamed_text_arrives_in_pieces(tool, fake_llm, backend):
+    pieces = []
+    text, cancelled = tool.run_llm(tool.complete(task("SLEECRule1Rule2 :[deadlock free]:", "not Rule3_wrt_Rule1 [T= Rule1_wrt_Rule3:"), "o3-mini", backend, pieces.append))
+    assert not cancelled
+    assert len(pieces) > 1
+    assert "".join(pieces).strip() == text
+    assert "Rule Name: Rule1Rule2" in text and "Rule Name: Rule3Rule1" in text
+
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("stream", [True, False])
+def test_usage_counts_prompt_completion_and_cached_tokens(tool, fake_llm, backend, stream):
+    prompt = task("SLEECRule1Rule2 :[deadlock free]:") + "\n" + "x" * 8192
+    first, second = Counter(), Counter()
+    text, _ = tool.run_llm(tool.complete(prompt, "o3-mini", backend, [].append if stream else None, usage=first))
+    tool.run_llm(tool.complete(prompt, "o3-mini", backend, [].append if stream else None, usage=second))
+    assert first["prompt_tokens"] == second["prompt_tokens"] == len(prompt) // 4
+    assert first["completion_tokens"] == len(text) // 4
+    assert first["cached_tokens"] == 0
+    assert second["cached_tokens"] >= 4096 // 4 # The repeated prompt is served from the provider's prompt cache
+    assert tool.prompt_cache_note(second).startswith("Prompt cache: ")
+
+def test_concurrent_requests_add_up_usage(tool, fake_llm):
+    prompts = [task(f"SLEECRule{i}Rule{i + 1} :[deadlock free]:") for i in range(1, 6)]
+    usage = Counter()
+    responses = tool.run_llm(tool.request_completions(prompts, "o3-mini", usage=usage))
+    assert [f"Rule Name: Rule{i}Rule{i + 1}" in response for i, response in enumerate(responses, 1)] == [True] * 5
+    assert usage["prompt_tokens"] == sum(len(prompt) // 4 for prompt in prompts)
+    assert usage["completion_tokens"] == sum(len(response) // 4 for response in responses)
+
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("stream", [True, False])
+def test_cancel_before_the_first_token(tool, fake_llm, backend, stream):
+    fake_llm.latency = 5 # A reasoning model that has not started answering
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    started = time.perf_counter()
+    result = tool.run_llm(tool.complete(task("SLEECRule1Rule2 :[deadlock free]:"), "o3-mini", backend, [].append if stream else None, cancel))
+    assert result == ("", True)
+    assert time.perf_counter() - started < 2
+
+def test_cancel_mid_stream_keeps_the_text_so_far(tool, fake_llm):
+    fake_llm.seconds_per_token = 0.01
+    cancel, pieces = threading.Event(), []
+    def on_text(piece):
+        pieces.append(piece)
+        if len(pieces) == 2:
+            cancel.set()
+    text, cancelled = tool.run_llm(tool.complete(task("SLEECRule1Rule2 :[deadlock free]:", "not Rule3_wrt_Rule1 [T= Rule1_wrt_Rule3:"), "o3-mini", "openai", on_text, cancel))
+    assert cancelled
+    assert text and text == "".join(pieces).strip()
+    assert "Rule3Rule1" not in text # The rest of the report was never received
+
+def test_cancel_concurrent_requests(tool, fake_llm):
+    fake_llm.latency = 5
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    started = time.perf_counter()
+    with pytest.raises(asyncio.CancelledError):
+        tool.run_llm(tool.request_completions([task(f"SLEECRule{i}Rule9 :[deadlock free]:") for i in range(3)], "o3-mini", cancel))
+    assert time.perf_counter() - started < 2
+
+def test_per_assertion_report_has_a_counted_header(tool, fake_llm):
+    records = list(tool.parse_refines_output([
+        "SLEECRule1Rule2 :[deadlock free]:", "    Log:", "        Result: Failed",
+        "not Rule3_wrt_Rule1 [T= Rule1_wrt_Rule3:", "    Log:", "        Result: Failed",
+        "SLEECRule2Rule3 :[deadlock free]:", "    Log:", "        Result: Failed",
+        "SLEECRule1Rule3 :[deadlock free]:", "    Log:", "        Result: Passed",
+    ]))
+    failed = tool.failed_assertions(records)
+    usage = Counter()
+    report = tool.fan_out_analysis("", "rule_start\n  Rule1 when A then B\nrule_end", failed, "", "o3-mini", usage=usage)
+    assert report.startswith("Total Rule Issues Discovered: 3 | Conflicts: 2 | Redundancies: 1\n\n")
+    assert [section.split(":")[0] for section in report.split("\n\n", 1)[1].split("\n-----------\n")] == ["Conflicting Rule (1 of 2)", "Conflicting Rule (2 of 2)", "Redundant Rules (1 of 1)"]
+    assert usage["prompt_tokens"] > 0 and usage["completion_tokens"] > 0
+
+def test_stand_in_answers_only_the_task_not_the_worked_examples(tool, fake_llm):
+    ruleset = "rule_start\n  Rule7 when A then B\n  Rule8 when A then not B\nrule_end"
+    full = tool.build_rule_rule_prompt("", ruleset, "SLEECRule7Rule8 :[deadlock free]:\n    Log:\n        Result: Failed", "")
+    single = tool.build_single_assertion_prompt("", ruleset, "not Rule8_wrt_Rule7 [T= Rule7_wrt_Rule8:", "Redundant Rules (1 of 1)", "")
+    assert "SLEECRule2Rule4" in full and "Rule5_wrt_Rule4" in single # The instructions' worked examples
+    full_text = fake_llm.analysis_text(full)
+    assert "Conflicting Rule (1 of 1): {" in full_text and "Rule Name: Rule7Rule8" in full_text
+    assert "Rule2" not in full_text and "Rule5" not in full_text
+    single_text = fake_llm.analysis_text(single)
+    assert single_text.startswith("Redundant Rules (1 of 1): {") and "Rule Name: Rule8Rule7" in single_text
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_instructions_follow_the_compact_argument(tool, monkeypatch, compact):
+    monkeypatch.setattr(tool, "compact_traces", not compact) # The global setting must not leak into the cached instructions
+    tool.prompt_instructions.cache_clear()
+    instructions = tool.prompt_instructions("Rule-Rule Instructions", compact)
+    tool.prompt_instructions.cache_clear()
+    assert ("Counterexample traces are shown in a compacted form." in instructions) == compact
+    assert ("tock×99" in instructions) == compact
+    assert "Visited States" not in instructions and "Log:" not in instructions # The worked examples look like the assertions format_assertion renders
@@ -0,0 +1,85 @@
+model = """module Home {
+  robotic platform Robot { uses Events }
+}
+interface Events {
+  event DetectUserFallen
+  event CallSupport
+  event OpenDoor
+}
+// state Commented { entry CallSupport }
+stm Ctrl {
+  state Idle {
+    entry OpenDoor
+  }
+  state Calling {
+    entry CallSupport
+  }
+  transition t1 {
+    from Idle to Calling
+    trigger DetectUserFallen
+  }
+  transition t2 {
+    from Calling to Idle
+    trigger OpenDoor
+  }
+}
+"""
+ruleset = """def_start
+  event DetectUserFallen
+  event CallSupport
+  event OpenDoor
+  constant limit = 3
+def_end
+
+rule_start
+  Rule1 when DetectUserFallen then CallSupport within limit minutes
+  Rule2 when OpenDoor then not CallSupport
+rule_end
+"""
+
+def record(tool, name, trace="<tock>"):
+    text = f"{name}:\n    Log:\n        Result: Failed\n        Counterexample (Deadlock Counterexample)\n            Machine Debug:\n" \
+           f"                {name.split()[0]} (Failure Behaviour):\n                    Trace: {trace}\n"
+    return next(tool.parse_refines_output(text.splitlines()))
+
+def test_elements_are_nested_without_comments(tool):
+    elements = tool.rct_elements(model)
+    assert [element.path for element in elements] == [
+        "module Home", "module Home > robotic platform Robot", "interface Events", "stm Ctrl",
+        "stm Ctrl > state Idle", "stm Ctrl > state Calling", "stm Ctrl > transition t1", "stm Ctrl > transition t2",
+    ]
+    ctrl = elements[3]
+    assert "state Calling { ... }" in ctrl.text and "CallSupport" not in ctrl.text # Nested elements are left out of their parents
+
+def test_query_uses_the_rules_and_the_counterexample(tool):
+    names, query = tool.model_rule_query(ruleset, record(tool, "SLEECRule1_System :[deadlock free]", "<OpenDoor, tock, tock>"))
+    assert names == ["Rule1"]
+    assert set(query) == {"detectuserfallen", "detect", "user", "fallen", "callsupport", "call", "support", "opendoor", "open", "door"}
+    assert "limit" not in query and "tock" not in query # Constants and clock ticks are not looked up in the model
+
+def test_slice_keeps_the_elements_mentioning_the_rule(tool):
+    _, query = tool.model_rule_query(ruleset, record(tool, "SLEECRule1_System :[deadlock free]"))
+    kept = tool.model_slice(tool.model_index(model), query, 3000)
+    assert [line for line in kept.splitlines() if line.startswith("// ")] == ["// interface Events", "// stm Ctrl > state Calling", "// stm Ctrl > transition t1"]
+    assert "Commented" not in kept
+
+def test_slice_fits_the_budget(tool):
+    _, query = tool.model_rule_query(ruleset, record(tool, "SLEECRule1_System :[deadlock free]"))
+    index = tool.model_index(model)
+    full = tool.model_slice(index, query, 3000)
+    kept = tool.model_slice(index, query, 30)
+    assert tool.estimate_tokens(kept) <= 30 < tool.estimate_tokens(full)
+    assert kept.count("// ") == 1
+
+def test_analysis_slices_the_model_to_model_slice_tokens(tool, project, tmp_path, monkeypatch):
+    (tmp_path / "model.rct").write_text(model)
+    (tmp_path / "rules.sleec").write_text(ruleset)
+    (tmp_path / "verification_assertions.csp").write_text("assert SLEECRule1_System :[deadlock free]\nassert Rule3_System :[deadlock free]\n")
+    def sections(budget):
+        monkeypatch.setattr(tool, "model_slice_tokens", budget)
+        analysis = tool.prepare_model_rule_analysis(str(tmp_path / "rules.sleec"), str(tmp_path / "verification_assertions.csp"), str(tmp_path / "model.rct"), None, None, "o3-mini")
+        return analysis.sections
+    [(assertion, model_part)] = sections(3000) # Only the failed assertion gets a section
+    assert assertion.startswith("SLEECRule1_System") and model_part.count("// ") == 3
+    [(_, model_part)] = sections(30)
+    assert tool.estimate_tokens(model_part) <= 30
@@ -0,0 +1,60 @@
+import os
+import threading
+import time
+
+import pytest
+from generate_ruleset import write_project
+
+class Selector: # Stands in for a ttk.Combobox
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+def test_selection_is_kept_while_the_file_is_there(tool):
+    assert tool.selection_index(Selector("b.sleec"), ["a.sleec", "b.sleec"]) == 1
+    assert tool.selection_index(Selector("gone.sleec"), ["a.sleec", "b.sleec"]) == 0
+    assert tool.selection_index(Selector("gone.rct"), ["other.rct", "system.rct"], 1) == 1
+
+@pytest.fixture
+def watcher(tool, tmp_path, monkeypatch): # Watches tmp_path, collecting each burst of changes passed to on_change
+    monkeypatch.setattr(tool, "watch_debounce", 0.5)
+    monkeypatch.setattr(tool, "watch_poll_interval", 0.1)
+    bursts, stop = [], threading.Event()
+    thread = threading.Thread(target=tool.watch_project_folder, args=(str(tmp_path), bursts.append, stop), daemon=True)
+    thread.start()
+    time.sleep(0.3) # Let the watches be added
+    yield bursts
+    stop.set()
+    thread.join(5)
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+def test_a_burst_of_changes_is_reported_once(tmp_path, watcher):
+    started = time.monotonic()
+    for i in range(4): # Changes 0.2 s apart keep postponing the report
+        (tmp_path / "rules.sleec").write_text(f"rule_start\n  Rule{i} when A then B\nrule_end\n")
+        (tmp_path / ".rules.sleec.swp").write_text("editor state") # Hidden files are ignored
+        time.sleep(0.2)
+    (tmp_path / "notes.txt").write_text("not a project file")
+    assert wait_for(lambda: watcher)
+    assert time.monotonic() - started >= 0.8 + 0.5
+    time.sleep(0.7)
+    assert watcher == [{str(tmp_path / "rules.sleec")}]
+
+def test_regenerated_assertions_are_verified_in_the_background(tool, tmp_path, monkeypatch):
+    sleec_path, csp_path = write_project(str(tmp_path), 3)
+    verified, updates = [], []
+    monkeypatch.setattr(tool, "speculative_verify", lambda csp, sleec: verified.append((csp, sleec)))
+    monkeypatch.setattr(tool, "ui_call", lambda function, *args: updates.append(function))
+    os.utime(sleec_path, (time.time() + 10, time.time() + 10)) # Edited after the assertions were generated
+    tool.refresh_project(str(tmp_path), {os.path.abspath(sleec_path)})
+    assert updates == [tool.update_dropdowns] and verified == []
+    os.utime(csp_path, (time.time() + 20, time.time() + 20)) # SLEEC-TK regenerates the assertions
+    tool.refresh_project(str(tmp_path), {os.path.abspath(csp_path)})
+    assert verified == [(csp_path, sleec_path)]
@@ -0,0 +1,88 @@
+import itertools
+
+from refines_parser import assertion_kind, compact_events, format_assertion, parse_refines_output
+
+sample = """SLEECRule1Rule2 :[deadlock free]:
+    Log:
+        Result: Passed
+        Visited States: 1,204
+        Estimated Total Storage: 67MB
+SLEECRule2Rule4 :[deadlock free]:
+    Log:
+        Result: Failed
+        Visited States: 52,311
+        Visited Transitions: 104,622
+        Counterexample (Deadlock Counterexample)
+            Machine Debug:
+                SLEECRule2Rule4 (Failure Behaviour):
+                    Trace: <DetectUserFallen, τ, τ, emergencyLevel.E1, tock, tock,
+                    tock, tock, CallSupport>
+                    Min Acceptance: {}
+not Rule5_wrt_Rule4 [T= Rule4_wrt_Rule5:
+    Log:
+        Result: Failed
+"""
+
+def test_records_are_typed():
+    records = list(parse_refines_output(sample.splitlines(keepends=True)))
+    assert [(record.name, record.kind, record.result) for record in records] == [
+        ("SLEECRule1Rule2 :[deadlock free]", "conflict", "Passed"),
+        ("SLEECRule2Rule4 :[deadlock free]", "conflict", "Failed"),
+        ("not Rule5_wrt_Rule4 [T= Rule4_wrt_Rule5", "redundancy", "Failed"),
+    ]
+    assert records[0].statistics == {"Visited States": "1,204", "Estimated Total Storage": "67MB"}
+    counterexample = records[1].counterexamples[0]
+    assert counterexample.kind == "Deadlock Counterexample"
+    trace = counterexample.traces[0]
+    assert trace.behaviour == "SLEECRule2Rule4 (Failure Behaviour)"
+    assert trace.events == ["DetectUserFallen", "τ", "τ", "emergencyLevel.E1", "tock", "tock", "tock", "tock", "CallSupport"]
+    assert trace.details == {"Min Acceptance": "{}"}
+    assert records[1].failed and not records[0].failed
+    assert records[2].text == "not Rule5_wrt_Rule4 [T= Rule4_wrt_Rule5:\n    Log:\n        Result: Failed"
+
+def test_records_are_yielded_as_each_log_ends():
+    consumed = []
+    def lines(): # Endless output, which only a streaming parser can read
+        for number in itertools.count():
+            for line in (f"SLEECRule{number}Rule{number + 1} :[deadlock free]:", "    Log:", "        Result: Passed"):
+                consumed.append(line)
+                yield line
+    records = parse_refines_output(lines())
+    first = next(records)
+    assert first.name == "SLEECRule0Rule1 :[deadlock free]"
+    assert len(consumed) == 4 # The first log and the line that ends it
+    assert next(records).name == "SLEECRule1Rule2 :[deadlock free]"
+
+def test_assertion_kind():
+    assert assertion_kind("SLEECRule2Rule4 :[deadlock free]") == "conflict"
+    assert assertion_kind("not Rule5_wrt_Rule4 [T= Rule4_wrt_Rule5") == "redundancy"
+    assert assertion_kind("System :[divergence free]") == "other"
+
+def test_compacted_output_leaves_out_statistics():
+    record = list(parse_refines_output(sample.splitlines()))[1]
+    assert compact_events(["a", "τ", "τ", "tock", "tock", "tock", "b"]) == ["a", "τ", "tock×3", "b"]
+    assert format_assertion(record) == "\n".join([
+        "SLEECRule2Rule4 :[deadlock free]:",
+        "    Result: Failed",
+        "    Counterexample (Deadlock Counterexample)",
+        "        SLEECRule2Rule4 (Failure Behaviour):",
+        "            Trace: <DetectUserFallen, τ, emergencyLevel.E1, tock×4, CallSupport>",
+        "            Min Acceptance: {}",
+    ])
+    assert "tock, tock, tock, tock" in format_assertion(record, compact=False)
+
+def test_duplicate_counterexamples_are_listed_once():
+    counterexample = sample.split("Visited Transitions: 104,622\n")[1].split("not Rule5")[0]
+    text = sample.replace(counterexample, counterexample * 2) # refines reports the same deadlock twice
+    record = list(parse_refines_output(text.splitlines()))[1]
+    assert len(record.counterexamples) == 2
+    assert format_assertion(record).count("Counterexample (Deadlock Counterexample)") == 1
+    assert format_assertion(record, compact=False).count("Counterexample (Deadlock Counterexample)") == 2
+
+def test_compaction_savings(tool):
+    records = list(parse_refines_output(sample.replace("tock, tock,\n                    tock, tock", ", ".join(["tock"] * 400)).splitlines()))
+    saved, full = tool.trace_compaction_savings(records)
+    assert full == tool.estimate_tokens(tool.format_failed_assertions(records, compact=False))
+    assert saved == full - tool.estimate_tokens(tool.format_failed_assertions(records, compact=True))
+    assert saved / full > 0.8 # 400 ticks become tock×400
+    assert tool.trace_compaction_savings(records[:1]) == (0, tool.estimate_tokens("All assertions passed."))
@@ -0,0 +1,77 @@
+import fake_openai
+import pytest
+
+spacer = "\n-----------\n"
+
+@pytest.fixture
+def analysis(tool, project, monkeypatch): # A prepared analysis and the complete report the stand-in LLM writes for it
+    monkeypatch.setattr(tool, "analysis_index", False)
+    analysis = tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", False)
+    return analysis, tool.analyse_rule_rule(analysis, bypass_cache=True)
+
+def split(report):
+    header, body = report.split("\n\n", 1)
+    return header, body.split(spacer)
+
+def join(header, sections):
+    return header + "\n\n" + spacer.join(sections)
+
+def validate(tool, analysis, report):
+    return tool.validate_report(analysis, report, tool.failed_assertions(analysis.records))
+
+def findings(**counts):
+    return {"missing": 0, "malformed": 0, "extra": 0, "header_wrong": 0, "regenerated": 0, **counts}
+
+def test_complete_reports_are_left_alone(tool, analysis):
+    analysis, report = analysis
+    assert validate(tool, analysis, report) == (report, findings())
+
+def test_skipped_assertions_are_requested_again(tool, analysis):
+    analysis, report = analysis
+    header, sections = split(report)
+    requests = fake_openai.requests["completions"]
+    repaired, found = validate(tool, analysis, join(header, sections[:1] + sections[2:]))
+    assert found == findings(missing=1, regenerated=1)
+    assert fake_openai.requests["completions"] == requests + 1 # Only the skipped assertion was asked about
+    assert repaired == report
+
+@pytest.mark.parametrize("damage", ["truncated", "no scenario"])
+def test_malformed_sections_are_requested_again(tool, analysis, damage):
+    analysis, report = analysis
+    header, sections = split(report)
+    if damage == "truncated":
+        sections[-1] = sections[-1][:len(sections[-1]) // 2]
+    else:
+        sections[0] = "\n".join(line for line in sections[0].splitlines() if "Scenario:" not in line)
+    repaired, found = validate(tool, analysis, join(header, sections))
+    assert found == findings(malformed=1, regenerated=1)
+    assert repaired == report
+
+def test_repairs_are_limited_to_report_repair_attempts(tool, analysis, monkeypatch):
+    analysis, report = analysis
+    header, sections = split(report)
+    calls = []
+    async def broken(prompts, *args, **kwargs): # Every repair comes back cut off
+        calls.append(len(prompts))
+        return ["Conflicting Rule (1 of 1): {\n\tError: {"] * len(prompts)
+    monkeypatch.setattr(tool, "request_completions", broken)
+    monkeypatch.setattr(tool, "report_repair_attempts", 2)
+    repaired, found = validate(tool, analysis, join(header, sections[1:]))
+    assert calls == [1, 1] and found == findings(missing=1, regenerated=2)
+    assert split(repaired)[1][0].startswith("Conflicting Rule (1 of") # The cut off answer is kept rather than leaving the assertion out
+    calls.clear()
+    monkeypatch.setattr(tool, "report_repair_attempts", 0)
+    repaired, found = validate(tool, analysis, join(header, sections[1:]))
+    assert calls == [] and found == findings(missing=1)
+    assert "No analysis could be generated for this assertion." in split(repaired)[1][0]
+    assert split(repaired)[1][1:] == sections[1:]
+
+def test_renumbered_and_extra_sections_are_fixed_without_requests(tool, analysis):
+    analysis, report = analysis
+    header, sections = split(report)
+    extra = sections[0].replace("Rule1", "Rule98").replace("Rule2", "Rule99") # Not an assertion of this ruleset
+    requests = fake_openai.requests["completions"]
+    repaired, found = validate(tool, analysis, join(header.replace("Total Rule Issues Discovered: ", "Total Rule Issues Discovered: 1"), [sections[1], sections[0], extra] + sections[2:]))
+    assert found == findings(extra=1, header_wrong=1)
+    assert fake_openai.requests["completions"] == requests
+    assert repaired == report
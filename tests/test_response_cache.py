@@ -0,0 +1,50 @@
+import fake_openai
+import pytest
+
+@pytest.fixture
+def clock(tool, tmp_path, monkeypatch): # A settable time.time for the cache, starting at 1000
+    monkeypatch.setattr(tool, "cache_dir", str(tmp_path / "cache"))
+    now = [1000.0]
+    monkeypatch.setattr(tool.time, "time", lambda: now[0])
+    return now
+
+def test_reports_expire_after_the_ttl(tool, clock, monkeypatch):
+    monkeypatch.setattr(tool, "response_cache_ttl", 60)
+    tool.store_response("key", "o3-mini", "report")
+    clock[0] += 59
+    assert tool.cached_response("key") == "report"
+    clock[0] += 2 # Reading an entry does not extend its lifetime
+    assert tool.cached_response("key") is None
+
+def test_least_recently_used_reports_are_evicted(tool, clock, monkeypatch):
+    monkeypatch.setattr(tool, "response_cache_max_entries", 2)
+    for key in ("a", "b"):
+        tool.store_response(key, "o3-mini", "report " + key)
+        clock[0] += 1
+    assert tool.cached_response("a") == "report a"
+    clock[0] += 1
+    tool.store_response("c", "o3-mini", "report c")
+    assert [tool.cached_response(key) for key in ("a", "b", "c")] == ["report a", None, "report c"]
+
+def test_key_ignores_comments_and_whitespace(tool):
+    key = tool.response_cache_key("o3-mini", "full", "rule_start\n  Rule1 when A then B\nrule_end", "SLEECRule1Rule2: Failed", ["spec"])
+    assert key == tool.response_cache_key("o3-mini", "full", "rule_start // rules\nRule1  when A then B\n\nrule_end", "SLEECRule1Rule2:  Failed", ["spec "])
+    assert key != tool.response_cache_key("o3-mini", "full", "rule_start\n  Rule1 when A then C\nrule_end", "SLEECRule1Rule2: Failed", ["spec"])
+    assert key != tool.response_cache_key("o1", "full", "rule_start\n  Rule1 when A then B\nrule_end", "SLEECRule1Rule2: Failed", ["spec"])
+    assert key != tool.response_cache_key("o3-mini", "per-assertion", "rule_start\n  Rule1 when A then B\nrule_end", "SLEECRule1Rule2: Failed", ["spec"])
+
+def analyse(tool, project, bypass_cache=False):
+    analysis = tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", False)
+    return tool.analyse_rule_rule(analysis, bypass_cache=bypass_cache), analysis
+
+def test_unchanged_analyses_are_answered_from_the_cache(tool, project, monkeypatch):
+    monkeypatch.setattr(tool, "analysis_index", False)
+    requests = fake_openai.requests["completions"]
+    first, _ = analyse(tool, project)
+    assert fake_openai.requests["completions"] == requests + 1
+    second, analysis = analyse(tool, project)
+    assert second == first and fake_openai.requests["completions"] == requests + 1
+    assert "Report loaded from the response cache." in analysis.notes
+    _, analysis = analyse(tool, project, bypass_cache=True)
+    assert fake_openai.requests["completions"] == requests + 2
+    assert "Report loaded from the response cache." not in analysis.notes
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+@pytest.mark.parametrize("fan_out", [False, True])
+def test_report_from_the_stand_in_needs_no_repair(tool, project, fan_out):
+    analysis = tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", fan_out)
+    failed = tool.failed_assertions(analysis.records)
+    assert failed
+    report = tool.analyse_rule_rule(analysis, bypass_cache=True)
+    validation = next(stage for stage in analysis.trace.stages if stage["stage"] == "report_validation")
+    assert [validation[finding] for finding in ("missing", "malformed", "extra", "header_wrong", "regenerated")] == [0, 0, 0, 0, 0]
+    assert not any(note.startswith("Report checked:") for note in analysis.notes)
+    assert report.startswith(f"Total Rule Issues Discovered: {len(failed)} |")
+
+def test_suggested_fixes_that_re_check_nothing_are_not_verified(tool, project, monkeypatch):
+    monkeypatch.setattr(tool, "sleec_generator_command", None)
+    analysis = tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", False)
+    report = tool.analyse_rule_rule(analysis, bypass_cache=True)
+    annotated, checks = tool.verify_suggested_fixes(analysis, report)
+    modify = [check for check in checks if check.suggestion.startswith("MODIFY")]
+    remove = [check for check in checks if check.suggestion.startswith("REMOVE")]
+    assert modify and remove
+    assert {check.status for check in checks} == {"not checked"}
+    assert all(check.reason == tool.no_generator_reason for check in modify)
+    assert all(check.reason == "no assertions were re-checked, as the suggestion only removes rules" for check in remove)
+    assert "Verified" not in annotated
+    assert annotated.endswith(f"Fix Check: {len(modify)} suggested fixes that add or modify rules were not checked, as sleec_generator_command is not set.")
+
+generator = """import itertools, os, re, sys
+sleec, output = sys.argv[1:]
+with open(sleec) as f:
+    rules = re.findall(r"^\\s*(\\w+)\\s+when\\b", f.read(), re.M)
+name = os.path.splitext(os.path.basename(sleec))[0]
+with open(os.path.join(output, name + "-assertions.csp"), "w") as f:
+    f.write('include "' + name + '.csp"\\n\\n' + "".join(f"assert SLEEC{a}{b} :[deadlock free]\\n" for a, b in itertools.combinations(rules, 2)))
+"""
+
+def test_suggested_fixes_are_verified_with_a_generator(tool, project, tmp_path, monkeypatch):
+    (tmp_path / "generator.py").write_text(generator) # Stands in for SLEEC-TK, generating a conflict check for every pair of rules
+    monkeypatch.setattr(tool, "sleec_generator_command", [sys.executable, str(tmp_path / "generator.py"), "{sleec}", "{output}"])
+    analysis = tool.prepare_rule_rule_analysis(*project, None, None, "o3-mini", False)
+    report = tool.analyse_rule_rule(analysis, bypass_cache=True)
+    monkeypatch.setattr(tool.StandInSession, "failures", None) # Every fix resolves its conflict
+    annotated, checks = tool.verify_suggested_fixes(analysis, report)
+    modify = [check for check in checks if check.suggestion.startswith("MODIFY")]
+    assert modify and all(check.status == "verified" and check.checked > 0 for check in modify)
+    assert "Fix Check: Verified: resolves" in annotated and "sleec_generator_command is not set" not in annotated
+
+def test_verify_fixes_needs_a_generator(tool, project, monkeypatch, capsys):
+    monkeypatch.setattr(tool, "sleec_generator_command", None)
+    with pytest.raises(SystemExit):
+        tool.run_headless([os.path.dirname(project[0]), "--verify-fixes"])
+    assert "--verify-fixes needs sleec_generator_command" in capsys.readouterr().err
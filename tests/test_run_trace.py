@@ -0,0 +1,60 @@
+import pstats
+import sys
+import threading
+import tracemalloc
+
+def test_stage_memory_without_profiling_is_labelled_as_the_process_peak(tool):
+    trace = tool.RunTrace()
+    with trace.stage("allocate"):
+        data = bytearray(64 * 1024 * 1024)
+        data[::4096] = b"x" * len(data[::4096])
+    stage = trace.stages[0]
+    assert stage["peak_memory_mb"] is None
+    assert stage["process_peak_growth_mb"] >= 0
+    assert stage["process_peak_memory_mb"] >= stage["process_peak_growth_mb"]
+    assert "(process " in tool.stage_memory(stage)
+    assert tool.stage_size(stage) == ""
+
+def test_stage_memory_when_profiling_is_the_stage_peak(tool):
+    trace = tool.RunTrace()
+    tracemalloc.start()
+    try:
+        with trace.stage("allocate"):
+            data = bytearray(16 * 1024 * 1024)
+        del data
+        with trace.stage("idle"):
+            pass
+    finally:
+        tracemalloc.stop()
+    allocate, idle = trace.stages
+    assert allocate["peak_memory_mb"] >= 16
+    assert idle["peak_memory_mb"] < 1 # Not the peak of the earlier stage
+    assert tool.stage_memory(allocate) == f"{allocate['peak_memory_mb']} MB"
+
+def in_worker_thread(): # Functions to find in the profile, one per thread they run on
+    sum(range(1000))
+
+def in_llm_loop():
+    sum(range(1000))
+
+def in_session_worker():
+    sum(range(1000))
+
+def test_profile_covers_the_threads_of_the_run(tool, tmp_path, monkeypatch):
+    monkeypatch.setattr(tool, "profile_dir", str(tmp_path))
+    async def on_loop():
+        in_llm_loop()
+    def run():
+        worker = threading.Thread(target=in_worker_thread)
+        worker.start()
+        worker.join()
+        tool.run_llm(on_loop())
+        session = threading.Thread(target=in_session_worker, name="verification-session_0") # Outlives the run, so it is left alone
+        session.start()
+        session.join()
+    profile_path, report_path = tool.profile_run(run)
+    profiled = {name for _, _, name in pstats.Stats(profile_path).stats}
+    assert {"run", "in_worker_thread", "in_llm_loop"} <= profiled
+    if sys.version_info < (3, 12): # Later versions profile every thread
+        assert "in_session_worker" not in profiled
+    assert "Top memory allocations:" in open(report_path, encoding="utf-8").read()
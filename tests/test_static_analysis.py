@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+ruleset = """def_start
+  event Event1
+  event Event2
+  event Event3
+  event Event4
+  measure level:numeric
+def_end
+
+rule_start
+  Rule1 when Event1 then Event2 within 5 seconds
+  Rule2 when Event1 then not Event2 within 10 seconds
+  Rule3 when Event1 and level > 5 then Event2 within 5 seconds
+  Rule4 when Event1 and level < 3 then not Event2 within 10 seconds
+  Rule5 when Event3 then Event4
+rule_end
+"""
+assertions = ["SLEECRule1Rule2 :[deadlock free]", "SLEECRule3Rule4 :[deadlock free]", "SLEECRule1Rule5 :[deadlock free]"]
+
+@pytest.fixture
+def project(tool, fake_refines, tmp_path, monkeypatch):
+    monkeypatch.setattr(tool, "cache_dir", str(tmp_path / "cache"))
+    (tmp_path / "src-gen").mkdir()
+    paths = {"sleec": tmp_path / "demo.sleec", "assertions": tmp_path / "src-gen" / "demo-assertions.csp"}
+    paths["sleec"].write_text(ruleset)
+    paths["assertions"].write_text('include "demo.csp"\n\n' + "".join(f"assert {name}\n" for name in assertions))
+    stat = os.stat(paths["sleec"])
+    os.utime(paths["assertions"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    return paths
+
+def verdict(tool, kind, first, second):
+    rules = tool.parse_sleec_rules(ruleset)
+    return tool.static_verdict(kind, rules[first], rules[second])
+
+def test_obvious_conflicts_are_spotted(tool):
+    result, reason = verdict(tool, "conflict", "Rule1", "Rule2")
+    assert result == "Failed" and "Rule1 requires Event2 within 5 seconds but Rule2 forbids it" in reason
+
+def test_rules_with_different_conditions_are_left_to_refines(tool):
+    assert verdict(tool, "conflict", "Rule3", "Rule4") is None # level > 5 and level < 3 never hold together
+
+def test_rules_sharing_no_events_are_left_to_refines(tool):
+    assert verdict(tool, "conflict", "Rule1", "Rule5") is None # They still synchronise on tock
+
+def verify(tool, project):
+    return tool.verify_assertions(str(project["assertions"]), str(project["sleec"]))
+
+def test_refines_checks_every_assertion(tool, project, fake_refines, monkeypatch):
+    monkeypatch.setenv("SLEEC_BENCH_FAIL_RATE", "1")
+    records = verify(tool, project)
+    assert sum(int(count) for count in fake_refines.read_text().split()) == len(assertions)
+    assert [(record.result, record.checked_by) for record in records] == [("Failed", "refines")] * 3
+    assert "Static Analysis" in records[0].statistics and "Static Analysis" not in records[2].statistics
+    assert "Static Analysis: After Event1, Rule1 requires" in tool.format_assertion(records[0])
+
+def test_hints_do_not_override_refines(tool, project, monkeypatch):
+    monkeypatch.setenv("SLEEC_BENCH_FAIL_RATE", "0")
+    records = verify(tool, project)
+    assert [record.result for record in records] == ["Passed"] * 3
+    assert not any("Static Analysis" in record.statistics for record in records)
+    assert tool.format_failed_assertions(records) == "All assertions passed."
+
+def test_hints_are_added_to_replayed_results(tool, project, fake_refines, monkeypatch):
+    monkeypatch.setenv("SLEEC_BENCH_FAIL_RATE", "1")
+    verify(tool, project)
+    runs = fake_refines.read_text()
+    records = verify(tool, project)
+    assert fake_refines.read_text() == runs
+    assert "Static Analysis" in records[0].statistics
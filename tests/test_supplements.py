@@ -0,0 +1,43 @@
+import pytest
+
+@pytest.fixture
+def chunk_tokens(tool, monkeypatch):
+    monkeypatch.setattr(tool, "supplement_chunk_tokens", 20)
+    tool.supplement_chunks.cache_clear()
+    yield 20
+    tool.supplement_chunks.cache_clear()
+
+def section(topic, lines=6): # Around 20 tokens per line, so each section fills a few chunks
+    return "".join(f"The robot handles {topic} in step {i} of the procedure here.\n" for i in range(lines))
+
+def test_search_terms_split_identifiers(tool):
+    assert tool.search_terms("CallSupport when emergencyLevel") == ["callsupport", "call", "support", "when", "emergencylevel", "emergency", "level"]
+
+def test_bm25_ranks_matching_chunks_first(tool):
+    counts = [tool.Counter(tool.search_terms(text)) for text in ["battery battery charge", "door opens", "battery low"]]
+    scores = tool.bm25_scores(counts, ["battery", "charge"])
+    assert scores[1] == 0 and scores[0] > scores[2] > 0
+    assert tool.bm25_scores([], ["battery"]) == []
+
+def test_supplements_within_budget_are_untouched(tool, chunk_tokens):
+    documents = [section("charging"), section("falls")]
+    assert tool.fit_supplements_to_budget(documents, ["falls"], 10 ** 6) == (documents, False)
+
+def test_most_relevant_chunks_fit_the_budget(tool, chunk_tokens):
+    documents = [section("charging") + section("falls") + section("doors"), section("lighting") + section("falls")]
+    budget = 150
+    trimmed, was_trimmed = tool.fit_supplements_to_budget(documents, tool.search_terms("DetectFalls falls"), budget)
+    assert was_trimmed
+    kept = "".join(trimmed).replace("\n[...]\n", "")
+    assert tool.estimate_tokens(kept) <= budget
+    assert {line.split()[3] for line in kept.splitlines()} == {"falls"}
+    assert len(kept.splitlines()) == 10 # Five of the six two-line chunks about falls
+    assert trimmed[0].startswith("\n[...]\n") and trimmed[0].endswith("\n[...]\n") # Left-out sections are marked once each
+    assert trimmed[0].index("step 0 of the procedure") < trimmed[0].index("step 5 of the procedure") # Original order kept
+
+def test_budget_follows_the_model_the_backend_uses(tool, monkeypatch):
+    monkeypatch.setattr(tool, "llm_backends", {"openai": {}, "mini": {"model": "o1-mini"}, "small": {"token_budget": 500}})
+    assert tool.token_budget("openai", "o3-mini") == tool.model_token_budgets["o3-mini"]
+    assert tool.token_budget("mini", "o3-mini") == tool.model_token_budgets["o1-mini"]
+    assert tool.token_budget("small", "o3-mini") == 500
+    assert tool.token_budget("openai", "unknown-model") == tool.default_token_budget
@@ -0,0 +1,55 @@
+import os
+from collections import Counter
+
+import pytest
+
+@pytest.fixture
+def stand_in(tool, monkeypatch): # Stand-in FDR sessions that load instantly and fail the conflict checks.
+    monkeypatch.setattr(tool.StandInSession, "load_seconds", 0)
+    monkeypatch.setattr(tool.StandInSession, "check_seconds", 0)
+    monkeypatch.setattr(tool.StandInSession, "failures", r"^SLEEC")
+    monkeypatch.setattr(tool.StandInSession, "loads", Counter())
+    pool = tool.VerificationSessionPool(tool.StandInSession, 2, "stand-in")
+    yield pool
+    pool.close()
+    pool.executor.shutdown()
+
+def write_assertions(path, *assertions):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("include \"rules.csp\"\n\n" + "".join(f"assert {assertion}\n" for assertion in assertions))
+
+def check_all(tool, pool, path):
+    return [pool.submit(str(path), assertion).result() for assertion in tool.split_assertions_file(str(path))[1]]
+
+def test_stand_in_fails_only_assertions_matching_failures(tool, stand_in, tmp_path):
+    path = tmp_path / "rules-assertions.csp"
+    write_assertions(path, "SLEECRule1Rule2 :[deadlock free]", "not Rule2_wrt_Rule1 [T= Rule1_wrt_Rule2")
+    conflict, redundancy = check_all(tool, stand_in, path)
+    assert (conflict.name, conflict.result, conflict.checked_by) == ("SLEECRule1Rule2 :[deadlock free]", "Failed", "stand-in")
+    assert conflict.counterexamples and conflict.counterexamples[0].traces[0].events == ["tock"]
+    assert redundancy.result == "Passed"
+
+def test_pool_reuses_the_session_of_an_unchanged_file(tool, stand_in, tmp_path):
+    path = tmp_path / "rules-assertions.csp"
+    write_assertions(path, "SLEECRule1Rule2 :[deadlock free]", "SLEECRule1Rule3 :[deadlock free]", "SLEECRule2Rule3 :[deadlock free]")
+    for _ in range(3):
+        check_all(tool, stand_in, path)
+    assert tool.StandInSession.loads[str(path)] == 1
+
+def test_pool_reloads_a_file_after_it_changes(tool, stand_in, tmp_path):
+    path = tmp_path / "rules-assertions.csp"
+    write_assertions(path, "SLEECRule1Rule2 :[deadlock free]")
+    check_all(tool, stand_in, path)
+    write_assertions(path, "SLEECRule1Rule2 :[deadlock free]", "SLEECRule1Rule4 :[deadlock free]")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000)) # A new modification time even on coarse-grained file systems
+    records = check_all(tool, stand_in, path)
+    assert [record.result for record in records] == ["Failed", "Failed"] # The new assertion is found in the reloaded file
+    assert tool.StandInSession.loads[str(path)] == 2
+    assert sum(len(sessions) for sessions in stand_in.idle.values()) == 1 # The session of the old file was closed
+
+def test_pool_reports_an_assertion_missing_from_the_loaded_file(tool, stand_in, tmp_path):
+    path = tmp_path / "rules-assertions.csp"
+    write_assertions(path, "SLEECRule1Rule2 :[deadlock free]")
+    record = stand_in.submit(str(path), "assert SLEECRule7Rule8 :[deadlock free]").result()
+    assert record.result == "Error (assertion not found in the loaded script)"
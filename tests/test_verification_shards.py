@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+def write_assertions(tool, path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("include \"rules.csp\"\n\n" + "".join(f"assert SLEECRule{i}Rule{i + 1} :[deadlock free]\n" for i in range(count)))
+    return tool.split_assertions_file(str(path))
+
+def refines_runs(log):
+    return sorted(int(line) for line in log.read_text().split()) if log.exists() else []
+
+@pytest.fixture
+def workers(tool, monkeypatch):
+    def set_workers(count):
+        monkeypatch.setattr(tool, "refines_workers", count)
+        monkeypatch.setattr(tool, "refines_slots", threading.BoundedSemaphore(count))
+    return set_workers
+
+@pytest.mark.parametrize("count, shard_size, runs", [(3, None, [2, 4, 4]), (3, 4, [2, 4, 4]), (3, 2, [2, 2, 2, 2, 2]), (1, None, [10]), (1, 2, [10])])
+def test_shards_are_merged_in_assertion_order(tool, fake_refines, workers, tmp_path, monkeypatch, count, shard_size, runs):
+    workers(count)
+    monkeypatch.setattr(tool, "refines_shard_size", shard_size)
+    path = tmp_path / "rules-assertions.csp"
+    preamble, assertions = write_assertions(tool, path, 10)
+    records = tool.check_assertions(str(path), preamble, assertions)
+    assert [record.name for record in records] == [tool.assertion_name(assertion) for assertion in assertions]
+    assert all(record.result in ("Passed", "Failed") for record in records)
+    assert refines_runs(fake_refines) == runs
+
+def test_no_sharding_without_parallel_verification(tool, fake_refines, workers, tmp_path, monkeypatch):
+    workers(4)
+    monkeypatch.setattr(tool, "refines_parallel", False)
+    path = tmp_path / "rules-assertions.csp"
+    tool.check_assertions(str(path), *write_assertions(tool, path, 10))
+    assert refines_runs(fake_refines) == [10]
+
+def test_a_failed_shard_does_not_affect_the_others(tool, fake_refines, workers, tmp_path, monkeypatch):
+    workers(2)
+    monkeypatch.setenv("SLEEC_BENCH_CRASH", r"^SLEECRule7Rule8\b")
+    path = tmp_path / "rules-assertions.csp"
+    records = tool.check_assertions(str(path), *write_assertions(tool, path, 10))
+    assert all(not record.result.startswith("Error") for record in records[:5]) # The other shard
+    assert all(not record.result.startswith("Error") for record in records[5:6])
+    assert [record.result for record in records[6:]] == ["Error (Error running refines: stand-in crash on SLEECRule7Rule8 :[deadlock free])"] * 4 # Rule6Rule7 may have been cut off
+    assert [record.name for record in records] == [f"SLEECRule{i}Rule{i + 1} :[deadlock free]" for i in range(10)]
+
+def test_a_shard_that_times_out_does_not_hold_up_the_others(tool, fake_refines, workers, tmp_path, monkeypatch):
+    workers(2)
+    monkeypatch.setattr(tool, "refines_shard_timeout", 1)
+    monkeypatch.setenv("SLEEC_BENCH_HANG", r"^SLEECRule2Rule3\b")
+    path = tmp_path / "rules-assertions.csp"
+    started = time.perf_counter()
+    records = tool.check_assertions(str(path), *write_assertions(tool, path, 10))
+    assert time.perf_counter() - started < 10
+    assert not records[0].result.startswith("Error") # Reported in full before refines hung
+    assert {record.result for record in records[2:5]} == {"Error (refines timed out after 1 seconds)"}
+    assert all(not record.result.startswith("Error") for record in records[5:])
@@ -0,0 +1,101 @@
+import os
+import random
+
+import pytest
+
+ruleset = """def_start
+  event Event1
+  event Event2
+  event Event3
+  measure hurry:boolean
+def_end
+
+rule_start
+  Rule1 when Event1 then Event2 within 5 seconds
+  Rule2 when Event2 then Event3
+  Rule3 when Event1 then not Event3 within 2 seconds unless hurry
+rule_end
+"""
+script = """channel Event1, Event2, Event3
+Rule1 = Event1 -> Event2 -> SKIP
+Rule2 = Event2 -> Event3 -> SKIP
+Rule3 = Event1 -> STOP
+SLEECRule1Rule2 = Rule1 ||| Rule2
+SLEECRule1Rule3 = Rule1 ||| Rule3
+SLEECRule2Rule3 = Rule2 ||| Rule3
+Rule3_wrt_Rule1 = Rule3 \\ {Event3}
+Rule1_wrt_Rule3 = Rule1 \\ {Event2}
+"""
+assertions = ["SLEECRule1Rule2 :[deadlock free]", "SLEECRule1Rule3 :[deadlock free]", "SLEECRule2Rule3 :[deadlock free]", "not Rule3_wrt_Rule1 [T= Rule1_wrt_Rule3"]
+
+@pytest.fixture
+def project(tool, fake_refines, tmp_path, monkeypatch): # A SLEEC-TK style project: NAME.sleec, src-gen/NAME.csp and src-gen/NAME-assertions.csp including it.
+    monkeypatch.setattr(tool, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(tool, "static_pre_analysis", False)
+    monkeypatch.setattr(tool, "refines_parallel", False)
+    (tmp_path / "src-gen").mkdir()
+    paths = {"sleec": tmp_path / "demo.sleec", "script": tmp_path / "src-gen" / "demo.csp", "assertions": tmp_path / "src-gen" / "demo-assertions.csp"}
+    paths["sleec"].write_text(ruleset)
+    paths["script"].write_text(script)
+    write_assertions(paths["assertions"], assertions)
+    return paths
+
+def write_assertions(path, names):
+    path.write_text('include "demo.csp"\n\n' + "".join(f"assert {name}\n" for name in names))
+
+def regenerate(paths, **texts): # Rewrites files of the project, with the assertions file (re)generated last, as SLEEC-TK does.
+    for name, text in texts.items():
+        paths[name].write_text(text)
+    stat = os.stat(paths["sleec"])
+    os.utime(paths["assertions"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def keys(tool, paths):
+    preamble, statements = tool.split_assertions_file(str(paths["assertions"]))
+    return dict(zip((tool.assertion_name(statement) for statement in statements), tool.verification_keys(str(paths["assertions"]), str(paths["sleec"]), preamble, statements)))
+
+def changed(before, after):
+    return sorted(name for name in before if before[name] != after[name])
+
+def test_keys_are_stable(tool, project):
+    first = keys(tool, project)
+    assert None not in first.values() and len(set(first.values())) == len(assertions)
+    shuffled = list(assertions)
+    random.Random(1).shuffle(shuffled)
+    write_assertions(project["assertions"], shuffled)
+    regenerate(project)
+    assert keys(tool, project) == first
+
+def test_editing_a_rule_changes_only_its_assertions(tool, project):
+    before = keys(tool, project)
+    regenerate(project, sleec=ruleset.replace("within 2 seconds unless hurry", "within 3 seconds unless hurry"))
+    assert changed(before, keys(tool, project)) == [assertions[1], assertions[2], assertions[3]]
+
+def test_keys_are_not_reused_before_the_assertions_are_regenerated(tool, project):
+    project["sleec"].write_text(ruleset.replace("within 2 seconds", "within 3 seconds"))
+    stat = os.stat(project["assertions"])
+    os.utime(project["sleec"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert set(keys(tool, project).values()) == {None}
+
+def test_regenerated_script_changes_the_affected_keys(tool, project):
+    before = keys(tool, project)
+    regenerate(project, script=script.replace("Rule2 = Event2 -> Event3 -> SKIP", "Rule2 = Event2 -> SKIP"))
+    assert changed(before, keys(tool, project)) == [assertions[0], assertions[2]]
+    before = keys(tool, project)
+    regenerate(project, script=script.replace("channel Event1, Event2, Event3", "channel Event1, Event2, Event3, Event4")) # Shared by every assertion
+    assert changed(before, keys(tool, project)) == sorted(assertions)
+
+def test_upgrading_refines_changes_every_key(tool, project, tmp_path):
+    before = keys(tool, project)
+    launcher = tmp_path / "bin" / "refines"
+    launcher.write_text(launcher.read_text() + "# upgraded\n")
+    assert changed(before, keys(tool, project)) == sorted(assertions)
+
+def test_unchanged_assertions_are_replayed(tool, project, fake_refines):
+    first = tool.verify_assertions(str(project["assertions"]), str(project["sleec"]))
+    second = tool.verify_assertions(str(project["assertions"]), str(project["sleec"]))
+    assert [record.text for record in second] == [record.text for record in first]
+    assert fake_refines.read_text().split() == ["4"] # The second run was replayed from the store
+    regenerate(project, sleec=ruleset.replace("within 2 seconds unless hurry", "within 3 seconds unless hurry"))
+    third = tool.verify_assertions(str(project["assertions"]), str(project["sleec"]))
+    assert [record.name for record in third] == assertions
+    assert fake_refines.read_text().split() == ["4", "3"] # Only the assertions involving Rule3